@@ -1,44 +1,71 @@
-import os
 from dash import Dash
 import dash_bootstrap_components as dbc
-from flask import session
-from datetime import datetime
 
-from config import create_session_dir
 from layouts import create_main_layout
 from popovers import create_popovers
 from scripts.callbacks_analysis import register_callbacks_analysis
 from scripts.callbacks_upload import register_callbacks_upload
+from scripts.routes import register_routes
+from scripts.session_store import SQLiteSessionInterface, stable_secret_key
+from scripts.utils import session_directory
 from cleanup_sessions import start_cleanup_thread
+from scripts.export_service import export_service
 
-# Initialize the Dash app with Bootstrap theme
-app = Dash(__name__, 
-           external_stylesheets=[dbc.themes.BOOTSTRAP, 'https://use.fontawesome.com/releases/v5.8.1/css/all.css'])
-app._favicon = "./assets/favicon.ico"
-app.title = "KdSAXS"
 
-# Configure server
-server = app.server
-server.secret_key = os.urandom(24)  # For session management
+def start_services():
+    """
+    Start the background threads of a worker. Under gunicorn this runs after
+    the fork (see gunicorn.conf.py), since threads do not survive it.
+    """
+    # Session garbage collection, coordinated across workers
+    start_cleanup_thread()
 
-# Run cleanup when server starts
-start_cleanup_thread()
+    # Keep the PDF renderer warm for exports
+    export_service.start()
 
-# Create session directory middleware
-@server.before_request
-def before_request():
-    if 'session_dir' not in session:
-        session['session_dir'] = create_session_dir()
 
-# Set the app layout
-app.layout = create_main_layout()
-app.layout.children.extend(create_popovers())
+def create_app(settings=None, start=True):
+    """
+    Build the Dash app
+    Args:
+        settings: Flask settings overriding those of the file named by the
+            KDSAXS_SETTINGS environment variable
+        start: start the background services in this process
+    Returns:
+        Dash app; its Flask server is app.server
+    """
+    # Initialize the Dash app with Bootstrap theme
+    app = Dash(__name__, 
+               external_stylesheets=[dbc.themes.BOOTSTRAP, 'https://use.fontawesome.com/releases/v5.8.1/css/all.css'])
+    app._favicon = "./assets/favicon.ico"
+    app.title = "KdSAXS"
+
+    # Configure server
+    server = app.server
+    server.config.from_envvar("KDSAXS_SETTINGS", silent=True)
+    server.config.update(settings or {})
+    # The same secret and session store in every worker, so any worker can
+    # serve any session
+    server.secret_key = server.config.get("SECRET_KEY") or stable_secret_key()
+    server.session_interface = SQLiteSessionInterface()
+
+    if start:
+        start_services()
+
+    # Session directories are created lazily by the first analysis of a session
+    # Set the app layout
+    app.layout = create_main_layout()
+    app.layout.children.extend(create_popovers())
+
+    # Register callbacks with session directory
+    register_callbacks_analysis(app, lambda: session_directory(create=False))
+    register_callbacks_upload(app)
+    register_routes(server)
+    return app
 
-# Register callbacks with session directory
-register_callbacks_analysis(app, lambda: session.get('session_dir'))
-register_callbacks_upload(app)
 
 # Run the app
 if __name__ == '__main__':
+    app = create_app()
     app.run_server(debug=True)
     #app.run_server(host='0.0.0.0', debug=False, port=8050)
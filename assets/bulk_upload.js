@@ -0,0 +1,63 @@
+// Drop zones that post many files to the server at once (class "bulk-drop").
+// Files go to the route in data-url; the JSON reply is written to the
+// dcc.Store named in data-store, so the files never pass through Dash
+// callbacks as base64.
+(function () {
+    function dropZone(target) {
+        return target && target.closest ? target.closest('.bulk-drop') : null;
+    }
+
+    function upload(zone, files) {
+        if (!files || !files.length) {
+            return;
+        }
+        var form = new FormData();
+        for (var i = 0; i < files.length; i++) {
+            form.append('files', files[i], files[i].name);
+        }
+        var label = zone.querySelector('.bulk-drop-label');
+        var text = label ? label.textContent : null;
+        if (label) {
+            label.textContent = 'Uploading ' + files.length + ' files...';
+        }
+        function done(result) {
+            if (label) {
+                label.textContent = text;
+            }
+            window.dash_clientside.set_props(zone.dataset.store, {data: result});
+        }
+        fetch(zone.dataset.url, {method: 'POST', body: form, credentials: 'same-origin'})
+            .then(function (response) {
+                return response.json();
+            })
+            .then(done)
+            .catch(function () {
+                done({files: [], errors: ['The upload failed; the files may be too large.']});
+            });
+    }
+
+    document.addEventListener('dragover', function (event) {
+        if (dropZone(event.target)) {
+            event.preventDefault();
+        }
+    });
+    document.addEventListener('drop', function (event) {
+        var zone = dropZone(event.target);
+        if (zone) {
+            event.preventDefault();
+            upload(zone, event.dataTransfer.files);
+        }
+    });
+    document.addEventListener('click', function (event) {
+        var zone = dropZone(event.target);
+        if (zone) {
+            var input = document.createElement('input');
+            input.type = 'file';
+            input.multiple = true;
+            input.addEventListener('change', function () {
+                upload(zone, input.files);
+            });
+            input.click();
+        }
+    });
+})();
@@ -0,0 +1,154 @@
+// Structure uploads (class "chunked-upload") sent to /uploads/chunked in
+// parts, so large PDB/mmCIF ensembles never pass through Dash as base64.
+// An interrupted file resumes where the server says it stands; the stored
+// references are written to the dcc.Upload as its contents and filename.
+(function () {
+    var ROUTE = '/uploads/chunked';
+
+    function uploadZone(target) {
+        return target && target.closest ? target.closest('.chunked-upload') : null;
+    }
+
+    function resumeKey(file) {
+        return 'kdsaxs-upload:' + file.name + ':' + file.size + ':' + file.lastModified;
+    }
+
+    function request(method, url, options) {
+        return fetch(url, Object.assign({method: method, credentials: 'same-origin'}, options))
+            .then(function (response) {
+                return response.json().catch(function () {
+                    return {};
+                }).then(function (body) {
+                    body.status = response.status;
+                    return body;
+                });
+            });
+    }
+
+    function begin(file) {
+        var upload = localStorage.getItem(resumeKey(file));
+        var started = upload
+            ? request('GET', ROUTE + '/' + upload)
+            : Promise.resolve({status: 404});
+        return started.then(function (status) {
+            if (status.status === 200) {
+                return status;
+            }
+            return request('POST', ROUTE, {
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({filename: file.name, size: file.size})
+            }).then(function (created) {
+                if (created.status !== 200) {
+                    throw new Error(created.error || 'The upload was refused.');
+                }
+                localStorage.setItem(resumeKey(file), created.id);
+                return created;
+            });
+        });
+    }
+
+    function send(file, progress) {
+        return begin(file).then(function (upload) {
+            var retries = 0;
+
+            function part(offset) {
+                progress(offset);
+                var body = file.slice(offset, offset + upload.part_size);
+                return request('PATCH', ROUTE + '/' + upload.id, {
+                    headers: {'Upload-Offset': String(offset)},
+                    body: body
+                }).then(function (result) {
+                    if (result.contents) {
+                        localStorage.removeItem(resumeKey(file));
+                        return result.contents;
+                    }
+                    if (result.status === 200 || result.status === 409) {
+                        // 409: the server holds a different part, continue from there
+                        return part(result.offset);
+                    }
+                    throw new Error(result.error || 'The upload failed.');
+                }, function () {
+                    // Connection lost: ask the server how far it got and go on
+                    if (++retries > 5) {
+                        throw new Error('The connection to the server was lost.');
+                    }
+                    return request('GET', ROUTE + '/' + upload.id).then(function (status) {
+                        if (status.status !== 200) {
+                            throw new Error('The upload is no longer on the server.');
+                        }
+                        return part(status.offset);
+                    });
+                });
+            }
+
+            return part(upload.offset);
+        });
+    }
+
+    function upload(zone, files) {
+        if (!files || !files.length) {
+            return;
+        }
+        var holder = zone.closest('[id]');
+        var id = holder.id.charAt(0) === '{' ? JSON.parse(holder.id) : holder.id;
+        var label = zone.querySelector('div') || zone;
+        var contents = [];
+        var names = [];
+        var total = 0;
+        var done = 0;
+        for (var i = 0; i < files.length; i++) {
+            total += files[i].size;
+        }
+
+        var chain = Promise.resolve();
+        Array.prototype.forEach.call(files, function (file) {
+            chain = chain.then(function () {
+                return send(file, function (offset) {
+                    var percent = total ? Math.floor(100 * (done + offset) / total) : 100;
+                    label.textContent = 'Uploading ' + file.name + ' (' + percent + '%)...';
+                }).then(function (reference) {
+                    done += file.size;
+                    contents.push(reference);
+                    names.push(file.name);
+                });
+            });
+        });
+        chain.then(function () {
+            window.dash_clientside.set_props(id, {contents: contents, filename: names});
+        }).catch(function (error) {
+            window.dash_clientside.set_props(id, {
+                children: 'Upload failed: ' + error.message + ' Drop the files again to resume.'
+            });
+        });
+    }
+
+    // Capture phase, ahead of the disabled dcc.Upload underneath
+    document.addEventListener('dragover', function (event) {
+        if (uploadZone(event.target)) {
+            event.preventDefault();
+        }
+    }, true);
+    document.addEventListener('drop', function (event) {
+        var zone = uploadZone(event.target);
+        if (zone) {
+            event.preventDefault();
+            event.stopPropagation();
+            upload(zone, event.dataTransfer.files);
+        }
+    }, true);
+    document.addEventListener('click', function (event) {
+        var zone = uploadZone(event.target);
+        if (zone) {
+            event.preventDefault();
+            event.stopPropagation();
+            var input = document.createElement('input');
+            input.type = 'file';
+            input.multiple = true;
+            input.accept = '.pdb,.cif,.mmcif,.gz';
+            input.addEventListener('change', function () {
+                upload(zone, input.files);
+            });
+            input.click();
+        }
+    }, true);
+})();
@@ -1,56 +1,170 @@
+import fcntl
 import os
 import shutil
 import threading
 import time
-from datetime import datetime, timedelta
 
-from config import BASE_DIR
+from config import (
+    BASE_DIR,
+    SESSION_GC_INTERVAL,
+    SESSION_MAX_IDLE,
+    SESSION_MIN_IDLE,
+    SESSION_QUOTA_BYTES,
+)
 from scripts.error_handling import logger
+from scripts.jobs import job_runner
+from scripts.result_cache import result_cache
+from scripts.saxs_parser import profile_cache
+from scripts.upload_store import expire_partial_uploads
+from scripts.utils import directory_size
+from scripts.workspace import SessionBusyError, SessionWorkspace
 
+SESSIONS_DIR = os.path.join(BASE_DIR, "output_data", "sessions")
 
-def cleanup_sessions(days_to_keep=2):
+
+class SessionCollector:
     """
-    Clean up session directories older than specified days
+    Garbage collector of session directories, coordinated across workers.
+
+    Every worker runs the collector thread, but a pass only runs in the one
+    that takes the collector lock, and at most once per interval. Sessions
+    idle for longer than the maximum idle time are deleted; above the disk
+    quota the least recently used ones go next. Sessions with a running
+    analysis (their lock is held) or used within the last minutes are kept;
+    only their chunked uploads abandoned halfway are dropped.
     """
-    sessions_dir = os.path.join(BASE_DIR, "output_data", "sessions")
-    if not os.path.exists(sessions_dir):
-        logger.info("No sessions directory found")
-        return
-
-    cutoff_date = datetime.now() - timedelta(days=days_to_keep)
-    
-    try:
-        for session_name in os.listdir(sessions_dir):
-            session_path = os.path.join(sessions_dir, session_name)
-            
-            # Extract timestamp from session directory name
-            # Format: session_XXXXXXXX_YYYYMMDD_HHMMSS
+
+    def __init__(self, root=SESSIONS_DIR, quota=SESSION_QUOTA_BYTES,
+                 max_idle=SESSION_MAX_IDLE, min_idle=SESSION_MIN_IDLE,
+                 interval=SESSION_GC_INTERVAL):
+        self.root = root
+        self.quota = quota
+        self.max_idle = max_idle
+        self.min_idle = min_idle
+        self.interval = interval
+        self.lock_path = os.path.join(root, ".gc.lock")
+
+    def sessions(self):
+        """
+        Returns:
+            List of (last access time, size in bytes, path), least recently used first
+        """
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
             try:
-                timestamp_str = '_'.join(session_name.split('_')[2:])  # Get YYYYMMDD_HHMMSS
-                session_date = datetime.strptime(timestamp_str, '%Y%m%d_%H%M%S')
-                
-                if session_date < cutoff_date:
-                    shutil.rmtree(session_path)
-                    logger.info(f"Deleted old session: {session_name}")
-            
-            except (IndexError, ValueError) as e:
-                logger.warning(f"Could not parse date from session directory: {session_name}. Error: {str(e)}")
+                # Session directories are touched whenever their session is used
+                entries.append((os.path.getmtime(path), directory_size(path), path))
+            except OSError:
                 continue
-            except Exception as e:
-                logger.error(f"Error processing session {session_name}: {str(e)}")
+        return sorted(entries)
+
+    def _tombstone(self, path):
+        return os.path.join(self.root, f".deleted_{os.path.basename(path)}")
+
+    def _delete(self, path, reason):
+        """Delete a session unless an analysis is running in it"""
+        workspace = SessionWorkspace(path)
+        tombstone = self._tombstone(path)
+        try:
+            with workspace.lock():
+                # Only moved away under the lock, whose file is inside: a job
+                # taking the lock next finds the session gone, not half deleted
+                os.rename(path, tombstone)
+        except SessionBusyError:
+            logger.debug(f"Keeping busy session {os.path.basename(path)}")
+            return False
+        shutil.rmtree(tombstone, ignore_errors=True)
+        # Spooled fits on tmpfs live outside the session tree
+        shutil.rmtree(workspace.scratch_root, ignore_errors=True)
+        logger.info(f"Deleted session {os.path.basename(path)} ({reason})")
+        return True
+
+    def collect(self):
+        """
+        One pass: expire idle sessions, then evict LRU ones down to the quota,
+        expire abandoned uploads of the others, and trim the server-wide
+        caches and job records
+        """
+        # Sessions whose deletion was interrupted
+        for name in os.listdir(self.root):
+            if name.startswith(".deleted_"):
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+        now = time.time()
+        entries = self.sessions()
+        total = sum(size for _, size, _ in entries)
+
+        for last_access, size, path in entries:
+            idle = now - last_access
+            if idle > self.max_idle:
+                reason = "idle"
+            elif total > self.quota and idle > self.min_idle:
+                reason = "over quota"
+            else:
                 continue
-                
-    except Exception as e:
-        logger.error(f"Error during session cleanup: {str(e)}")
+            if self._delete(path, reason):
+                total -= size
 
-def periodic_cleanup(interval_days=3):
+        for _, _, path in entries:
+            # Removing files deeper down keeps the session's last access time
+            expire_partial_uploads(path)
+
+        if total > self.quota:
+            logger.warning(
+                f"Sessions use {total / 2**30:.1f} GB, above the quota of "
+                f"{self.quota / 2**30:.1f} GB; the rest are in use"
+            )
+
+        profile_cache.evict()
+        result_cache.evict()
+        job_runner.prune()
+
+    def run_once(self):
+        """
+        Collect unless another worker holds the collector lock or ran a pass
+        within the interval
+        Returns:
+            True if this worker ran a pass
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.lock_path, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            try:
+                # The lock file's mtime records the last pass of any worker
+                last_pass = os.path.getmtime(self.lock_path)
+                if os.path.getsize(self.lock_path) and time.time() - last_pass < self.interval:
+                    return False
+                self.collect()
+                lock_file.seek(0)
+                lock_file.truncate()
+                lock_file.write(f"{os.getpid()} {time.time()}\n")
+                lock_file.flush()
+                return True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def periodic_cleanup(collector):
     while True:
-        cleanup_sessions()
-        time.sleep(interval_days * 24 * 60 * 60)
+        try:
+            collector.run_once()
+        except Exception as e:
+            logger.error(f"Error during session cleanup: {str(e)}")
+        time.sleep(collector.interval)
+
 
 def start_cleanup_thread():
-    cleanup_thread = threading.Thread(target=periodic_cleanup, daemon=True)
+    cleanup_thread = threading.Thread(
+        target=periodic_cleanup, args=(SessionCollector(),), daemon=True
+    )
     cleanup_thread.start()
 
+
 if __name__ == "__main__":
-    start_cleanup_thread()
+    SessionCollector().collect()
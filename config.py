@@ -6,65 +6,167 @@ from datetime import datetime
 # Directory configurations
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+def env_setting(name, default, cast=str):
+    """Deployment setting from a KDSAXS_<name> environment variable, if set"""
+    value = os.environ.get(f"KDSAXS_{name}")
+    return default if value is None else cast(value)
+
 # Session management
 def create_session_dir():
     session_id = str(uuid.uuid4())[:8]  # Use first 8 chars of UUID
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     session_dir = f"session_{session_id}_{timestamp}"
     
-    # Create main session directory
+    # Only the session root; uploads, fits, logs and pdbs subdirectories
+    # are created by whatever first writes to them
     session_path = os.path.join(BASE_DIR, "output_data", "sessions", session_dir)
-    
-    # Create subdirectories
-    os.makedirs(os.path.join(session_path, "uploads", "experimental"), exist_ok=True)
-    os.makedirs(os.path.join(session_path, "uploads", "theoretical"), exist_ok=True)
-    os.makedirs(os.path.join(session_path, "theoretical_int"), exist_ok=True)
-    os.makedirs(os.path.join(session_path, "fits"), exist_ok=True)
-    os.makedirs(os.path.join(session_path, "logs"), exist_ok=True)
-    
-    # For Monomer-Oligomer model
-    os.makedirs(os.path.join(session_path, "pdbs", "monomer"), exist_ok=True)
-    os.makedirs(os.path.join(session_path, "pdbs", "oligomer"), exist_ok=True)
-    
-    # For Protein Binding model
-    os.makedirs(os.path.join(session_path, "pdbs", "receptor"), exist_ok=True)
-    os.makedirs(os.path.join(session_path, "pdbs", "receptor_ligand"), exist_ok=True)
-    os.makedirs(os.path.join(session_path, "pdbs", "ligand"), exist_ok=True)
-    
-    # Common directories for both models
-    os.makedirs(os.path.join(session_path, "pdbs", "calculated_profiles"), exist_ok=True)
-    os.makedirs(os.path.join(session_path, "pdbs", "averaged_profiles"), exist_ok=True)
+    os.makedirs(session_path, exist_ok=True)
     
     return session_path
 
+# Session garbage collection, shared by all workers
+SESSION_GC_INTERVAL = 10 * 60  # seconds between collector passes
+SESSION_MAX_IDLE = 2 * 24 * 60 * 60  # sessions unused for longer are deleted
+SESSION_MIN_IDLE = 15 * 60  # sessions used more recently are never evicted
+SESSION_QUOTA_BYTES = env_setting("SESSION_QUOTA_BYTES", 10 * 1024 * 1024 * 1024, int)  # 10GB for all sessions
+
+# Server-side session state shared by all workers; point these at shared
+# storage (with output_data) to run workers on several hosts
+SECRET_KEY = env_setting("SECRET_KEY", None)
+SECRET_KEY_FILE = env_setting("SECRET_KEY_FILE", os.path.join(BASE_DIR, "output_data", "secret_key"))
+SESSION_DB = env_setting("SESSION_DB", os.path.join(BASE_DIR, "output_data", "sessions.db"))
+SESSION_COOKIE_NAME = "kdsaxs_session"
+
 # Model configurations
-ALLOWED_MODELS = ['kds_saxs_mon_oligomer', 'kds_saxs_oligomer_fitting']
+ALLOWED_MODELS = ['kds_saxs_mon_oligomer', 'kds_saxs_oligomer_fitting', 'kds_saxs_sequential_oligomer', 'kds_saxs_cooperative_binding']
 DEFAULT_MODEL = 'kds_saxs_mon_oligomer'
 
 # Analysis configurations
 KD_RANGE = (0.01, 10000)
 KD_POINTS = 50
 
+LCURVE_BOOTSTRAP_REPLICATES = 100  # Resampled average curves for the L-curve Kd spread
+
+ANALYSIS_WORKERS = env_setting("ANALYSIS_WORKERS", 1, int)  # Concentrations fitted in parallel within one analysis
+
 CONCENTRATION_RANGE = (0.1, 12000)
 CONCENTRATION_POINTS = 50
 
 # ATSAS configuration
 #ATSAS_PATH = "/home/kdsaxs/ATSAS-3.2.1-1/bin/"  #for production server
-ATSAS_PATH = "/Users/tiago/ATSAS-3.2.1-1/bin/"  #for local testing
+ATSAS_PATH = env_setting("ATSAS_PATH", "/Users/tiago/ATSAS-3.2.1-1/bin/")  #for local testing
 
 CRYSOL_COMMAND = "crysol"  # Command name
 CRYSOL_PARAMS = {
     'points': 101,  # -ns parameter
     'implicit_hydrogens': 1,  # --implicit-hydrogen parameter
+    'smax': 0.5,  # -sm parameter, maximum q of the profiles in Å⁻¹
 }
 
 # Add log directory configuration
 LOG_DIRECTORY = os.path.join(BASE_DIR, "output_data", "logs")
 
 # Add to config.py
-MAX_PDB_UPLOADS = 20
-MAX_PDB_SIZE = 10 * 1024 * 1024  # 10MB in bytes
+# PDB/mmCIF ensembles are uploaded in parts straight to disk, see /uploads/chunked
+MAX_PDB_UPLOADS = 500  # structures per species
+MAX_PDB_SIZE = 50 * 1024 * 1024  # bytes per structure file, as uploaded (gzip allowed)
+MAX_DECOMPRESSED_SIZE = 200 * 1024 * 1024  # bytes per file once a gzip upload is decompressed
+UPLOAD_PART_SIZE = 4 * 1024 * 1024  # bytes per request of a chunked upload
+UPLOAD_PARTIAL_TTL = 6 * 60 * 60  # seconds an unfinished chunked upload is kept after its last part
+UPLOAD_HASHES_SIZE = 64  # running hashes of unfinished uploads each worker keeps
+
+# Experimental profiles dropped in bulk are streamed to the session directory
+MAX_BULK_UPLOADS = 5000  # files per drop, as many as a high-throughput series
+MAX_PROFILE_SIZE = 5 * 1024 * 1024  # bytes per experimental profile
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # bytes read at a time from an upload stream
 
 # Add maximum points limits
 MAX_KD_POINTS = 100
 MAX_CONCENTRATION_POINTS = 100
+
+# PDF export configuration
+EXPORT_RENDERERS = 2  # Concurrent renders in the warm kaleido server
+EXPORT_POLL_INTERVAL = 1000  # ms between checks for a finished PDF export
+
+# Server-wide cache of complete analyses
+RESULT_CACHE_DIR = os.path.join(BASE_DIR, "output_data", "cache", "results")
+RESULT_CACHE_TTL = 7 * 24 * 60 * 60  # seconds
+RESULT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2GB
+
+# Multi-Kd models: coarse-to-fine search instead of an exhaustive grid
+MAX_KD_DIMENSIONS = 3
+SEARCH_COARSE_BUDGET = 100  # grid points of the coarse level
+SEARCH_REFINE_POINTS = 5  # per Kd axis in each refined box
+SEARCH_REFINE_LEVELS = 2
+
+# Stoichiometry scan of the Monomer-Oligomer model
+MAX_SCAN_N_VALUES = 6
+
+# Fitting backend: "atsas" runs oligomer per fit.
+# "native" (opt-in, needed for high-throughput series) fits the mixtures in
+# numpy instead; its χ² has not been validated against oligomer.
+FIT_BACKEND = env_setting("FIT_BACKEND", "atsas")
+# Interpolate the basis onto the experimental q grid before oligomer runs,
+# instead of letting oligomer interpolate; off until its χ² is compared
+# with that of oligomer on the theoretical grid
+OLIGOMER_PROJECT_BASIS = env_setting("OLIGOMER_PROJECT_BASIS", False, lambda value: value.lower() in ("1", "true", "yes"))
+OPERATOR_CACHE_SIZE = 64
+
+# Parsed SAXS profiles, by content hash
+PROFILE_CACHE_DIR = os.path.join(BASE_DIR, "output_data", "cache", "profiles")
+PROFILE_CACHE_SIZE = 256  # profiles kept in memory per worker
+PROFILE_CACHE_MAX_BYTES = 512 * 1024 * 1024  # parsed profiles on disk, trimmed by the session collector
+CACHE_STAGING_MAX_AGE = 60 * 60  # seconds before a half-written cache file counts as abandoned
+
+# Pre-flight checks of uploaded profiles before any fitting
+PREFLIGHT_MIN_POINTS = 10  # experimental points inside the theoretical q range
+
+# Scratch space of ATSAS runs; tmpfs keeps staged inputs and outputs off the disk
+SCRATCH_ROOT = env_setting("SCRATCH_ROOT", "/dev/shm/kdsaxs" if os.path.isdir("/dev/shm") else None)
+
+# Server-wide scheduler of ATSAS processes (oligomer, CRYSOL), shared by all workers
+ATSAS_SLOTS = env_setting("ATSAS_SLOTS", os.cpu_count() or 1, int)  # concurrent processes
+MAX_ACTIVE_ANALYSES = env_setting("MAX_ACTIVE_ANALYSES", 8, int)  # further ones are rejected
+SCHEDULER_DB = os.path.join(BASE_DIR, "output_data", "scheduler.db")
+SCHEDULER_POLL = 0.05  # seconds between checks for a free slot
+SCHEDULER_REAP_INTERVAL = 5  # seconds between sweeps for slots held by dead processes
+QUEUE_POLL_INTERVAL = 1000  # ms between queue position updates in the UI
+
+# Durable analysis jobs: resumable after a worker crash and reattachable after a reload
+JOBS_DB = os.path.join(BASE_DIR, "output_data", "jobs.db")
+JOB_HEARTBEAT = 5  # seconds between liveness updates of a running job
+JOB_STALE_AFTER = 30  # seconds without a heartbeat before a job counts as interrupted
+JOB_POLL_INTERVAL = 1000  # ms between job status checks in the UI
+JOB_RETENTION = 24 * 60 * 60  # seconds the record of a finished or interrupted job is kept
+CHECKPOINT_EVERY = 25  # ATSAS fits between checkpoints of a concentration
+
+# Cancellation of running analyses
+CANCEL_POLL = 0.1  # seconds between cancellation checks of a running ATSAS process
+CANCEL_GRACE_PERIOD = 2  # seconds between SIGTERM and SIGKILL of a cancelled process
+JOB_CANCEL_CHECK = 0.5  # seconds between checks of a job's cancellation request
+JOB_ABANDONED_AFTER = 120  # seconds without a page polling a job before it is cancelled
+
+# Wall-clock budget of an analysis; Kd values are fitted coarse to fine and
+# the points completed when it expires are returned as a partial result
+ANALYSIS_TIME_BUDGET = env_setting("ANALYSIS_TIME_BUDGET", 240, float)  # seconds, per run in the UI
+MAX_TIME_BUDGET = 3600  # upper limit of the per-run setting
+
+# Pool of ATSAS workers (kdsaxs_worker.py) on this or other hosts, fed by the
+# task broker (kdsaxs_broker.py); ATSAS runs on the server itself if unset
+WORKER_BROKER = env_setting("WORKER_BROKER", None)  # "host:port" of the broker
+WORKER_AUTHKEY = env_setting("WORKER_AUTHKEY", None)  # shared secret of the broker and its clients
+WORKER_BROKER_PORT = 7350
+WORKER_POLL = 0.5  # seconds between checks for results, cancellation and new tasks
+WORKER_TASK_LEASE = 30  # seconds without news from a worker before its task goes to another
+ARENA_CACHE_SIZE = 8  # shared arenas of recent analyses each worker keeps attached
+
+# Watch mode (kdsaxs_watch.py): frames of a live titration fitted as they arrive
+WATCH_OUTPUT_DIR = os.path.join(BASE_DIR, "output_data", "watch")
+WATCH_INTERVAL = 2  # seconds between scans of the watched directory
+WATCH_SETTLE = 2  # seconds a frame must stay unchanged before it is fitted
+
+# High-throughput series (SEC-SAXS, titration robots): all profiles in one
+# memory-mapped stack, fitted in blocks of frames at every Kd
+MAX_STACK_FRAMES = 5000
+STACK_BLOCK_FRAMES = 256  # frames read from the stack and fitted together
+STACK_FITS_PER_PAGE = 10  # fit plots per page of the results
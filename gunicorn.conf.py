@@ -0,0 +1,15 @@
+# gunicorn wsgi:server, from the repository directory
+import os
+
+bind = os.environ.get("KDSAXS_BIND", "0.0.0.0:8050")
+workers = int(os.environ.get("KDSAXS_WORKERS", 4))
+timeout = 300  # 5 minutes
+
+# Import the app once in the master; workers fork with everything loaded
+preload_app = True
+
+
+def post_fork(server, worker):
+    from app import start_services
+
+    start_services()
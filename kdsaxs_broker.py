@@ -0,0 +1,26 @@
+"""
+Task broker between KdSAXS servers and their pool workers.
+
+    KDSAXS_WORKER_AUTHKEY=<secret> python kdsaxs_broker.py --bind 0.0.0.0:7350
+
+Tasks are pickled over the connection, so the key must stay secret and the
+port should only be reachable from the server and the worker hosts.
+"""
+import argparse
+
+from config import WORKER_AUTHKEY, WORKER_BROKER_PORT
+from scripts.worker_pool import serve_broker
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KdSAXS task broker")
+    parser.add_argument("--bind", default=f"0.0.0.0:{WORKER_BROKER_PORT}", help="host:port to listen on")
+    parser.add_argument("--authkey", default=WORKER_AUTHKEY, help="shared key of the broker and its clients")
+    args = parser.parse_args()
+    if not args.authkey:
+        parser.error("a key is required (--authkey or KDSAXS_WORKER_AUTHKEY)")
+    serve_broker(args.bind, args.authkey)
+
+
+if __name__ == "__main__":
+    main()
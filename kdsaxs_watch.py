@@ -0,0 +1,49 @@
+"""
+Fit the frames of a live titration as they arrive in a directory.
+
+The concentration of every frame is taken from its filename, e.g. 17.4 µM
+for 0.32_mgml_17.4uM_cut_28.dat:
+
+    python kdsaxs_watch.py /data/beamtime/titration \\
+        --theoretical avg_mon.int avg_dim.int --n 2 --q-units 2
+"""
+import argparse
+import os
+
+from config import KD_POINTS, KD_RANGE, WATCH_INTERVAL, WATCH_OUTPUT_DIR
+from scripts.titration_watch import TitrationWatcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit titration frames as they arrive in a directory")
+    parser.add_argument("directory", help="directory the frames arrive in")
+    parser.add_argument("--theoretical", nargs="+", required=True,
+                        help="theoretical profile of every species, in the model's order")
+    parser.add_argument("--model", default="kds_saxs_mon_oligomer",
+                        choices=["kds_saxs_mon_oligomer", "kds_saxs_oligomer_fitting"])
+    parser.add_argument("--n", type=int, default=2, help="stoichiometry")
+    parser.add_argument("--receptor-concentration", type=float,
+                        help="receptor concentration of the protein binding model")
+    parser.add_argument("--kd-range", type=float, nargs=2, default=KD_RANGE, metavar=("MIN", "MAX"))
+    parser.add_argument("--kd-points", type=int, default=KD_POINTS)
+    parser.add_argument("--q-units", choices=["1", "2"], default="2", help="1: 1/Å, 2: 1/nm")
+    parser.add_argument("--units", choices=["nM", "µM", "mM"], default="µM", help="concentration units")
+    parser.add_argument("--pattern", default="*.dat", help="glob of the frame files")
+    parser.add_argument("--interval", type=float, default=WATCH_INTERVAL, help="seconds between scans")
+    parser.add_argument("--output", help="results directory; a restarted watcher reuses its fits")
+    args = parser.parse_args()
+    if args.model == "kds_saxs_oligomer_fitting" and args.receptor_concentration is None:
+        parser.error("the protein binding model needs --receptor-concentration")
+
+    directory = os.path.abspath(args.directory)
+    output_dir = args.output or os.path.join(WATCH_OUTPUT_DIR, os.path.basename(directory))
+    os.makedirs(output_dir, exist_ok=True)
+    watcher = TitrationWatcher(
+        directory, output_dir, args.model, args.theoretical, args.n, tuple(args.kd_range),
+        args.kd_points, args.q_units, args.receptor_concentration, args.units, args.pattern,
+    )
+    watcher.run(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Pool worker running oligomer and CRYSOL tasks of KdSAXS servers.
+
+Start any number of them, on the server or on other hosts with ATSAS, with
+the broker address and key the server uses (KDSAXS_WORKER_BROKER and
+KDSAXS_WORKER_AUTHKEY, or the options below):
+
+    python kdsaxs_worker.py --broker server:7350 --processes 8
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from config import ARENA_CACHE_SIZE, ATSAS_PATH, CRYSOL_COMMAND, SCRATCH_ROOT, WORKER_AUTHKEY, WORKER_BROKER, WORKER_POLL
+from models.calculations import oligomer_fit
+from scripts.cancellation import AnalysisCancelled, cancellation_token, run_process
+from scripts.crysol_handler import CrysolHandler
+from scripts.error_handling import logger
+from scripts.scheduler import HOST, scheduler
+from scripts.shared_arena import attach
+from scripts.worker_pool import connect
+
+
+class ArenaCache:
+    """
+    Shared arenas of the analyses a worker ran tasks for, attached in place
+    when on the same host as the server, else fetched from the broker once
+    """
+
+    def __init__(self, broker, root, size=ARENA_CACHE_SIZE):
+        self.broker = broker
+        self.root = root
+        self.size = size
+        self._arenas = OrderedDict()  # name -> (SharedMemory or None, arrays, staged experimental file)
+
+    def get(self, descriptor):
+        """
+        Returns:
+            Tuple of (dict of name to array, path of the experimental profile staged as a file)
+        """
+        name = descriptor["name"]
+        if name in self._arenas:
+            self._arenas.move_to_end(name)
+        else:
+            try:
+                shm, arrays = attach(descriptor)
+            except FileNotFoundError:
+                shm, arrays = None, self.broker.arena(name)
+                if arrays is None:
+                    raise RuntimeError(f"Arena {name} is no longer available")
+            # oligomer reads the experimental profile from a file, written once per arena
+            exp_saxs = os.path.join(self.root, f"{name.strip('/')}.dat")
+            np.savetxt(exp_saxs, arrays["experimental"])
+            self._arenas[name] = (shm, arrays, exp_saxs)
+            while len(self._arenas) > self.size:
+                old_shm, _, old_file = self._arenas.popitem(last=False)[1]
+                if old_shm is not None:
+                    old_shm.close()
+                os.remove(old_file)
+        _, arrays, exp_saxs = self._arenas[name]
+        return arrays, exp_saxs
+
+
+def execute(task, scratch, run, arenas):
+    """
+    Run one task in a scratch directory
+    Args:
+        task: dict with the kind of task ("oligomer" or "crysol") and its inputs
+        scratch: private working directory of the task
+        run: function running a command list in scratch, returning a CompletedProcess
+        arenas: ArenaCache of the worker
+    Returns:
+        Dict with the chi², fit and error output of an oligomer task, or the
+        profile of a CRYSOL task; with an "error" entry if it failed
+    """
+    if task["kind"] == "oligomer":
+        arrays, exp_saxs = arenas.get(task["arena"])
+        profile = np.einsum("s,sqc->qc", task["fractions"], arrays["basis"])
+        chi_squared, fit_data, _, stderr = oligomer_fit(
+            scratch, profile, exp_saxs, "task", task["q_units"], run
+        )
+        return {"chi2": chi_squared, "fit": fit_data, "error": stderr}
+
+    if task["kind"] == "crysol":
+        # Structures are PDB or mmCIF, told apart by CRYSOL from their extension
+        pdb_file = os.path.join(scratch, task["prefix"] + task.get("suffix", ".pdb"))
+        with open(pdb_file, "wb") as fp:
+            fp.write(task["pdb"])
+        crysol_path = os.path.join(ATSAS_PATH, CRYSOL_COMMAND)
+        result = run(CrysolHandler.command(crysol_path, pdb_file, task["prefix"]))
+        output = os.path.join(scratch, f"{task['prefix']}.int")
+        if result.returncode != 0 or not os.path.exists(output):
+            return {"error": result.stderr or "CRYSOL produced no profile"}
+        with open(output) as fp:
+            return {"profile": fp.read()}
+
+    return {"error": f"Unknown task kind {task['kind']!r}"}
+
+
+def run_worker(address, authkey, name=None):
+    """Take tasks from the broker and run them, one at a time, until stopped"""
+    broker = connect(address, authkey)
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    logger.info(f"Worker {name} connected to {address}")
+    if SCRATCH_ROOT:
+        os.makedirs(SCRATCH_ROOT, exist_ok=True)
+    staging = tempfile.TemporaryDirectory(prefix="worker_arenas_", dir=SCRATCH_ROOT)
+    arenas = ArenaCache(broker, staging.name)
+
+    while True:
+        leased = broker.next_task(name, 10 * WORKER_POLL)
+        if leased is None:
+            continue
+        task_id, task = leased
+        stopped = threading.Event()
+
+        with cancellation_token(task_id) as token, \
+                tempfile.TemporaryDirectory(prefix="worker_", dir=SCRATCH_ROOT) as scratch:
+
+            def keep_lease():
+                # Stops the task once it is cancelled or handed to another worker
+                while not stopped.wait(WORKER_POLL):
+                    if not broker.renew(task_id, name):
+                        token.set()
+                        return
+
+            def run(cmd):
+                if task.get("host") != HOST:
+                    return run_process(cmd, task_id, timeout=300, cwd=scratch)
+                # On the server's host, pool tasks share the ATSAS slots of
+                # local runs, in the turn of the session they belong to
+                with scheduler.slot(task["session"], cancel_id=task_id):
+                    return run_process(cmd, task_id, timeout=300, cwd=scratch)
+
+            threading.Thread(target=keep_lease, daemon=True).start()
+            try:
+                result = execute(task, scratch, run, arenas)
+            except AnalysisCancelled:
+                logger.info(f"Task {task_id} cancelled")
+                result = {"error": "Task cancelled."}
+            except subprocess.TimeoutExpired:
+                result = {"error": "Task timed out."}
+            except Exception as e:
+                logger.exception(f"Task {task_id} failed")
+                result = {"error": str(e)}
+            finally:
+                stopped.set()
+        broker.complete(task_id, result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KdSAXS pool worker for oligomer and CRYSOL tasks")
+    parser.add_argument("--broker", default=WORKER_BROKER, help="host:port of the task broker")
+    parser.add_argument("--authkey", default=WORKER_AUTHKEY, help="shared key of the broker")
+    parser.add_argument("--processes", type=int, default=1, help="tasks run in parallel")
+    args = parser.parse_args()
+    if not args.broker or not args.authkey:
+        parser.error("the broker address and key are required")
+
+    workers = [
+        multiprocessing.Process(target=run_worker, args=(args.broker, args.authkey))
+        for _ in range(args.processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
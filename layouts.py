@@ -1,11 +1,13 @@
 import dash_bootstrap_components as dbc
 from dash import dcc, html
-from config import ALLOWED_MODELS, DEFAULT_MODEL, KD_RANGE, CONCENTRATION_RANGE, KD_POINTS, CONCENTRATION_POINTS
+from config import ALLOWED_MODELS, DEFAULT_MODEL, KD_RANGE, CONCENTRATION_RANGE, KD_POINTS, CONCENTRATION_POINTS, EXPORT_POLL_INTERVAL, QUEUE_POLL_INTERVAL, JOB_POLL_INTERVAL, ANALYSIS_TIME_BUDGET, MAX_PDB_UPLOADS, FIT_BACKEND
 
 def create_model_selection():
     model_display_names = {
         'kds_saxs_mon_oligomer': 'Monomer-Oligomer',
-        'kds_saxs_oligomer_fitting': 'Protein Binding'
+        'kds_saxs_oligomer_fitting': 'Protein Binding',
+        'kds_saxs_sequential_oligomer': 'Sequential Oligomerization',
+        'kds_saxs_cooperative_binding': 'Cooperative Binding'
     }
 
     return html.Div([
@@ -24,6 +26,13 @@ def create_model_selection():
     ], 
     className="section-frame section-frame-0")
 
+def create_bulk_drop(drop_id, store_id, label):
+    """Drop zone posting many files at once to the server, see assets/bulk_upload.js"""
+    return html.Div([
+        html.Div(label, className="bulk-drop-label"),
+    ], id=drop_id, className="upload-style bulk-drop", style={'cursor': 'pointer'},
+        **{'data-url': '/uploads/experimental', 'data-store': store_id})
+
 def create_saxs_upload_section():
     return html.Div([
         html.Div([
@@ -89,6 +98,13 @@ def create_saxs_upload_section():
             'alignItems': 'center'
         }),
         
+        html.Div(id='bulk-exp-upload', children=[
+            create_bulk_drop('bulk-exp-drop', 'bulk-upload-store',
+                             'Drop all experimental SAXS files at once (concentrations read from names like 17.4uM)'),
+            dcc.Store(id='bulk-upload-store', storage_type='memory'),
+            html.Div(id='bulk-upload-status'),
+        ]),
+
         html.Div(id='saxs-upload-container', children=[
             html.Div([
                 html.Div([
@@ -140,12 +156,25 @@ def create_saxs_upload_section():
             ], style={'display': 'flex', 'alignItems': 'center', 'marginBottom': '10px'})
         ]),
         html.Button('Add another SAXS profile', id='add-saxs-button', n_clicks=0, className='dash-button'),
+        html.Hr(),
+        dbc.Switch(
+            id='stack-mode',
+            label='High-throughput series: fit all profiles below instead, with concentrations read from file names',
+            value=False,
+            # Series are only fitted by the native backend
+            disabled=FIT_BACKEND != 'native',
+        ),
+        html.Div(id='stack-upload', children=[
+            create_bulk_drop('upload-stack', 'stack-upload-store', 'Drag and Drop or Select all profiles of the series'),
+            dcc.Store(id='stack-upload-store', storage_type='memory'),
+            html.Div(id='stack-status', className="mt-2"),
+        ], style={'display': 'none'}),
     ], className="section-frame section-frame-1")
 
 def create_theoretical_saxs_section():
     return html.Div([
         html.Div([
-            "Upload theoretical SAXS profiles or PDB files (max 20 PDB files per state):",
+            f"Upload theoretical SAXS profiles or PDB/mmCIF files (max {MAX_PDB_UPLOADS} structures per state):",
             html.Sup(html.I(className="fas fa-info-circle", id="theo-saxs-info", style={'marginLeft': '5px'}))
         ], className="centered-bold-text"),
         
@@ -181,6 +210,9 @@ def create_kd_selection_section():
                 create_input_field("Conc. max", "conc-max", value=CONCENTRATION_RANGE[1]),
                 create_input_field("Points", "conc-points", value=CONCENTRATION_POINTS),
             ], className="input-row"),
+            html.Div([
+                create_input_field("Time limit (s)", "time-budget", value=ANALYSIS_TIME_BUDGET),
+            ], className="input-row"),
         ], className="input-container"),
         html.Button('Run Analysis', id='run-analysis', n_clicks=0, className='dash-button')
     ], className='section-frame section-frame-3')
@@ -200,6 +232,18 @@ def create_model_specific_inputs():
                 )
             ], id='n-input-container', style={'display': 'inline-block', 'marginRight': '20px'}),
 
+            html.Div([
+                html.Label("Scan stoichiometries: "),
+                dcc.Input(
+                    id='input-n-scan',
+                    type='text',
+                    value=None,
+                    placeholder='e.g. 2, 3, 4',
+                    debounce=True,
+                    className="input-style"
+                )
+            ], id='n-scan-container', style={'display': 'inline-block', 'marginRight': '20px'}),
+
             html.Div([
                 html.Label("Receptor concentration: "),
                 dcc.Input(
@@ -243,7 +287,18 @@ def create_instructions():
                 dbc.Button("Monomer-Oligomer ", id="popover-mon-oligomer", color="link"),
                 " and ",
                 dbc.Button("Protein binding", id="popover-oligomer-fitting", color="link"),
-                "equilibria to fit your experimental data. For the Monomer-Oligomer model the stoichiometry (n) corresponds to the Oligomer stoichiometry. For the protein binding model the value n corresponds to the number of independent binding sites. For n=1 this model falls back to a simple 1:1 Receptor-Ligand binding model. When you click on a K",
+                " equilibria, or their multi-K",
+                html.Sub("D"),
+                " variants ",
+                dbc.Button("Sequential oligomerization", id="popover-sequential-oligomer", color="link"),
+                " and ",
+                dbc.Button("Cooperative binding", id="popover-cooperative-binding", color="link"),
+                ", which fit one K",
+                html.Sub("D"),
+                " per step and show χ² as a heatmap over the first two K",
+                html.Sub("D"),
+                "s,"
+                " to fit your experimental data. For the Monomer-Oligomer model the stoichiometry (n) corresponds to the Oligomer stoichiometry. For the protein binding model the value n corresponds to the number of independent binding sites. For n=1 this model falls back to a simple 1:1 Receptor-Ligand binding model. For Sequential oligomerization n is the largest oligomer, for Cooperative binding it is the number of binding sites. When you click on a K",
                 html.Sub("D"),
                 " value in the χ² vs K",
                 html.Sub("D"),
@@ -335,6 +390,17 @@ def create_main_layout():
                     dcc.Graph(id='fraction-plot')
                 ], md=6),
             ]),
+            html.Div([
+                dbc.Button('Save All Plots as PDF', id='save-all-pdf', className='secondary-dash-button'),
+                html.A(dbc.Button('Export Analysis as ZIP', className='secondary-dash-button'),
+                       id='export-analysis-link', href=None),
+            ], className="d-flex justify-content-end mt-4"),
+            html.Div(
+                dbc.Pagination(id='fit-page', max_value=1, active_page=1, fully_expanded=False),
+                id='fit-pagination',
+                className="mt-4",
+                style={'display': 'none'}
+            ),
             html.Div(id='saxs-fit-plots', className="mt-4"),
             dcc.Store(id='message-trigger', storage_type='memory'),
             dcc.Store(id='example-data-store'),
@@ -353,10 +419,14 @@ def create_main_layout():
                 className="message-modal",
             ),
             dcc.Download(id="download-chi2-csv"),
-            dcc.Download(id="download-chi2-pdf"),
             dcc.Download(id="download-fraction-csv"),
-            dcc.Download(id="download-fraction-pdf"),
+            dcc.Download(id="download-pdf"),
+            dcc.Store(id='export-job-store', storage_type='memory'),
+            dcc.Interval(id='export-poll', interval=EXPORT_POLL_INTERVAL, disabled=True),
             dcc.Store(id='experimental-data-store', storage_type='memory'),
+            dcc.Interval(id='queue-poll', interval=QUEUE_POLL_INTERVAL, disabled=True),
+            dcc.Store(id='job-store', storage_type='session'),
+            dcc.Interval(id='job-poll', interval=JOB_POLL_INTERVAL, disabled=True),
             dbc.Modal(
                 [
                     #dbc.ModalHeader(dbc.ModalTitle("Status")),
@@ -364,6 +434,8 @@ def create_main_layout():
                         html.Div([
                             html.H4("Calculating...", className="mb-3", style={'color': '#007bff'}),
                             dbc.Spinner(size="lg", color="primary"),
+                            html.Div(id='queue-status', className="mt-3 text-muted"),
+                            dbc.Button("Cancel", id="cancel-analysis", color="secondary", outline=True, size="sm", className="mt-3"),
                         ], style={'textAlign': 'center'})
                     ]),
                     #dbc.ModalFooter(
@@ -3,11 +3,18 @@ import os
 import numpy as np
 import pandas as pd
 from scipy.optimize import fsolve
-import subprocess
+import shutil
 import re
-from config import KD_RANGE, KD_POINTS, ATSAS_PATH
+from config import KD_RANGE, KD_POINTS, ATSAS_PATH, FIT_BACKEND, OLIGOMER_PROJECT_BASIS, CHECKPOINT_EVERY, STACK_BLOCK_FRAMES
 from scripts.error_handling import logger
-from scripts.utils import format_concentration, get_session_path
+from scripts.result_store import ResultStore, fit_name
+from scripts.saxs_parser import load_profile, parse_profile
+from scripts.cancellation import AnalysisCancelled, budget_expired, check_cancelled, run_process
+from scripts.scheduler import scheduler
+from scripts.utils import content_hash, fingerprint, format_concentration, get_session_path
+from scripts.worker_pool import pool_arena, pool_enabled, run_tasks
+from scripts.workspace import SessionWorkspace
+from .profile_fit import ProfileFitter, StackFitter, project_basis
 
 def extract_chi_squared(log_file_path):
     try:
@@ -24,6 +31,178 @@ def extract_chi_squared(log_file_path):
         print(f"An error occurred: {e}")
         return None
 
+def kd_grid(kd_range, kd_points):
+    """Log-spaced Kd values, rounded to 2 decimals without duplicates"""
+    return np.unique(np.round(np.geomspace(kd_range[0], kd_range[1], num=kd_points), decimals=2))
+
+
+def coarse_to_fine_levels(kd_values):
+    """
+    Levels of a sorted Kd grid from coarse to fine: the ends and the Kd nearest
+    each decade, then the midpoints of the gaps left by the previous levels
+    Returns:
+        List of levels, each a list of indices into kd_values
+    """
+    if len(kd_values) == 0:
+        return []
+    log_kd = np.log10(np.asarray(kd_values, dtype=float))
+    decades = np.arange(np.ceil(log_kd[0]), np.floor(log_kd[-1]) + 1)
+    level = sorted({0, len(log_kd) - 1} | {int(np.abs(log_kd - decade).argmin()) for decade in decades})
+    levels = [level]
+    gaps = list(zip(level, level[1:]))
+    while gaps:
+        level, finer = [], []
+        for low, high in gaps:
+            if high - low > 1:
+                middle = (low + high) // 2
+                level.append(middle)
+                finer += [(low, middle), (middle, high)]
+        if level:
+            levels.append(level)
+        gaps = finer
+    return levels
+
+
+def coarse_to_fine_order(kd_values):
+    """Indices of a sorted Kd grid in an order whose every prefix covers the whole range"""
+    return [index for level in coarse_to_fine_levels(kd_values) for index in level]
+
+
+def coarse_to_fine_passes(kd_values):
+    """Number of Kd values fitted after each level of the coarse-to-fine order"""
+    return np.cumsum([len(level) for level in coarse_to_fine_levels(kd_values)]).tolist()
+
+
+def split_completed(Kd_values, completed):
+    """
+    Separate the Kd values still to compute from results of a previous run
+    Args:
+        Kd_values: Kd grid of this run
+        completed: DataFrame of previously computed rows, or None
+    Returns:
+        Tuple of (Kd values to compute, reusable rows)
+    """
+    if completed is None or completed.empty:
+        return Kd_values, None
+    reusable = completed[completed["kd"].isin(Kd_values) & completed["chi2"].notna()]
+    return Kd_values[~np.isin(Kd_values, reusable["kd"])], reusable
+
+
+def merge_completed(computed, reusable):
+    """Combine freshly computed rows with reused ones, ordered by Kd"""
+    if reusable is None or reusable.empty:
+        return computed
+    return pd.concat([reusable, computed], ignore_index=True).sort_values("kd", ignore_index=True)
+
+
+class KdSweep:
+    """
+    Chi² of one experimental profile over a Kd grid, advanced pass by pass
+    coarse to fine. Fractions, basis and checkpoint are prepared once, and
+    every pass only fits the Kd values it adds.
+    Args:
+        grid: full Kd grid of the run, whose coarse-to-fine order sets the passes
+        frame: DataFrame of the Kd values to fit, with their fractions
+        fits: ProfileSweep over the rows of frame
+        reusable: rows of a previous run merged into the result, or None
+        columns: columns of frame kept in the result; all if None
+    """
+
+    def __init__(self, grid, frame, fits, reusable=None, columns=None):
+        self.frame = frame
+        self.fits = fits
+        self.reusable = reusable
+        self.columns = columns
+        # Ranked over the full grid, so concentrations with different
+        # reusable rows still fit the same Kd values in every pass
+        position = {kd: rank for rank, kd in enumerate(np.asarray(grid)[coarse_to_fine_order(grid)])}
+        self.rank = [position[kd] for kd in frame["kd"]]
+
+    def advance(self, coverage=None):
+        """Fit the Kd values among the first coverage of the coarse-to-fine order; all if None"""
+        order = sorted(range(len(self.rank)), key=self.rank.__getitem__)
+        self.fits.fit([i for i in order if coverage is None or self.rank[i] < coverage])
+        return self
+
+    def result(self):
+        """Rows fitted so far merged with the reusable ones; unfitted Kds keep a NaN chi²"""
+        df = self.frame.copy()
+        df["chi2"] = self.fits.chi_squared
+        if self.columns is not None:
+            df = df[self.columns]
+        return merge_completed(df, self.reusable)
+
+
+def oligomer_fit(scratch, theoretical_int, exp_saxs, label, q_units, run):
+    """
+    Fit one theoretical profile to an experimental profile with ATSAS oligomer,
+    in the server or in a pool worker
+    Args:
+        scratch: private scratch directory of the calling job
+        theoretical_int: theoretical profile as array
+        exp_saxs: path to experimental SAXS file, best staged in scratch
+        label: name of the fit within the scratch directory
+        q_units: angular units passed to oligomer (-un)
+        run: function running a command list in scratch, returning a CompletedProcess
+    Returns:
+        Tuple of (chi², fit as array of s, Iexp, sigma and Ifit, path of the
+        log, stderr); chi² and fit are None if oligomer failed
+    """
+    theoretical_file = os.path.join(scratch, f"theoretical_{label}.int")
+    scratch_fit = os.path.join(scratch, f"fit_{label}.fit")
+    scratch_log = os.path.join(scratch, f"oligomer_{label}.log")
+    np.savetxt(theoretical_file, theoretical_int, fmt="%.6e")
+
+    cmd = [os.path.join(ATSAS_PATH, "oligomer"), "-ff", theoretical_file, exp_saxs,
+           f"--fit={scratch_fit}", f"--out={scratch_log}", "-cst", "-ws", f"-un={q_units}"]
+    result = run(cmd)
+
+    # Outputs are parsed straight from scratch
+    chi_squared = extract_chi_squared(scratch_log)
+    fit_data = None
+    if chi_squared is not None and os.path.exists(scratch_fit):
+        with open(scratch_fit) as fp:
+            fit_data = parse_profile(fp.read()).data[:, :4]
+    else:
+        chi_squared = None
+    return chi_squared, fit_data, scratch_log, result.stderr
+
+
+def run_oligomer(workspace, scratch, theoretical_int, exp_saxs, concentration, Kd, q_units, n=None):
+    """
+    Fit one theoretical profile to an experimental profile with ATSAS oligomer
+    Args:
+        workspace: SessionWorkspace of the session
+        scratch: private scratch directory of the calling job
+        theoretical_int: theoretical profile as array
+        exp_saxs: path to experimental SAXS file, best staged in scratch
+        concentration: concentration of the experimental profile
+        Kd: Kd of the grid point
+        q_units: angular units passed to oligomer (-un)
+        n: stoichiometry, only given when several are fitted in one job
+    Returns:
+        Tuple of (chi² of the fit, fit as array of s, Iexp, sigma and Ifit),
+        both None if oligomer failed
+    """
+    label = f"{format_concentration(concentration)}_{Kd}" + (f"_n{n}" if n is not None else "")
+    session_id = os.path.basename(workspace.session_dir)
+
+    def run(cmd):
+        # Server-wide budget of ATSAS processes, shared fairly between sessions
+        with scheduler.slot(session_id):
+            return run_process(cmd, session_id, timeout=300, cwd=scratch)
+
+    chi_squared, fit_data, scratch_log, stderr = oligomer_fit(
+        scratch, theoretical_int, exp_saxs, label, q_units, run
+    )
+    if chi_squared is None:
+        # Only the log of a failed run is kept in the session, for debugging
+        logger.error(f"oligomer failed for {label}: {stderr.strip()}")
+        if os.path.exists(scratch_log):
+            workspace.publish(scratch_log, os.path.join(get_session_path(workspace.session_dir, 'logs'), f"oligomer_{label}.log"))
+    return chi_squared, fit_data
+
+
 class MonomerOligomerCalculation:
     @staticmethod
     def solve_system(concentration, Kd, n):
@@ -43,45 +222,104 @@ class MonomerOligomerCalculation:
 
 
     @staticmethod
-    def calculate(exp_saxs, mon_avg_int, dim_avg_int, concentration, n, kd_range, kd_points, session_dir, q_units):
+    def grid_fractions(concentration, Kd_values, n):
+        """(Kd, concentration, monomer fraction, oligomer fraction) of every Kd the system solves for"""
+        rows = []
+        for Kd in Kd_values:
+            M, O = MonomerOligomerCalculation.solve_system(concentration, Kd, n)
+            if not np.isnan(M):
+                rows.append((Kd, concentration, M / concentration, n * O / concentration))
+        return rows
+
+    @staticmethod
+    def sweep(exp_saxs, mon_avg_int, dim_avg_int, concentration, n, kd_range, kd_points, session_dir, q_units, completed=None):
+        """
+        Prepare the fits of one concentration over the Kd grid, to be
+        advanced pass by pass with KdSweep.advance
+        Returns:
+            KdSweep whose result has the columns of calculate
+        """
+        grid = kd_grid(kd_range, kd_points)
+        # Only Kd values without a reusable result from a previous run are fitted
+        Kd_values, reusable = split_completed(grid, completed)
+
+        workspace = SessionWorkspace(session_dir)
+
+        mon_avg_int = load_profile(mon_avg_int).data[:, :2]
+        dim_avg_int = load_profile(dim_avg_int).data[:, :2]
+
+        basis = np.stack([mon_avg_int, dim_avg_int])
+
+        chi_squared_values = pd.DataFrame(
+            MonomerOligomerCalculation.grid_fractions(concentration, Kd_values, n),
+            columns=["kd", "concentration", "mon_frac", "dim_frac"])
+        fits = ProfileSweep(
+            workspace, exp_saxs, concentration, chi_squared_values["kd"].tolist(),
+            chi_squared_values[["mon_frac", "dim_frac"]].to_numpy(), basis, q_units)
+        return KdSweep(grid, chi_squared_values, fits, reusable)
+
+    @staticmethod
+    def calculate(exp_saxs, mon_avg_int, dim_avg_int, concentration, n, kd_range, kd_points, session_dir, q_units, completed=None, coverage=None):
         try:
-            Kd_values = np.round(np.geomspace(kd_range[0], kd_range[1], num=kd_points), decimals=2)
-            
-            # Get paths for different directories
-            theoretical_dir = get_session_path(session_dir, 'theoretical_int')
-            fits_dir = get_session_path(session_dir, 'fits')
-            logs_dir = get_session_path(session_dir, 'logs')
-            
-            mon_avg_int = np.loadtxt(mon_avg_int, skiprows=1)
-            dim_avg_int = np.loadtxt(dim_avg_int, skiprows=1)
-            
-            chi_squared_values = []
-            
-            for Kd in Kd_values:
-                M, O = MonomerOligomerCalculation.solve_system(concentration, Kd, n)
-                if not np.isnan(M):
-                    monomer_fraction = M / concentration
-                    oligomer_fraction = n * O / concentration
-                    
-                    theoretical_sum_int = monomer_fraction * mon_avg_int + oligomer_fraction * dim_avg_int
-                    theoretical_file = os.path.join(theoretical_dir, f"theoretical_{Kd}.int")
-                    np.savetxt(theoretical_file, theoretical_sum_int)
-                    
-                    fit_file = os.path.join(fits_dir, f"fit_{format_concentration(concentration)}_{Kd}.fit")
-                    log_file = os.path.join(logs_dir, f"oligomer_{format_concentration(concentration)}_{Kd}.log")
-                    
-                    cmd = f"{ATSAS_PATH}/oligomer -ff {theoretical_file} {exp_saxs} --fit={fit_file} --out={log_file} -cst -ws -un={q_units}"
-                    #print(cmd)
-                    result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=300)
-                    
-                    chi_squared = extract_chi_squared(log_file)
-                    chi_squared_values.append((Kd, concentration, monomer_fraction, oligomer_fraction, chi_squared))
-            
-            return pd.DataFrame(chi_squared_values, columns=["kd", "concentration", "mon_frac", "dim_frac", "chi2"])
+            return MonomerOligomerCalculation.sweep(
+                exp_saxs, mon_avg_int, dim_avg_int, concentration, n, kd_range, kd_points,
+                session_dir, q_units, completed
+            ).advance(coverage).result()
+        except AnalysisCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error in MonomerOligomerCalculation: {str(e)}")
             raise
 
+    @staticmethod
+    def sweep_scan(exp_saxs, mon_avg_int, dim_avg_int, concentration, n_values, kd_range, kd_points, session_dir, q_units):
+        """
+        Prepare the fits of several stoichiometries at one concentration,
+        sharing the loaded profiles
+        Returns:
+            List of KdSweep, one per n, whose results have an n column
+        """
+        grid = kd_grid(kd_range, kd_points)
+        workspace = SessionWorkspace(session_dir)
+
+        mon_avg_int = load_profile(mon_avg_int).data[:, :2]
+        dim_avg_int = load_profile(dim_avg_int).data[:, :2]
+
+        basis = np.stack([mon_avg_int, dim_avg_int])
+
+        sweeps = []
+        for n in n_values:
+            df = pd.DataFrame(
+                MonomerOligomerCalculation.grid_fractions(concentration, grid, n),
+                columns=["kd", "concentration", "mon_frac", "dim_frac"])
+            df.insert(0, "n", n)
+            fits = ProfileSweep(
+                workspace, exp_saxs, concentration, df["kd"].tolist(),
+                df[["mon_frac", "dim_frac"]].to_numpy(), basis, q_units, n=n)
+            sweeps.append(KdSweep(grid, df, fits))
+        return sweeps
+
+    @staticmethod
+    def calculate_scan(exp_saxs, mon_avg_int, dim_avg_int, concentration, n_values, kd_range, kd_points, session_dir, q_units, coverage=None):
+        """
+        Fit several stoichiometries in one job, sharing the loaded profiles
+        Args:
+            n_values: stoichiometries to evaluate
+            coverage: number of Kd values to fit per n, coarse to fine; all if None
+        Returns:
+            DataFrame with the columns of calculate plus n
+        """
+        try:
+            sweeps = MonomerOligomerCalculation.sweep_scan(
+                exp_saxs, mon_avg_int, dim_avg_int, concentration, n_values, kd_range, kd_points,
+                session_dir, q_units)
+            return pd.concat([sweep.advance(coverage).result() for sweep in sweeps], ignore_index=True)
+        except AnalysisCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"Error in MonomerOligomerCalculation scan: {str(e)}")
+            raise
+
     @staticmethod
     def calculate_fractions(kd, concentration_range, n):
         fractions = []
@@ -142,57 +380,461 @@ class ProteinBindingCalculation:
         return pd.DataFrame(fractions, columns=columns)
 
     @staticmethod
-    def calculate(exp_saxs, theoretical_saxs_files, receptor_concentration, ligand_concentration, n, kd_range, kd_points, session_dir, q_units):
+    def sweep(exp_saxs, theoretical_saxs_files, receptor_concentration, ligand_concentration, n, kd_range, kd_points, session_dir, q_units, completed=None):
+        """
+        Prepare the fits of one ligand concentration over the Kd grid, to be
+        advanced pass by pass with KdSweep.advance
+        Returns:
+            KdSweep whose result has the columns of calculate
+        """
+        if receptor_concentration is None:
+            raise ValueError("Receptor concentration cannot be None")
+
+        workspace = SessionWorkspace(session_dir)
+
+        grid = kd_grid(kd_range, kd_points)
+        # Only Kd values without a reusable result from a previous run are fitted
+        Kd_values, reusable = split_completed(grid, completed)
+        chi_squared_values = []
+        for Kd in Kd_values:
+            receptor_vals, ligand_free = ProteinBindingCalculation.solve_system(
+                receptor_concentration / n, ligand_concentration, Kd, n)
+
+            if not any(np.isnan(x) for x in receptor_vals + [ligand_free]):
+                receptor_fracs = [receptor_val / (ligand_free + receptor_concentration / n) for receptor_val in receptor_vals]
+                ligand_free_frac = ligand_free / (ligand_free + receptor_concentration / n)
+                chi_squared_values.append((Kd, ligand_concentration, *receptor_fracs, ligand_free_frac, sum(receptor_fracs) + ligand_free_frac))
+
+        fraction_columns = [f"receptor_{i}_frac" for i in range(n+1)] + ["ligand_free_frac"]
+        chi_squared_values = pd.DataFrame(chi_squared_values, columns=["kd","concentration"] + fraction_columns + ["total_fractions"])
+
+        # Theoretical SAXS curves are loaded once and mixed using the molecular fractions
+        basis = np.stack([load_profile(path).data[:, :2] for path in theoretical_saxs_files])
+        fits = ProfileSweep(
+            workspace, exp_saxs, ligand_concentration, chi_squared_values["kd"].tolist(),
+            chi_squared_values[fraction_columns].to_numpy(), basis, q_units)
+        return KdSweep(grid, chi_squared_values, fits, reusable, columns=["kd", "chi2", "concentration"])
+
+    @staticmethod
+    def calculate(exp_saxs, theoretical_saxs_files, receptor_concentration, ligand_concentration, n, kd_range, kd_points, session_dir, q_units, completed=None, coverage=None):
         try:
-            if receptor_concentration is None:
-                raise ValueError("Receptor concentration cannot be None")
-            
-            # Get paths for different directories within session
-            theoretical_dir = get_session_path(session_dir, 'theoretical_int')
-            fits_dir = get_session_path(session_dir, 'fits')
-            logs_dir = get_session_path(session_dir, 'logs')
-            
-            Kd_values = np.round(np.geomspace(kd_range[0], kd_range[1], num=kd_points), decimals=2)
-            chi_squared_values = []
+            # Kds left unfitted (failed, or past the time budget) keep a NaN chi²
+            return ProteinBindingCalculation.sweep(
+                exp_saxs, theoretical_saxs_files, receptor_concentration, ligand_concentration, n,
+                kd_range, kd_points, session_dir, q_units, completed
+            ).advance(coverage).result()
+        except AnalysisCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"Error in ProteinBindingCalculation: {str(e)}")
+            raise
+
+
+def stack_fractions(model_name, concentrations, kd, n, receptor_concentration=None):
+    """
+    Molecular fractions of every frame of a high-throughput series at one Kd,
+    as the single-Kd models fit them
+    Returns:
+        Array (frames, species), NaN where the system has no solution
+    """
+    rows = []
+    for concentration in concentrations:
+        if model_name == "kds_saxs_mon_oligomer":
+            M, O = MonomerOligomerCalculation.solve_system(concentration, kd, n)
+            rows.append([M / concentration, n * O / concentration])
+        else:
+            receptor_vals, ligand_free = ProteinBindingCalculation.solve_system(
+                receptor_concentration / n, concentration, kd, n)
+            total = ligand_free + receptor_concentration / n
+            rows.append([value / total for value in receptor_vals] + [ligand_free / total])
+    return np.array(rows, dtype=float)
+
+
+def fit_stack(session_dir, stack, model_name, basis, n, kd_values, q_units, receptor_concentration=None):
+    """
+    Fit every frame of a high-throughput series at every Kd, in blocks of
+    frames read from the memory-mapped stack
+    Args:
+        session_dir: session directory
+        stack: ProfileStack of the series
+        model_name: single-Kd model
+        basis: array (species, q points, 2) of theoretical profiles
+        n: stoichiometry
+        kd_values: Kd grid
+        q_units: angular units of the experimental q (-un)
+        receptor_concentration: receptor concentration of the protein binding model
+    Returns:
+        Tuple of (fractions (Kd values, frames, species); chi², scale and
+        offset as arrays (frames, Kd values), NaN where unsolved)
+    """
+    session_id = os.path.basename(session_dir)
+    concentrations = stack.metadata()["concentrations"]
+    fractions = np.stack([
+        stack_fractions(model_name, concentrations, kd, n, receptor_concentration) for kd in kd_values
+    ])
+    fitter = StackFitter(stack, basis, q_units)
+    chi_squared, scale, offset = (np.full((len(concentrations), len(kd_values)), np.nan) for _ in range(3))
+    for start in range(0, len(concentrations), STACK_BLOCK_FRAMES):
+        check_cancelled(session_id)
+        rows = slice(start, start + STACK_BLOCK_FRAMES)
+        chi_squared[rows], scale[rows], offset[rows] = fitter.fit(fractions[:, rows], rows)
+    return fractions, chi_squared, scale, offset
+
+
+def kd_label(kds):
+    """Label of a multi-Kd grid point, used in place of a single Kd in file names and results"""
+    return "_".join(str(float(kd)) for kd in kds)
+
+
+def parse_kd_label(label):
+    """Kd values of a multi-Kd grid point from its label"""
+    return [float(kd) for kd in str(label).split("_")]
+
+
+def solve_monotone(balance, upper, iterations=100):
+    """
+    Vectorized bisection for the root of increasing mass-balance functions
+    Args:
+        balance: function of an array of trial values, negative below the root
+        upper: array of upper bounds (the total concentrations)
+    Returns:
+        Array of roots in [0, upper]
+    """
+    low = np.zeros_like(upper, dtype=float)
+    high = np.array(upper, dtype=float)
+    for _ in range(iterations):
+        mid = 0.5 * (low + high)
+        below = balance(mid) < 0
+        low = np.where(below, mid, low)
+        high = np.where(below, high, mid)
+    return 0.5 * (low + high)
+
 
-            for Kd in Kd_values:
-                receptor_vals, ligand_free = ProteinBindingCalculation.solve_system(
-                    receptor_concentration / n, ligand_concentration, Kd, n)
+class ProfileSweep:
+    """
+    Mixtures of a basis of theoretical profiles fitted to one experimental
+    profile over as many calls as a coarse-to-fine search needs. The
+    checkpoint key and the checkpoint are read once, when the sweep is made.
+    Args:
+        workspace: SessionWorkspace of the session
+        exp_saxs: path to experimental SAXS file
+        concentration: concentration of the experimental profile
+        labels: Kd (or grid point label) of every mixture, used to name its fit
+        fractions: array (mixtures, species) of molecular fractions
+        basis: array (species, q points, 2) of theoretical profiles
+        q_units: angular units of the experimental q (-un)
+        n: stoichiometry, only given when several are fitted in one job
+    """
 
-                if not any(np.isnan(x) for x in receptor_vals + [ligand_free]):
-                    receptor_fracs = [receptor_val / (ligand_free + receptor_concentration / n) for receptor_val in receptor_vals]
-                    ligand_free_frac = ligand_free / (ligand_free + receptor_concentration / n)
+    def __init__(self, workspace, exp_saxs, concentration, labels, fractions, basis, q_units, n=None):
+        self.workspace = workspace
+        self.exp_saxs = exp_saxs
+        self.concentration = concentration
+        self.labels = list(labels)
+        self.fractions = np.asarray(fractions, dtype=float)
+        self.basis = basis
+        self.q_units = q_units
+        self.n = n
+        self.chi_squared = [None] * len(self.labels)
+        self.pending = set(range(len(self.labels)))
+        if not self.labels:
+            return
+        self.store = ResultStore(workspace.session_dir)
+        self.key = fingerprint(
+            experimental=content_hash(load_profile(exp_saxs).data.tobytes()),
+            basis=content_hash(np.ascontiguousarray(basis).tobytes()),
+            q_units=str(q_units),
+            backend=FIT_BACKEND,
+            projected=OLIGOMER_PROJECT_BASIS,
+        )[:16]
 
-                    # Load theoretical SAXS curves
-                    theoretical_saxs = np.zeros_like(np.loadtxt(theoretical_saxs_files[0], usecols=(0, 1)))
+        # Fits checkpointed by an interrupted run with the same inputs are not redone
+        completed = self.store.load_checkpoint(concentration, self.key)
+        self.names = [fit_name(concentration, label, n) for label in self.labels]
+        for i, name in enumerate(self.names):
+            cell = completed.get(name)
+            if cell is not None and np.allclose(cell[0], self.fractions[i]):
+                self.chi_squared[i] = cell[1]
+                self.pending.discard(i)
+        if self.pending and len(self.pending) < len(self.labels):
+            logger.info(f"Resuming {concentration}: {len(self.labels) - len(self.pending)} of {len(self.labels)} fits checkpointed")
 
-                    # Sum SAXS curves using calculated molecular fractions
-                    for j in range(n+1):
-                        theoretical_saxs += receptor_fracs[j] * np.loadtxt(theoretical_saxs_files[j], usecols=(0, 1))
+    def fit(self, order=None):
+        """
+        Fit the mixtures not fitted yet
+        Args:
+            order: indices of the mixtures to fit, in that order; all in label order if None
+        Returns:
+            List of chi² values of all mixtures, None where a fit failed or is still to do
+        """
+        if order is None:
+            order = range(len(self.labels))
+        # Fitted coarse to fine, so a time budget leaves an even coverage
+        todo = [i for i in order if i in self.pending]
+        session_id = os.path.basename(self.workspace.session_dir)
 
-                    # Add free ligand contribution
-                    theoretical_saxs += ligand_free_frac * np.loadtxt(theoretical_saxs_files[n+1], usecols=(0, 1))
+        # Native fits take milliseconds, so only ATSAS runs are checkpointed in chunks
+        step = len(todo) if FIT_BACKEND == "native" else CHECKPOINT_EVERY
+        for start in range(0, len(todo), max(step, 1)):
+            check_cancelled(session_id)
+            if budget_expired(session_id):
+                break
+            chunk = todo[start:start + step]
+            values, fits = fit_batch(self.workspace, self.exp_saxs, self.concentration,
+                                     [self.labels[i] for i in chunk], self.fractions[chunk],
+                                     self.basis, self.q_units, self.n)
+            # Fits stay in the scratch spool until one is viewed
+            self.store.spool_fits(self.concentration, self.key, fits, self.n)
+            self.store.append_checkpoint(self.concentration, self.key, [
+                (self.names[i], self.fractions[i], value) for i, value in zip(chunk, values) if value is not None
+            ])
+            for i, value in zip(chunk, values):
+                self.chi_squared[i] = value
+                self.pending.discard(i)
+        return self.chi_squared
 
-                    # Save files in session directories
-                    theoretical_file = os.path.join(theoretical_dir, f"theoretical_{Kd}.int")
-                    fit_file = os.path.join(fits_dir, f"fit_{format_concentration(ligand_concentration)}_{Kd}.fit")
-                    log_file = os.path.join(logs_dir, f"oligomer_{format_concentration(ligand_concentration)}_{Kd}.log")
 
-                    # Save theoretical intensity file in session directory
-                    np.savetxt(theoretical_file, theoretical_saxs)
-                    
-                    cmd = f"{ATSAS_PATH}/oligomer -ff {theoretical_file} {exp_saxs} --fit={fit_file} --out={log_file} -cst -ws -un={q_units}"
-                    result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=300)
-                    
-                    chi_squared = extract_chi_squared(log_file)
+def fit_profiles(workspace, exp_saxs, concentration, labels, fractions, basis, q_units, n=None, order=None):
+    """
+    Fit mixtures of a basis of theoretical profiles to an experimental profile
+    in one call; see ProfileSweep for the arguments
+    Returns:
+        List of chi² values, None where a fit failed or the time budget expired
+    """
+    return ProfileSweep(workspace, exp_saxs, concentration, labels, fractions, basis, q_units, n).fit(order)
 
-                    chi_squared_values.append((Kd, ligand_concentration, *receptor_fracs, ligand_free_frac, sum(receptor_fracs) + ligand_free_frac, chi_squared))
 
-            # Return the results in a DataFrame
-            chi_squared_values = pd.DataFrame(chi_squared_values, columns=["kd","concentration"] + [f"receptor_{i}_frac" for i in range(n+1)] + ["ligand_free_frac", "total_fractions", "chi2"])
-            chi_squared_values.fillna(0, inplace=True)
+def fit_batch(workspace, exp_saxs, concentration, labels, fractions, basis, q_units, n=None):
+    """
+    Fit mixtures with the configured backend
+    Returns:
+        Tuple of (list of chi², None where a fit failed; dict of label to fit array)
+    """
+    if FIT_BACKEND == "native":
+        # The basis is interpolated onto the experimental q grid once for all mixtures
+        return ProfileFitter(exp_saxs, basis, q_units).fits(labels, fractions)
 
-            return pd.DataFrame(chi_squared_values, columns=["kd", "chi2", "concentration"])
+    session_id = os.path.basename(workspace.session_dir)
+    if OLIGOMER_PROJECT_BASIS:
+        # The basis is interpolated onto the experimental q grid once, with the operator
+        # cached per pair of grids, so oligomer finds every experimental point on the
+        # grid of its form factor instead of interpolating again for each mixture
+        basis = project_basis(load_profile(exp_saxs).data[:, 0], basis, q_units)
+    if pool_enabled():
+        return pool_fits(session_id, exp_saxs, concentration, labels, fractions, basis, q_units, n)
+    # One matrix product builds the theoretical profiles of all mixtures
+    profiles = np.einsum("ps,sqc->pqc", fractions, basis)
+    results = []
+    with workspace.scratch(f"oligomer_{format_concentration(concentration)}") as scratch:
+        staged_exp = shutil.copy(exp_saxs, os.path.join(scratch, "experimental.dat"))
+        for label, profile in zip(labels, profiles):
+            if budget_expired(session_id):
+                break
+            results.append(run_oligomer(workspace, scratch, profile, staged_exp, concentration, label, q_units, n=n))
+    # Mixtures past the time budget are left unfitted
+    results += [(None, None)] * (len(labels) - len(results))
+    fits = {label: fit for label, (_, fit) in zip(labels, results) if fit is not None}
+    return [value for value, _ in results], fits
+
+
+def pool_fits(session_id, exp_saxs, concentration, labels, fractions, basis, q_units, n=None):
+    """
+    Fit mixtures with oligomer on the worker pool
+    Returns:
+        Tuple of (list of chi², None where a fit failed or was skipped; dict of label to fit array)
+    """
+    # Tasks only carry their molecular fractions; the profiles they are
+    # built from are shared once per analysis
+    arena = pool_arena(session_id, {
+        "experimental": load_profile(exp_saxs).data[:, :3],
+        "basis": np.asarray(basis, dtype=float),
+    })
+    tasks = [{"kind": "oligomer", "arena": arena, "fractions": row, "q_units": q_units}
+             for row in np.asarray(fractions, dtype=float)]
+    chi_squared, fits = [], {}
+    for label, result in zip(labels, run_tasks(session_id, tasks)):
+        if result is not None and result.get("chi2") is None:
+            name = f"{format_concentration(concentration)}_{label}" + (f"_n{n}" if n is not None else "")
+            logger.error(f"oligomer failed on a pool worker for {name}: {result.get('error', '').strip()}")
+        chi_squared.append(None if result is None else result.get("chi2"))
+        if result is not None and result.get("fit") is not None:
+            fits[label] = result["fit"]
+    return chi_squared, fits
+
+
+def grid_point_frame(points, concentration, fractions, fraction_columns, chi_squared_values):
+    """Results of multi-Kd grid points in the layout of the single-Kd models"""
+    df = pd.DataFrame({"kd": [kd_label(kds) for kds in points]})
+    for axis in range(points.shape[1]):
+        df[f"kd_{axis + 1}"] = points[:, axis]
+    df["concentration"] = concentration
+    for column, values in zip(fraction_columns, fractions.T):
+        df[column] = values
+    df["chi2"] = np.array(chi_squared_values, dtype=float)
+    return df
+
+
+class SequentialOligomerCalculation:
+    """
+    Stepwise association M ⇌ D ⇌ T ⇌ ... up to an n-mer, with one Kd per step:
+    Kd_k = [M][O_(k-1)] / [O_k] for k = 2..n
+    """
+
+    @staticmethod
+    def solve_system(concentration, kds):
+        """
+        Species concentrations for many sets of stepwise Kds at once
+        Args:
+            concentration: total monomer concentration
+            kds: array of shape (points, n - 1)
+        Returns:
+            Array of shape (points, n) with [M], [D], [T], ...
+        """
+        kds = np.atleast_2d(kds)
+        # O_k = M^k / (Kd_2 ... Kd_k)
+        products = np.hstack([np.ones((len(kds), 1)), np.cumprod(kds, axis=1)])
+        orders = np.arange(1, products.shape[1] + 1)
+
+        def balance(M):
+            return np.sum(orders * M[:, None] ** orders / products, axis=1) - concentration
+
+        M = solve_monotone(balance, np.full(len(kds), float(concentration)))
+        return M[:, None] ** orders / products
+
+    @staticmethod
+    def fractions(concentration, kds):
+        """Fraction of monomer units in each species, shape (points, n)"""
+        species = SequentialOligomerCalculation.solve_system(concentration, kds)
+        return species * np.arange(1, species.shape[1] + 1) / concentration
+
+    @staticmethod
+    def species_columns(n):
+        return ["mon_frac"] + [f"oligomer_{k}_frac" for k in range(2, n + 1)]
+
+    @staticmethod
+    def calculate(exp_saxs, theoretical_saxs_files, concentration, n, points, session_dir, q_units):
+        """
+        Fit the experimental profile at every grid point of stepwise Kds
+        Args:
+            points: array of shape (points, n - 1) with Kd_2 .. Kd_n
+        Returns:
+            DataFrame with one row per grid point
+        """
+        try:
+            workspace = SessionWorkspace(session_dir)
+            points = np.atleast_2d(points)
+
+            basis = np.stack([load_profile(path).data[:, :2] for path in theoretical_saxs_files])
+            fractions = SequentialOligomerCalculation.fractions(concentration, points)
+
+            chi_squared_values = fit_profiles(workspace, exp_saxs, concentration,
+                                              [kd_label(kds) for kds in points], fractions, basis, q_units)
+            return grid_point_frame(points, concentration, fractions,
+                                    SequentialOligomerCalculation.species_columns(n), chi_squared_values)
+        except AnalysisCancelled:
+            raise
         except Exception as e:
-            logger.error(f"Error in ProteinBindingCalculation: {str(e)}")
+            logger.error(f"Error in SequentialOligomerCalculation: {str(e)}")
             raise
+
+    @staticmethod
+    def calculate_fractions(kds, concentration_range, n):
+        fractions = np.vstack([
+            SequentialOligomerCalculation.fractions(concentration, kds)[0]
+            for concentration in concentration_range
+        ])
+        columns = ['monomer_fraction'] + [f'oligomer_{k}_fraction' for k in range(2, n + 1)]
+        df = pd.DataFrame(fractions, columns=columns)
+        df.insert(0, 'concentration', concentration_range)
+        return df
+
+
+class CooperativeBindingCalculation:
+    """
+    n-site binding with a distinct intrinsic Kd per binding step. With all
+    Kds equal this reduces to the statistical model of ProteinBindingCalculation.
+    """
+
+    @staticmethod
+    def solve_system(receptor_concentration, ligand_concentration, kds):
+        """
+        Receptor species and free ligand for many sets of per-step Kds at once
+        Args:
+            receptor_concentration: total receptor concentration
+            ligand_concentration: total ligand concentration
+            kds: array of shape (points, n) with the intrinsic Kd of each step
+        Returns:
+            Tuple of (receptor species of shape (points, n + 1), free ligand of shape (points,))
+        """
+        kds = np.atleast_2d(kds)
+        n = kds.shape[1]
+        steps = np.arange(1, n + 1)
+        # Macroscopic stepwise constants, as in the statistical model
+        cumulative = np.cumprod(kds * steps / (n - steps + 1), axis=1)
+        cumulative = np.hstack([np.ones((len(kds), 1)), cumulative])
+        bound = np.arange(n + 1)
+
+        def weights(L):
+            return L[:, None] ** bound / cumulative
+
+        def balance(L):
+            w = weights(L)
+            return L + receptor_concentration * np.sum(bound * w, axis=1) / np.sum(w, axis=1) - ligand_concentration
+
+        ligand_free = solve_monotone(balance, np.full(len(kds), float(ligand_concentration)))
+        w = weights(ligand_free)
+        receptor_vals = receptor_concentration * w / np.sum(w, axis=1, keepdims=True)
+        return receptor_vals, ligand_free
+
+    @staticmethod
+    def fractions(receptor_concentration, ligand_concentration, kds):
+        """Receptor species and free ligand fractions, shape (points, n + 2)"""
+        receptor_vals, ligand_free = CooperativeBindingCalculation.solve_system(
+            receptor_concentration, ligand_concentration, kds)
+        total = (ligand_free + receptor_concentration)[:, None]
+        return np.hstack([receptor_vals, ligand_free[:, None]]) / total
+
+    @staticmethod
+    def species_columns(n):
+        return [f"receptor_{i}_frac" for i in range(n + 1)] + ["ligand_free_frac"]
+
+    @staticmethod
+    def calculate(exp_saxs, theoretical_saxs_files, receptor_concentration, ligand_concentration, n, points, session_dir, q_units):
+        """
+        Fit the experimental profile at every grid point of per-step Kds
+        Args:
+            points: array of shape (points, n) with Kd_1 .. Kd_n
+        Returns:
+            DataFrame with one row per grid point
+        """
+        try:
+            if receptor_concentration is None:
+                raise ValueError("Receptor concentration cannot be None")
+
+            workspace = SessionWorkspace(session_dir)
+            points = np.atleast_2d(points)
+
+            basis = np.stack([load_profile(path).data[:, :2] for path in theoretical_saxs_files])
+            fractions = CooperativeBindingCalculation.fractions(
+                receptor_concentration / n, ligand_concentration, points)
+
+            chi_squared_values = fit_profiles(workspace, exp_saxs, ligand_concentration,
+                                              [kd_label(kds) for kds in points], fractions, basis, q_units)
+            return grid_point_frame(points, ligand_concentration, fractions,
+                                    CooperativeBindingCalculation.species_columns(n), chi_squared_values)
+        except AnalysisCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"Error in CooperativeBindingCalculation: {str(e)}")
+            raise
+
+    @staticmethod
+    def calculate_fractions(kds, concentration_range, n, receptor_concentration):
+        fractions = np.vstack([
+            CooperativeBindingCalculation.fractions(receptor_concentration / n, ligand_concentration, kds)[0]
+            for ligand_concentration in concentration_range
+        ])
+        columns = [f'receptor_{i}_frac' for i in range(n + 1)] + ['ligand_free_frac']
+        df = pd.DataFrame(fractions, columns=columns)
+        df.insert(0, 'concentration', concentration_range)
+        return df
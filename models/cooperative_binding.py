@@ -0,0 +1,13 @@
+# models/cooperative_binding.py
+from .base_model import SAXSModel
+from .calculations import CooperativeBindingCalculation
+
+class CooperativeBindingModel(SAXSModel):
+    @staticmethod
+    def kd_dimensions(n):
+        return n
+
+    def calculate(self, exp_saxs, theoretical_saxs_files, receptor_concentration, ligand_concentration, n, points, session_dir, q_units):
+        if len(theoretical_saxs_files) != n + 2:
+            raise ValueError(f"Expected {n+2} theoretical SAXS profiles for stoichiometry {n}, but got {len(theoretical_saxs_files)}")
+        return CooperativeBindingCalculation.calculate(exp_saxs, theoretical_saxs_files, receptor_concentration, ligand_concentration, n, points, session_dir, q_units)
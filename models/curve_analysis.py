@@ -1,11 +1,10 @@
 from dataclasses import dataclass
-from typing import Tuple, List
+from typing import Dict, List, Optional, Tuple, Union
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from scipy.interpolate import interp1d
 from scipy.signal import savgol_filter
-from scipy.stats import norm
-from scipy.special import logsumexp
 
 
 @dataclass
@@ -18,18 +17,31 @@ class LCurveResult:
     change_points: List[float]
 
 
+@dataclass
+class LCurveSummary:
+    average: LCurveResult
+    per_concentration: Dict[str, LCurveResult]
+    bootstrap_kds: np.ndarray
+
+
 class LCurveAnalysis:
+    # Fewest Kd values the cubic interpolation of an L-curve can go through
+    MIN_POINTS = 4
+
     @staticmethod
     def calculate_curvature(
         x: np.ndarray, y: np.ndarray
     ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
-        """Calculate curvature of the L-curve in log-log space with improved smoothing"""
+        """Calculate curvature of the L-curve in log-log space with improved smoothing.
+
+        y may hold one curve or a 2-D array with one curve per row, all sampled at x.
+        """
         # Convert to log space
         log_x = np.log10(x)
         log_y = np.log10(y)
 
         # Use fewer points for faster interpolation
-        f = interp1d(log_x, log_y, kind="cubic", bounds_error=False)
+        f = interp1d(log_x, log_y, kind="cubic", axis=-1, bounds_error=False)
         x_smooth = np.linspace(log_x.min(), log_x.max(), 500) 
         y_smooth = f(x_smooth)
 
@@ -37,93 +49,160 @@ class LCurveAnalysis:
         order = 3
 
         dx = savgol_filter(np.gradient(x_smooth), window, order)
-        dy = savgol_filter(np.gradient(y_smooth), window, order)
+        dy = savgol_filter(np.gradient(y_smooth, axis=-1), window, order, axis=-1)
         d2x = savgol_filter(np.gradient(dx), window, order)
-        d2y = savgol_filter(np.gradient(dy), window, order)
+        d2y = savgol_filter(np.gradient(dy, axis=-1), window, order, axis=-1)
 
         # Calculate curvature with improved numerical stability
         num = np.abs(dx * d2y - dy * d2x)
         denom = (dx * dx + dy * dy) ** 1.5
-        curvature = np.where(denom > 1e-10, num / denom, 0)
+        curvature = np.where(denom > 1e-10, num / np.where(denom > 1e-10, denom, 1), 0)
 
         return x_smooth, y_smooth, curvature
 
     @staticmethod
-    def bayesian_change_point(x: np.ndarray, y: np.ndarray, max_points: int = 3) -> List[int]:
-        """Detect change points using optimized Bayesian inference"""
+    def local_scores(y: np.ndarray, window_size: int) -> np.ndarray:
+        """Gaussian log-likelihood of every sliding window, for one curve or one per row"""
+        # Strided view of all windows at once instead of slicing in a loop
+        segments = sliding_window_view(y, window_size, axis=-1)[..., : y.shape[-1] - window_size, :]
+        mu = segments.mean(axis=-1)
+        var = segments.var(axis=-1)
+        sigma = np.sqrt(var) + 1e-8
+
+        # Closed form of sum(norm.logpdf(segment, mu, sigma)) over each window
+        return -0.5 * window_size * (np.log(2 * np.pi) + 2 * np.log(sigma) + var / sigma**2)
+
+    @staticmethod
+    def bayesian_change_point(x: np.ndarray, y: np.ndarray, max_points: int = 3) -> List:
+        """Detect change points using optimized Bayesian inference.
+
+        Returns a list of indices, or one list per row when y is 2-D.
+        """
         n = len(x)
         window_size = min(20, n // 4)  # Adaptive window size
         min_separation = window_size // 2  # Minimum distance between change points
-        change_points = []
-        
-        # Calculate local statistics using sliding window
-        local_scores = np.zeros(n - window_size)
-        for i in range(len(local_scores)):
-            segment = y[i:i + window_size]
-            mu = np.mean(segment)
-            sigma = np.std(segment) + 1e-8
-            local_scores[i] = np.sum(norm.logpdf(segment, mu, sigma))
 
         # Find potential change points using local score differences
-        score_diff = np.abs(np.gradient(local_scores))
-        threshold = np.mean(score_diff) + 2 * np.std(score_diff)
-        
-        # Get candidate change points
-        candidates = np.where(score_diff > threshold)[0]
-        
-        # Filter candidates based on minimum separation
-        if len(candidates) > 0:
-            filtered_points = [candidates[0]]
-            for point in candidates[1:]:
-                if point - filtered_points[-1] >= min_separation:
-                    filtered_points.append(point)
-                if len(filtered_points) >= max_points:
-                    break
-            
-            change_points = sorted(filtered_points)
-
-        return change_points
+        score_diff = np.abs(np.gradient(LCurveAnalysis.local_scores(y, window_size), axis=-1))
+        threshold = np.mean(score_diff, axis=-1, keepdims=True) + 2 * np.std(score_diff, axis=-1, keepdims=True)
+        above = score_diff > threshold
+
+        all_change_points = []
+        for row in np.atleast_2d(above):
+            # Get candidate change points
+            candidates = np.flatnonzero(row)
+            change_points = []
+
+            # Filter candidates based on minimum separation
+            if len(candidates) > 0:
+                filtered_points = [candidates[0]]
+                for point in candidates[1:]:
+                    if point - filtered_points[-1] >= min_separation:
+                        filtered_points.append(point)
+                    if len(filtered_points) >= max_points:
+                        break
+
+                change_points = sorted(filtered_points)
+            all_change_points.append(change_points)
+
+        return all_change_points if y.ndim > 1 else all_change_points[0]
 
     @staticmethod
-    def analyze(kd_values: np.ndarray, chi2_values: np.ndarray) -> LCurveResult:
-        """Perform L-curve analysis using Bayesian change point detection"""
+    def analyze(kd_values: np.ndarray, chi2_values: np.ndarray) -> Union[LCurveResult, List[LCurveResult]]:
+        """Perform L-curve analysis using Bayesian change point detection.
+
+        chi2_values may be a single curve or a 2-D array with one curve per row
+        (e.g. one per concentration or bootstrap replicate), analysed in one pass.
+        """
+        batched = np.ndim(chi2_values) > 1
+        chi2_values = np.atleast_2d(chi2_values)
+
         x_smooth, y_smooth, curvature = LCurveAnalysis.calculate_curvature(
             kd_values, chi2_values
         )
 
         # Apply smoothing to curvature
-        curvature_smooth = savgol_filter(curvature, 51, 3)
+        curvature_smooth = savgol_filter(curvature, 51, 3, axis=-1)
 
         # Detect change points in curvature
         change_points = LCurveAnalysis.bayesian_change_point(x_smooth, curvature_smooth)
 
         # Find region with maximum curvature
-        max_curv_idx = np.nanargmax(curvature_smooth)
+        max_curv_idx = np.nanargmax(curvature_smooth, axis=-1)
         optimal_kd = 10 ** x_smooth[max_curv_idx]
 
         # Use change points to define transition region
-        cp_before = max([cp for cp in change_points if cp < max_curv_idx], default=0)
-        cp_after = min([cp for cp in change_points if cp > max_curv_idx], default=len(x_smooth)-1)
-        
-        # Extract transition region
-        transition_region = curvature_smooth[cp_before:cp_after]
-        transition_x = x_smooth[cp_before:cp_after]
+        cp_before = np.array([
+            max([cp for cp in cps if cp < idx], default=0)
+            for cps, idx in zip(change_points, max_curv_idx)
+        ])
+        cp_after = np.array([
+            min([cp for cp in cps if cp > idx], default=len(x_smooth) - 1)
+            for cps, idx in zip(change_points, max_curv_idx)
+        ])
 
         # Calculate weighted error based on curvature in transition region
-        weights = transition_region / np.max(transition_region)
-        weighted_mean = np.average(transition_x, weights=weights)
+        positions = np.arange(len(x_smooth))
+        in_region = (positions >= cp_before[:, None]) & (positions < cp_after[:, None])
+        transition_region = np.where(in_region, curvature_smooth, 0)
+        weights = transition_region / np.max(transition_region, axis=-1, keepdims=True)
+        weighted_mean = np.sum(weights * x_smooth, axis=-1) / np.sum(weights, axis=-1)
         weighted_std = np.sqrt(
-            np.average((transition_x - weighted_mean) ** 2, weights=weights)
+            np.sum(weights * (x_smooth - weighted_mean[:, None]) ** 2, axis=-1) / np.sum(weights, axis=-1)
         )
 
         # Convert from log space to linear space for error
         kd_error = (10**weighted_std - 1) * optimal_kd
 
-        return LCurveResult(
-            optimal_kd=optimal_kd,
-            kd_error=kd_error,
-            curvature=curvature_smooth,
-            x_smooth=x_smooth,
-            y_smooth=y_smooth,
-            change_points=[10 ** x_smooth[cp] for cp in change_points]
-        )
+        results = [
+            LCurveResult(
+                optimal_kd=optimal_kd[i],
+                kd_error=kd_error[i],
+                curvature=curvature_smooth[i],
+                x_smooth=x_smooth,
+                y_smooth=y_smooth[i],
+                change_points=[10 ** x_smooth[cp] for cp in change_points[i]]
+            )
+            for i in range(len(chi2_values))
+        ]
+        return results if batched else results[0]
+
+    @staticmethod
+    def bootstrap(kd_values: np.ndarray, chi2_values: np.ndarray, n_replicates: int = 200,
+                  seed: int = 0) -> np.ndarray:
+        """Optimal Kd of bootstrap replicates of the average chi² curve.
+
+        Concentrations (rows of chi2_values) are resampled with replacement and
+        all replicate averages are analysed in a single batched call.
+        """
+        rng = np.random.default_rng(seed)
+        samples = rng.integers(0, len(chi2_values), size=(n_replicates, len(chi2_values)))
+        replicates = chi2_values[samples].mean(axis=1)
+        return np.array([result.optimal_kd for result in LCurveAnalysis.analyze(kd_values, replicates)])
+
+    @staticmethod
+    def analyze_results(chi_squared_values, n_replicates: int = 100) -> Optional[LCurveSummary]:
+        """L-curve analysis of the average, of every concentration and of bootstrap replicates.
+
+        chi_squared_values is the concatenated results table with kd, concentration and chi2.
+        Returns None if fewer than MIN_POINTS Kd values were fitted, e.g. when the time
+        budget of an analysis expired after the first coarse pass.
+        """
+        avg_chi_squared = chi_squared_values.groupby('kd')['chi2'].mean().dropna()
+        if len(avg_chi_squared) < LCurveAnalysis.MIN_POINTS:
+            return None
+        average = LCurveAnalysis.analyze(avg_chi_squared.index.values, avg_chi_squared.values)
+
+        # Only Kd values computed for every concentration can be compared row by row
+        chi2_matrix = chi_squared_values.pivot_table(
+            index='concentration', columns='kd', values='chi2'
+        ).dropna(axis=1)
+        if chi2_matrix.shape[1] < LCurveAnalysis.MIN_POINTS:
+            return LCurveSummary(average, {}, np.array([average.optimal_kd]))
+
+        kd_values = chi2_matrix.columns.values
+        per_concentration = dict(zip(
+            chi2_matrix.index, LCurveAnalysis.analyze(kd_values, chi2_matrix.values)
+        ))
+        bootstrap_kds = LCurveAnalysis.bootstrap(kd_values, chi2_matrix.values, n_replicates)
+        return LCurveSummary(average, per_concentration, bootstrap_kds)
@@ -1,6 +1,13 @@
 # models/model_factory.py
 from .monomer_oligomer import MonomerOligomerModel
 from .protein_binding import ProteinBindingModel
+from .sequential_oligomer import SequentialOligomerModel
+from .cooperative_binding import CooperativeBindingModel
+
+MULTI_KD_MODELS = {
+    'kds_saxs_sequential_oligomer': SequentialOligomerModel,
+    'kds_saxs_cooperative_binding': CooperativeBindingModel,
+}
 
 class ModelFactory:
     @staticmethod
@@ -9,5 +16,14 @@ class ModelFactory:
             return MonomerOligomerModel()
         elif model_name == 'kds_saxs_oligomer_fitting':
             return ProteinBindingModel()
+        elif model_name in MULTI_KD_MODELS:
+            return MULTI_KD_MODELS[model_name]()
         else:
             raise ValueError(f"Unknown model: {model_name}")
+
+    @staticmethod
+    def kd_dimensions(model_name, n):
+        """Number of Kds a model fits for stoichiometry n"""
+        if model_name in MULTI_KD_MODELS:
+            return MULTI_KD_MODELS[model_name].kd_dimensions(n)
+        return 1
@@ -3,5 +3,14 @@ from .base_model import SAXSModel
 from .calculations import MonomerOligomerCalculation
 
 class MonomerOligomerModel(SAXSModel):
-    def calculate(self, exp_saxs, mon_avg_int, dim_avg_int, concentration, n, kd_range, kd_points, session_dir, q_units):
-        return MonomerOligomerCalculation.calculate(exp_saxs, mon_avg_int, dim_avg_int, concentration, n, kd_range, kd_points, session_dir, q_units)
+    def calculate(self, exp_saxs, mon_avg_int, dim_avg_int, concentration, n, kd_range, kd_points, session_dir, q_units, completed=None, coverage=None):
+        return MonomerOligomerCalculation.calculate(exp_saxs, mon_avg_int, dim_avg_int, concentration, n, kd_range, kd_points, session_dir, q_units, completed, coverage)
+
+    def sweep(self, exp_saxs, mon_avg_int, dim_avg_int, concentration, n, kd_range, kd_points, session_dir, q_units, completed=None):
+        return MonomerOligomerCalculation.sweep(exp_saxs, mon_avg_int, dim_avg_int, concentration, n, kd_range, kd_points, session_dir, q_units, completed)
+
+    def sweep_scan(self, exp_saxs, mon_avg_int, dim_avg_int, concentration, n_values, kd_range, kd_points, session_dir, q_units):
+        return MonomerOligomerCalculation.sweep_scan(exp_saxs, mon_avg_int, dim_avg_int, concentration, n_values, kd_range, kd_points, session_dir, q_units)
+
+    def calculate_scan(self, exp_saxs, mon_avg_int, dim_avg_int, concentration, n_values, kd_range, kd_points, session_dir, q_units, coverage=None):
+        return MonomerOligomerCalculation.calculate_scan(exp_saxs, mon_avg_int, dim_avg_int, concentration, n_values, kd_range, kd_points, session_dir, q_units, coverage)
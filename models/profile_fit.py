@@ -0,0 +1,231 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from config import OPERATOR_CACHE_SIZE
+from scripts.saxs_parser import load_profile
+
+# Factor converting experimental q to the Å⁻¹ of CRYSOL profiles, by oligomer -un value
+Q_UNIT_SCALE = {"1": 1.0, "2": 0.1}
+
+
+def interpolation_operator(source_q, target_q):
+    """
+    Sparse matrix of linear interpolation from one q grid to another
+    Args:
+        source_q: increasing q values of the theoretical profiles
+        target_q: q values to interpolate at, all within the source range
+    Returns:
+        CSR matrix of shape (len(target_q), len(source_q)), two entries per row
+    """
+    left = np.clip(np.searchsorted(source_q, target_q, side="right") - 1, 0, len(source_q) - 2)
+    weight = (target_q - source_q[left]) / (source_q[left + 1] - source_q[left])
+    rows = np.repeat(np.arange(len(target_q)), 2)
+    cols = np.column_stack([left, left + 1]).ravel()
+    data = np.column_stack([1 - weight, weight]).ravel()
+    return csr_matrix((data, (rows, cols)), shape=(len(target_q), len(source_q)))
+
+
+class OperatorCache:
+    """
+    Interpolation operators by (theoretical grid, experimental grid, q units).
+
+    Every Kd and concentration of an analysis reuses the operator of its grid
+    pair, and so do later analyses of the same files in this worker.
+    """
+
+    def __init__(self, max_size=OPERATOR_CACHE_SIZE):
+        self.max_size = max_size
+        self._operators = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(source_q, exp_q, q_units):
+        digest = hashlib.sha256(np.ascontiguousarray(source_q).tobytes())
+        digest.update(np.ascontiguousarray(exp_q).tobytes())
+        digest.update(str(q_units).encode())
+        return digest.hexdigest()
+
+    def get(self, source_q, exp_q, q_units):
+        """
+        Returns:
+            Tuple of (operator, mask of experimental points inside the theoretical q range)
+        """
+        key = self._key(source_q, exp_q, q_units)
+        with self._lock:
+            if key in self._operators:
+                self._operators.move_to_end(key)
+                return self._operators[key]
+
+        q = exp_q * Q_UNIT_SCALE.get(str(q_units), 1.0)
+        mask = (q >= source_q[0]) & (q <= source_q[-1])
+        entry = (interpolation_operator(source_q, q[mask]), mask)
+
+        with self._lock:
+            self._operators[key] = entry
+            if len(self._operators) > self.max_size:
+                self._operators.popitem(last=False)
+        return entry
+
+
+operator_cache = OperatorCache()
+
+
+def project_basis(exp_q, basis, q_units):
+    """
+    Theoretical profiles interpolated onto an experimental q grid, with the
+    operator cached for the pair of grids
+    Args:
+        exp_q: q values of the experimental profile
+        basis: array (species, q points, 2) of theoretical profiles on one grid
+        q_units: angular units of the experimental q, as for oligomer -un
+    Returns:
+        Array (species, q points, 2) with q in Å⁻¹: the experimental points
+        inside the theoretical q range, framed by the theoretical points just
+        outside it, so a program interpolating again (oligomer) still finds
+        the end points inside the grid after rounding q
+    """
+    source_q = basis[0, :, 0]
+    operator, mask = operator_cache.get(source_q, exp_q, q_units)
+    q = exp_q[mask] * Q_UNIT_SCALE.get(str(q_units), 1.0)
+    intensity = (operator @ basis[:, :, 1].T).T
+
+    outside = np.concatenate([
+        np.flatnonzero(source_q < q[0])[-1:],
+        np.flatnonzero(source_q > q[-1])[:1],
+    ])
+    order = np.argsort(np.concatenate([q, source_q[outside]]), kind="stable")
+    q = np.concatenate([q, source_q[outside]])[order]
+    intensity = np.concatenate([intensity, basis[:, outside, 1]], axis=1)[:, order]
+    return np.stack([np.broadcast_to(q, intensity.shape), intensity], axis=-1)
+
+
+def scale_offset_fit(model, intensity, sigma):
+    """
+    Closed-form weighted least squares of intensity ≈ scale * model + offset,
+    row by row, as oligomer -cst -ws fits; the scale is kept non-negative,
+    like oligomer's volume fractions
+    Args:
+        model: array (mixtures, q points) of theoretical intensities
+        intensity: experimental intensities, (q points) or one row per mixture
+        sigma: experimental errors, shaped like intensity
+    Returns:
+        Tuple of arrays (reduced chi², scale, offset), one value per mixture
+    """
+    weights = 1 / sigma ** 2
+    sw = weights.sum(axis=-1)
+    sx = (model * weights).sum(axis=-1)
+    sy = (weights * intensity).sum(axis=-1)
+    sxx = (model ** 2 * weights).sum(axis=-1)
+    sxy = (model * weights * intensity).sum(axis=-1)
+    scale = (sw * sxy - sx * sy) / (sw * sxx - sx ** 2)
+    # A negative scale means the best non-negative fit is the constant alone
+    scale = np.maximum(scale, 0)
+    offset = (sy - scale * sx) / sw
+
+    fitted = scale[:, None] * model + offset[:, None]
+    # Points with infinite errors (outside a frame's q range) do not count;
+    # a frame with no measured point left has no χ² rather than a negative one
+    degrees = np.count_nonzero(weights, axis=-1) - 1
+    chi_squared = (((intensity - fitted) / sigma) ** 2).sum(axis=-1) / np.where(degrees > 0, degrees, np.nan)
+    return chi_squared, scale, offset
+
+
+class ProfileFitter:
+    """
+    Fits mixtures of a basis of theoretical profiles to one experimental profile
+    without ATSAS: the basis is interpolated onto the experimental grid once and
+    every mixture is scaled with a constant offset by weighted least squares, as
+    oligomer -cst -ws does.
+    """
+
+    def __init__(self, exp_saxs, basis, q_units):
+        """
+        Args:
+            exp_saxs: path to experimental SAXS file (q, I, sigma)
+            basis: array (species, q points, 2) of theoretical profiles on one grid
+            q_units: angular units of the experimental q, as for oligomer -un
+        """
+        experimental = load_profile(exp_saxs).data
+        operator, mask = operator_cache.get(basis[0, :, 0], experimental[:, 0], q_units)
+        self.experimental = experimental[mask, :3]
+        self.projected = operator @ basis[:, :, 1].T
+
+    def fit(self, fractions):
+        """
+        Args:
+            fractions: array (mixtures, species)
+        Returns:
+            Tuple of (reduced chi² per mixture, fitted intensities (mixtures, q points))
+        """
+        _, intensity, sigma = self.experimental.T
+        model = (self.projected @ np.asarray(fractions).T).T
+        chi_squared, scale, offset = scale_offset_fit(model, intensity, sigma)
+        return chi_squared, scale[:, None] * model + offset[:, None]
+
+    def fits(self, labels, fractions):
+        """
+        Fit every mixture
+        Returns:
+            Tuple of (list of chi² values, dict of label to fit as array of s, Iexp, sigma and Ifit)
+        """
+        chi_squared, fitted = self.fit(fractions)
+        q, intensity, sigma = self.experimental.T
+        fits = {label: np.column_stack([q, intensity, sigma, fit]) for label, fit in zip(labels, fitted)}
+        return [float(value) for value in chi_squared], fits
+
+
+class StackFitter:
+    """
+    Fits a high-throughput series of profiles on one q grid, one mixture per
+    frame at a time: the basis is interpolated onto the grid once and every
+    block of frames is fitted in a few array operations per Kd.
+    """
+
+    def __init__(self, stack, basis, q_units):
+        """
+        Args:
+            stack: ProfileStack of the series
+            basis: array (species, q points, 2) of theoretical profiles on one grid
+            q_units: angular units of the experimental q, as for oligomer -un
+        """
+        self.stack = stack
+        self.q = stack.q
+        operator, self.mask = operator_cache.get(basis[0, :, 0], self.q, q_units)
+        self.projected = operator @ basis[:, :, 1].T
+
+    def fit(self, fractions, rows):
+        """
+        Fit a block of frames at every Kd
+        Args:
+            fractions: array (Kd values, frames of the block, species)
+            rows: slice of the frames in the stack
+        Returns:
+            Tuple of arrays (frames of the block, Kd values) of reduced chi², scale and offset
+        """
+        intensity = self.stack.intensity[rows][:, self.mask]
+        sigma = self.stack.sigma[rows][:, self.mask]
+        results = [
+            scale_offset_fit(block_fractions @ self.projected.T, intensity, sigma)
+            for block_fractions in fractions
+        ]
+        return tuple(np.stack(values, axis=1) for values in zip(*results))
+
+    def fit_curve(self, frame, fractions, scale, offset):
+        """
+        Fit of one frame, rebuilt from its fitted parameters
+        Returns:
+            Array of s, Iexp, sigma and Ifit
+        """
+        model = self.projected @ np.asarray(fractions)
+        sigma = self.stack.sigma[frame][self.mask]
+        measured = np.isfinite(sigma)
+        return np.column_stack([
+            self.q[self.mask],
+            self.stack.intensity[frame][self.mask],
+            sigma,
+            scale * model + offset,
+        ])[measured]
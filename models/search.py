@@ -0,0 +1,75 @@
+import itertools
+
+import numpy as np
+
+from config import SEARCH_COARSE_BUDGET, SEARCH_REFINE_LEVELS, SEARCH_REFINE_POINTS
+from scripts.error_handling import logger
+
+
+class CoarseToFineSearch:
+    """
+    Search over several Kds at once without an exhaustive grid.
+
+    A coarse log-spaced grid covers the whole Kd range; the box around the best
+    point is then refined with a finer local grid a few times. Every grid point
+    costs one ATSAS call per concentration, so points are evaluated in batches
+    and never twice.
+    """
+
+    def __init__(self, kd_range, dimensions, kd_points,
+                 coarse_budget=SEARCH_COARSE_BUDGET,
+                 refine_points=SEARCH_REFINE_POINTS,
+                 levels=SEARCH_REFINE_LEVELS):
+        self.log_range = np.log10(kd_range)
+        self.dimensions = dimensions
+        # Keep the coarse grid within budget as the number of Kds grows
+        self.coarse_points = int(min(kd_points, max(3, np.floor(coarse_budget ** (1 / dimensions)))))
+        self.refine_points = refine_points
+        self.levels = levels
+
+    def _grid(self, axes):
+        points = np.array(list(itertools.product(*axes)))
+        return np.unique(np.round(10 ** points, decimals=2), axis=0)
+
+    def coarse_grid(self):
+        axis = np.linspace(*self.log_range, self.coarse_points)
+        return self._grid([axis] * self.dimensions)
+
+    def refine_grid(self, center, step):
+        """Local grid spanning one step of the previous level around center"""
+        axes = []
+        for value in np.log10(center):
+            low = max(value - step, self.log_range[0])
+            high = min(value + step, self.log_range[1])
+            axes.append(np.linspace(low, high, self.refine_points))
+        return self._grid(axes)
+
+    def run(self, evaluate):
+        """
+        Args:
+            evaluate: function of an array of Kd tuples (points, dimensions)
+                returning the objective of each point, NaN where it failed
+        Returns:
+            Tuple of (best Kd tuple, array of all evaluated points)
+        """
+        evaluated = {}
+        points = self.coarse_grid()
+        step = np.diff(self.log_range)[0] / (self.coarse_points - 1)
+
+        for level in range(self.levels + 1):
+            new_points = np.array([p for p in points if tuple(p) not in evaluated])
+            if len(new_points):
+                values = np.asarray(evaluate(new_points), dtype=float)
+                evaluated.update(zip(map(tuple, new_points), values))
+            logger.debug(f"Search level {level}: {len(new_points)} new points, {len(evaluated)} in total")
+
+            scores = {p: v for p, v in evaluated.items() if np.isfinite(v)}
+            if not scores:
+                break
+            best = min(scores, key=scores.get)
+            points = self.refine_grid(best, step)
+            step = 2 * step / (self.refine_points - 1)
+
+        scores = {p: v for p, v in evaluated.items() if np.isfinite(v)}
+        best = min(scores, key=scores.get) if scores else None
+        return best, np.array(list(evaluated))
@@ -0,0 +1,13 @@
+# models/sequential_oligomer.py
+from .base_model import SAXSModel
+from .calculations import SequentialOligomerCalculation
+
+class SequentialOligomerModel(SAXSModel):
+    @staticmethod
+    def kd_dimensions(n):
+        return n - 1
+
+    def calculate(self, exp_saxs, theoretical_saxs_files, concentration, n, points, session_dir, q_units):
+        if len(theoretical_saxs_files) != n:
+            raise ValueError(f"Expected {n} theoretical SAXS profiles up to the {n}-mer, but got {len(theoretical_saxs_files)}")
+        return SequentialOligomerCalculation.calculate(exp_saxs, theoretical_saxs_files, concentration, n, points, session_dir, q_units)
@@ -6,25 +6,177 @@ import dash_bootstrap_components as dbc
 import os
 import numpy as np
 import pandas as pd
-from models.calculations import MonomerOligomerCalculation, ProteinBindingCalculation
+from models.calculations import (MonomerOligomerCalculation, ProteinBindingCalculation, SequentialOligomerCalculation,
+                                 CooperativeBindingCalculation, parse_kd_label)
 import plotly.io as pio
 import plotly.express as px
+from plotly.colors import DEFAULT_PLOTLY_COLORS
+from config import STACK_FITS_PER_PAGE
 from scripts.utils import format_concentration, save_file, get_session_path
 from models.calculations import extract_chi_squared
 from scripts.error_handling import logger
 from models.curve_analysis import LCurveAnalysis
+from scripts.profile_stack import ProfileStack
+from scripts.result_store import ResultStore
+from scripts.saxs_parser import load_profile
 
-def create_chi_squared_plot(results, concentration_colors, units='µM'):
+def format_kd(kd):
+    """Kd for display; multi-Kd grid points show all their Kds"""
+    if isinstance(kd, str):
+        return '(' + ', '.join(f'{value:.2f}' for value in parse_kd_label(kd)) + ')'
+    return f'{kd:.2f}'
+
+def create_chi_squared_heatmap(results, units='µM'):
+    """
+    Average χ² of a multi-Kd search over the first two Kds. With a third Kd
+    every cell shows the lowest χ² over it; clicking a cell selects that grid point.
+    """
+    if not results:
+        return go.Figure()
+
+    chi_squared_values = pd.concat(results)
+    kd_columns = sorted(column for column in chi_squared_values.columns if column.startswith('kd_'))
+    average = chi_squared_values.groupby('kd', as_index=False).agg(
+        {**{column: 'first' for column in kd_columns}, 'chi2': 'mean'}).dropna(subset=['chi2'])
+
+    # Best grid point of every (Kd_1, Kd_2) cell
+    cells = average.loc[average.groupby(kd_columns[:2])['chi2'].idxmin()]
+    x_values = np.sort(cells[kd_columns[0]].unique())
+    y_values = np.sort(cells[kd_columns[1]].unique())
+    z = np.full((len(y_values), len(x_values)), np.nan)
+    labels = np.full(z.shape, None, dtype=object)
+    for _, cell in cells.iterrows():
+        row = np.searchsorted(y_values, cell[kd_columns[1]])
+        col = np.searchsorted(x_values, cell[kd_columns[0]])
+        z[row, col] = cell['chi2']
+        labels[row, col] = cell['kd']
+
+    best = average.loc[average['chi2'].idxmin()]
+
+    fig = go.Figure()
+    fig.add_trace(go.Heatmap(
+        x=x_values,
+        y=y_values,
+        z=np.log10(z),
+        customdata=labels,
+        colorscale='Viridis_r',
+        colorbar=dict(title='log χ²'),
+        hovertemplate='Kd = %{customdata}<br>log χ² = %{z:.3f}<extra></extra>'
+    ))
+    fig.add_trace(go.Scatter(
+        x=[best[kd_columns[0]]],
+        y=[best[kd_columns[1]]],
+        mode='markers',
+        marker=dict(color='red', size=14, symbol='star'),
+        customdata=[best['kd']],
+        showlegend=False,
+        hovertemplate=f'Lowest average χ² = {best["chi2"]:.2f}<extra></extra>'
+    ))
+
+    fig.update_xaxes(type='log', title=f'Kd₁ ({units})')
+    fig.update_yaxes(type='log', title=f'Kd₂ ({units})')
+    fig.update_layout(
+        template='simple_white',
+        height=400,
+        width=650,
+        font=dict(size=16),
+        annotations=[
+            dict(
+                text=f'<span style="font-size: 14px;"><span style="color: red;">★</span> lowest average χ² <br> <b>Kd = {format_kd(best["kd"])} {units}</b></span>',
+                xref="paper",
+                yref="paper",
+                x=0.01,
+                y=0.99,
+                showarrow=False,
+                bgcolor="rgba(255, 255, 255, 0.5)"
+            )
+        ],
+        title={
+            'text': "χ² vs Kd" + ("₁, Kd₂" if len(kd_columns) == 2 else "₁, Kd₂ (best Kd₃)"),
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',
+            'font': dict(size=20)
+        }
+    )
+    return fig
+
+def create_stack_heatmap(chi2, units='µM'):
+    """
+    χ² of every frame of a high-throughput series over the Kd grid, frames
+    ordered by concentration; clicking a cell selects its Kd
+    Args:
+        chi2: results table with frame, kd, concentration and chi2 columns
+    """
+    table = chi2.pivot(index='frame', columns='kd', values='chi2')
+    concentrations = chi2.groupby('frame')['concentration'].first()
+    order = concentrations.astype(float).sort_values(kind='stable').index
+    table = table.loc[order]
+    labels = concentrations.loc[order].values
+    average = chi2.groupby('kd')['chi2'].mean()
+    best_kd = average.idxmin()
+
+    rows = np.arange(len(order))
+    fig = go.Figure()
+    fig.add_trace(go.Heatmap(
+        x=table.columns.values,
+        y=rows,
+        z=np.log10(table.values),
+        customdata=np.repeat(labels[:, None], table.shape[1], axis=1),
+        colorscale='Viridis_r',
+        colorbar=dict(title='log χ²'),
+        hovertemplate=f'Kd = %{{x}} {units}<br>Frame at %{{customdata}} {units}<br>log χ² = %{{z:.3f}}<extra></extra>'
+    ))
+    fig.add_trace(go.Scatter(
+        x=[best_kd, best_kd],
+        y=[-0.5, len(order) - 0.5],
+        mode='lines',
+        line=dict(color='red', width=2, dash='dash'),
+        showlegend=False,
+        hovertemplate=f'Lowest average χ² = {average.min():.2f}<extra></extra>'
+    ))
+
+    # A few concentrations along the frame axis
+    ticks = np.unique(np.linspace(0, len(order) - 1, min(len(order), 8)).astype(int))
+    fig.update_xaxes(type='log', title=f'Kd ({units})')
+    fig.update_yaxes(title=f'Frames by concentration ({units})', tickvals=ticks, ticktext=labels[ticks])
+    fig.update_layout(
+        template='simple_white',
+        height=400,
+        width=650,
+        font=dict(size=16),
+        annotations=[
+            dict(
+                text=f'<span style="font-size: 14px;"><span style="color: red;">- -</span> lowest average χ² <br> <b>Kd = {format_kd(best_kd)} {units}</b></span>',
+                xref="paper",
+                yref="paper",
+                x=0.01,
+                y=0.99,
+                showarrow=False,
+                bgcolor="rgba(255, 255, 255, 0.5)"
+            )
+        ],
+        title={
+            'text': f"χ² vs Kd of {len(order)} frames",
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',
+            'font': dict(size=20)
+        }
+    )
+    return fig
+
+def create_chi_squared_plot(results, concentration_colors, units='µM', l_curve_summary=None):
     if results:
         chi_squared_values = pd.concat(results)
         avg_chi_squared = chi_squared_values.groupby('kd')['chi2'].mean().reset_index()
         
         
-        # Perform L-curve analysis on average chi-squared values
-        l_curve_result = LCurveAnalysis.analyze(
-            avg_chi_squared['kd'].values,
-            avg_chi_squared['chi2'].values
-        )
+        # Perform L-curve analysis on the average and on every concentration
+        if l_curve_summary is None:
+            l_curve_summary = LCurveAnalysis.analyze_results(chi_squared_values)
+        # None if too few Kd values were fitted, e.g. by a run stopped by its time budget
+        per_concentration = l_curve_summary.per_concentration if l_curve_summary else {}
 
         fig = go.Figure()
 
@@ -39,6 +191,18 @@ def create_chi_squared_plot(results, concentration_colors, units='µM'):
                 line=dict(color=concentration_colors[concentration])
             ))
 
+        # Mark the L-curve estimate of each concentration on its own curve
+        for concentration, result in per_concentration.items():
+            fig.add_trace(go.Scatter(
+                x=[result.optimal_kd],
+                y=[10 ** np.interp(np.log10(result.optimal_kd), result.x_smooth, result.y_smooth)],
+                mode='markers',
+                marker=dict(color=concentration_colors[concentration], size=10, symbol='star-open',
+                            line=dict(width=2)),
+                showlegend=False,
+                hovertemplate=f'{concentration} {units}: Kd = {result.optimal_kd:.2f} ± {result.kd_error:.2f} {units}<extra></extra>'
+            ))
+
         # Plot average curve
         fig.add_trace(go.Scatter(
             x=avg_chi_squared['kd'],
@@ -48,19 +212,31 @@ def create_chi_squared_plot(results, concentration_colors, units='µM'):
             line=dict(color='black', width=2, dash='dash')
         ))
 
-        # Add star marker at point of maximum curvature
-        y_value = 10 ** np.interp(np.log10(l_curve_result.optimal_kd), 
-                                 l_curve_result.x_smooth,
-                                 l_curve_result.y_smooth)
+        if l_curve_summary is not None:
+            l_curve_result = l_curve_summary.average
+            kd_spread = np.std(l_curve_summary.bootstrap_kds)
+            l_curve_text = (
+                f'<span style="font-size: 14px;"><span style="color: red;">★</span> L-curve analysis estimation <br> <b>Kd = {l_curve_result.optimal_kd:.2f} {units}</b>'
+                f'<br> bootstrap spread ± {kd_spread:.2f} {units}</span>'
+            )
+            # Add star marker at point of maximum curvature
+            y_value = 10 ** np.interp(np.log10(l_curve_result.optimal_kd), 
+                                     l_curve_result.x_smooth,
+                                     l_curve_result.y_smooth)
         
-        fig.add_trace(go.Scatter(
-            x=[l_curve_result.optimal_kd],
-            y=[y_value],
-            mode='markers',
-            marker=dict(color='red', size=12, symbol='star'),
-            showlegend=False,
-            hoverinfo='skip'
-        ))
+            fig.add_trace(go.Scatter(
+                x=[l_curve_result.optimal_kd],
+                y=[y_value],
+                mode='markers',
+                marker=dict(color='red', size=12, symbol='star'),
+                showlegend=False,
+                hoverinfo='skip'
+            ))
+        else:
+            l_curve_text = (
+                f'<span style="font-size: 14px;">L-curve analysis needs at least '
+                f'{LCurveAnalysis.MIN_POINTS} Kd values</span>'
+            )
 
         fig.update_xaxes(type="log")
         fig.update_layout(
@@ -79,7 +255,7 @@ def create_chi_squared_plot(results, concentration_colors, units='µM'):
             # Add text annotation with star symbol for L-curve result
             annotations=[
                 dict(
-                    text=f'<span style="font-size: 14px;"><span style="color: red;">★</span> L-curve analysis estimation <br> <b>Kd = {l_curve_result.optimal_kd:.2f} {units}</b></span>',
+                    text=l_curve_text,
                     xref="paper",
                     yref="paper",
                     x=0.01,
@@ -99,24 +275,92 @@ def create_chi_squared_plot(results, concentration_colors, units='µM'):
         return fig
     return go.Figure()
 
+def create_stoichiometry_scan_plot(results, units='µM'):
+    """Average χ² vs Kd of every stoichiometry of a scan, best Kd of each marked"""
+    if not results:
+        return go.Figure()
+
+    chi_squared_values = pd.concat(results)
+    average = chi_squared_values.groupby(['n', 'kd'], as_index=False)['chi2'].mean()
+
+    fig = go.Figure()
+    for i, (n, curve) in enumerate(average.groupby('n')):
+        color = px.colors.qualitative.Set1[i % len(px.colors.qualitative.Set1)]
+        best = curve.loc[curve['chi2'].idxmin()]
+        # customdata carries n, so a click selects the stoichiometry too
+        fig.add_trace(go.Scatter(
+            x=curve['kd'],
+            y=curve['chi2'],
+            mode='lines+markers',
+            name=f'n = {n}',
+            customdata=[n] * len(curve),
+            line=dict(color=color)
+        ))
+        fig.add_trace(go.Scatter(
+            x=[best['kd']],
+            y=[best['chi2']],
+            mode='markers',
+            marker=dict(color=color, size=12, symbol='star'),
+            customdata=[n],
+            showlegend=False,
+            hovertemplate=f'n = {n}: Kd = {best["kd"]:.2f} {units}, χ² = {best["chi2"]:.2f}<extra></extra>'
+        ))
+
+    fig.update_xaxes(type="log")
+    fig.update_layout(
+        xaxis_title=f'Kd ({units})',
+        yaxis_title='average χ²',
+        showlegend=True,
+        template='simple_white',
+        height=400,
+        width=650,
+        font=dict(size=16),
+        legend=dict(title='Stoichiometry'),
+        title={
+            'text': "χ² vs Kd per stoichiometry",
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',
+            'font': dict(size=20)
+        }
+    )
+    return fig
+
+def create_scan_fit_plots(experimental_concentrations, concentration_colors, session_dir, scan_kds, units='µM'):
+    """
+    Best fits of a stoichiometry scan side by side, one column per n
+    Args:
+        scan_kds: Kd shown for each n, as {n: kd}
+    """
+    store = ResultStore(session_dir)
+    columns = []
+    for n, kd in sorted(scan_kds.items(), key=lambda item: int(item[0])):
+        n = int(n)
+        plots = [html.H5(f'n = {n}, Kd = {kd:.2f} {units}', style={'textAlign': 'center'})]
+        for concentration in experimental_concentrations:
+            fit_data = store.load_fit(concentration, kd, n)
+            if fit_data is None:
+                continue
+            chi2 = store.chi2_value(concentration, kd, n)
+            plot = create_single_saxs_fit_plot(fit_data, concentration, kd, chi2,
+                                               concentration_colors[format_concentration(concentration)], units)
+            plot.update_layout(height=450, font=dict(size=12))
+            plots.append(dcc.Graph(figure=plot))
+        columns.append(html.Div(plots, style={'width': f'{100 / len(scan_kds)}%', 'display': 'inline-block',
+                                              'vertical-align': 'top'}))
+    return html.Div(columns)
+
 def create_saxs_fit_plots(results_or_concentrations, concentration_colors, session_dir, kd=None, chi2_values=None, units='µM'):
     fit_plots_column1 = []
     fit_plots_column2 = []
 
-    if isinstance(results_or_concentrations, list):
+    if not isinstance(results_or_concentrations[0], pd.DataFrame):
         # Case when clicking on chi² plot
         experimental_concentrations = results_or_concentrations
-        # Get chi² values for clicked Kd from log files
+        # Get chi² values for clicked Kd from the stored results
         if kd is not None:
-            chi2_values = []
-            for concentration in experimental_concentrations:
-                log_file = os.path.join(session_dir, 'logs', f"oligomer_{format_concentration(concentration)}_{kd}.log")
-                try:
-                    chi2 = extract_chi_squared(log_file)
-                    chi2_values.append(chi2)
-                except FileNotFoundError:
-                    logger.debug(f"Log file not found for kd={kd}, concentration={concentration}")
-                    chi2_values.append(None)
+            store = ResultStore(session_dir)
+            chi2_values = [store.chi2_value(concentration, kd) for concentration in experimental_concentrations]
     else:
         # Case for initial analysis
         results = results_or_concentrations
@@ -128,12 +372,12 @@ def create_saxs_fit_plots(results_or_concentrations, concentration_colors, sessi
             chi2_values.append(result['chi2'].min())
         kd = results[0]['kd'].iloc[results[0]['chi2'].idxmin()]
 
+    store = ResultStore(session_dir)
     for i, concentration in enumerate(experimental_concentrations):
-        fit_filename = f"fit_{format_concentration(concentration)}_{kd}.fit"
-        fit_filepath = os.path.join(session_dir, 'fits', fit_filename)
+        fit_data = store.load_fit(concentration, kd)
 
-        if os.path.exists(fit_filepath):
-            plot = create_single_saxs_fit_plot(fit_filepath, concentration, kd, chi2_values[i], 
+        if fit_data is not None:
+            plot = create_single_saxs_fit_plot(fit_data, concentration, kd, chi2_values[i], 
                                              concentration_colors[format_concentration(concentration)], units)
             
             save_buttons = html.Div([
@@ -149,7 +393,6 @@ def create_saxs_fit_plots(results_or_concentrations, concentration_colors, sessi
                               id={'type': 'save-saxs-fit-pdf', 'index': i}, 
                               className='secondary-dash-button', 
                               style={'width': 'auto', 'margin': '10px'}),
-                    dcc.Download(id={'type': 'download-saxs-fit-pdf', 'index': i}),
                 ], style={'display': 'inline-block'}),
             ], className="d-flex justify-content-end mb-2")
             
@@ -167,6 +410,40 @@ def create_saxs_fit_plots(results_or_concentrations, concentration_colors, sessi
 
     return combined_columns
 
+def create_stack_fit_plots(session_dir, kd, page=1, units='µM'):
+    """
+    Fits of one page of frames of a high-throughput series at a Kd, frames
+    ordered by concentration; only the fits shown are rebuilt
+    """
+    store = ResultStore(session_dir)
+    chi2 = store.load_chi2()
+    frames = ProfileStack(session_dir).metadata()['filenames']
+    kd_values = np.sort(chi2['kd'].unique())
+    kd = kd_values[np.argmin(np.abs(np.log(kd_values) - np.log(float(kd))))]
+    at_kd = chi2[chi2['kd'] == kd].set_index('frame')
+    order = at_kd['concentration'].astype(float).sort_values(kind='stable').index
+
+    fit_plots_column1 = []
+    fit_plots_column2 = []
+    first = (page - 1) * STACK_FITS_PER_PAGE
+    for i, frame in enumerate(order[first:first + STACK_FITS_PER_PAGE]):
+        fit_data = store.load_stack_fit(frame, kd)
+        if fit_data is None:
+            continue
+        concentration = at_kd.loc[frame, 'concentration']
+        plot = create_single_saxs_fit_plot(fit_data, concentration, kd, at_kd.loc[frame, 'chi2'],
+                                           DEFAULT_PLOTLY_COLORS[i % len(DEFAULT_PLOTLY_COLORS)], units)
+        plot_div = html.Div([html.Div(frames[frame], className="text-muted"), dcc.Graph(figure=plot)])
+        if i % 2 == 0:
+            fit_plots_column1.append(plot_div)
+        else:
+            fit_plots_column2.append(plot_div)
+
+    return html.Div([
+        html.Div(fit_plots_column1, style={'width': '50%', 'display': 'inline-block', 'vertical-align': 'top'}),
+        html.Div(fit_plots_column2, style={'width': '50%', 'display': 'inline-block', 'vertical-align': 'top'})
+    ])
+
 def create_single_saxs_fit_plot(fit_data_or_path, concentration, kd, chi2, color, units='µM'):
     """
     Create a SAXS fit plot from either a filepath or a DataFrame
@@ -179,8 +456,8 @@ def create_single_saxs_fit_plot(fit_data_or_path, concentration, kd, chi2, color
     """
     if isinstance(fit_data_or_path, str):
         # If a filepath is provided, read the data
-        fit_data = pd.read_csv(fit_data_or_path, sep='\s+', skiprows=1, header=None,
-                              names=['s', 'Iexp', 'sigma', 'Ifit'])
+        fit_data = pd.DataFrame(load_profile(fit_data_or_path).data[:, :4],
+                                columns=['s', 'Iexp', 'sigma', 'Ifit'])
     else:
         # If a DataFrame is provided, use it directly
         fit_data = fit_data_or_path
@@ -200,7 +477,7 @@ def create_single_saxs_fit_plot(fit_data_or_path, concentration, kd, chi2, color
 
     fig.add_trace(go.Scatter(
         x=fit_data['s'], y=fit_data['Ifit_log'],
-        mode='lines', name=f'Best fit (Kd: {kd:.2f}, χ²={chi2:.2f})',
+        mode='lines', name=f'Best fit (Kd: {format_kd(kd)}, χ²={chi2:.2f})',
         line=dict(color=color, width=4)
     ), row=1, col=1)
 
@@ -238,8 +515,23 @@ def create_fraction_plot(kd, n_value, concentration_range, selected_model, recep
                                 mode='lines', name='Monomer', line=dict(color='green')))
         fig.add_trace(go.Scatter(x=fractions['concentration'], y=fractions['oligomer_fraction'],
                                 mode='lines', name='Oligomer', line=dict(color='red')))
+    elif selected_model == 'kds_saxs_sequential_oligomer':
+        fractions = SequentialOligomerCalculation.calculate_fractions(parse_kd_label(kd), concentration_range, n_value)
+        # Plot for sequential oligomerization model
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(x=fractions['concentration'], y=fractions['monomer_fraction'],
+                                mode='lines', name='Monomer', line=dict(color='green')))
+        for k in range(2, n_value + 1):
+            fig.add_trace(go.Scatter(x=fractions['concentration'],
+                                   y=fractions[f'oligomer_{k}_fraction'],
+                                   mode='lines',
+                                   name=f'{k}-mer',
+                                   line=dict(color=px.colors.qualitative.Set1[k - 2])))
     else:
-        fractions = ProteinBindingCalculation.calculate_fractions(kd, concentration_range, n_value, receptor_concentration)
+        if selected_model == 'kds_saxs_cooperative_binding':
+            fractions = CooperativeBindingCalculation.calculate_fractions(parse_kd_label(kd), concentration_range, n_value, receptor_concentration)
+        else:
+            fractions = ProteinBindingCalculation.calculate_fractions(kd, concentration_range, n_value, receptor_concentration)
         # Plot for protein binding model
         fig = go.Figure()
         for i in range(n_value + 1):
@@ -256,7 +548,7 @@ def create_fraction_plot(kd, n_value, concentration_range, selected_model, recep
 
     fig.update_layout(
     title={
-        'text': f'Molecular fractions (Kd = {kd:.2f}, n = {n_value})',
+        'text': f'Molecular fractions (Kd = {format_kd(kd)}, n = {n_value})',
         'x': 0.5,
         'xanchor': 'center',
         'yanchor': 'top',
@@ -46,6 +46,40 @@ formulas = {
     L = Ligand, \quad
     n = number \, of \, binding \, sites
     $$
+    ''',
+    'kds_saxs_sequential_oligomer': '''
+    Mass balance equations:
+
+    $$
+    M \leftrightarrow D \leftrightarrow T \leftrightarrow \dots \leftrightarrow O_n
+    $$
+
+    $$
+    M_{total} = \sum_{k=1}^{n} k[O_k], \quad O_1 = M
+    $$
+
+    $$
+    K_{D,k} = \\frac{[M][O_{k-1}]}{[O_k]}, \quad k = 2 \dots n
+    $$
+    ''',
+    'kds_saxs_cooperative_binding': '''
+    Mass balance equations:
+
+    $$
+    R_{total} = \sum_{j=0}^{n} R_j \quad ,
+    $$
+
+    $$
+    L_{total} = L_{free} + \sum_{j=1}^{n} j \cdot R_j \quad ,
+    $$
+
+    $$
+    \\frac{[R]_{j-1}[L_{free}]}{[R]_j} = jK_{d,j} / (n - j + 1), \quad j = 1 \dots n
+    $$
+
+    $$
+    K_{d,j} = intrinsic \, K_D \, of \, step \, j
+    $$
     '''
 }
 
@@ -107,5 +141,19 @@ def create_popovers():
             trigger="hover",
             placement="bottom",
             className="popover-body"
+        ),
+        dbc.Popover(
+            dcc.Markdown(formulas['kds_saxs_sequential_oligomer'], mathjax=True),
+            target="popover-sequential-oligomer",
+            trigger="hover",
+            placement="bottom",
+            className="popover-body"
+        ),
+        dbc.Popover(
+            dcc.Markdown(formulas['kds_saxs_cooperative_binding'], mathjax=True),
+            target="popover-cooperative-binding",
+            trigger="hover",
+            placement="bottom",
+            className="popover-body"
         )
     ]
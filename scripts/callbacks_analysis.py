@@ -1,29 +1,71 @@
-import io
 import json
 import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 import dash
 import numpy as np
 import pandas as pd
-import plotly.io as pio
 from dash import dcc, html
-from dash.dependencies import MATCH, Input, Output, State
+from dash.dependencies import ALL, MATCH, Input, Output, State
 from dash.exceptions import PreventUpdate
-from flask import session
 from plotly.colors import DEFAULT_PLOTLY_COLORS
 
-from config import ATSAS_PATH, MAX_CONCENTRATION_POINTS, MAX_KD_POINTS
-from models.model_factory import ModelFactory
+from config import (
+    ANALYSIS_TIME_BUDGET,
+    ANALYSIS_WORKERS,
+    ATSAS_PATH,
+    CRYSOL_PARAMS,
+    FIT_BACKEND,
+    LCURVE_BOOTSTRAP_REPLICATES,
+    MAX_CONCENTRATION_POINTS,
+    MAX_KD_DIMENSIONS,
+    MAX_KD_POINTS,
+    MAX_SCAN_N_VALUES,
+    MAX_TIME_BUDGET,
+    OLIGOMER_PROJECT_BASIS,
+    SEARCH_COARSE_BUDGET,
+    SEARCH_REFINE_LEVELS,
+    SEARCH_REFINE_POINTS,
+    STACK_FITS_PER_PAGE,
+)
+from models.curve_analysis import LCurveAnalysis
+from models.calculations import coarse_to_fine_passes, fit_stack, kd_grid
+from models.model_factory import MULTI_KD_MODELS, ModelFactory
+from models.search import CoarseToFineSearch
 from plotting import (
+    create_chi_squared_heatmap,
     create_chi_squared_plot,
     create_empty_fraction_plot,
     create_fraction_plot,
     create_saxs_fit_plots,
+    create_scan_fit_plots,
     create_single_saxs_fit_plot,
+    create_stack_fit_plots,
+    create_stack_heatmap,
+    create_stoichiometry_scan_plot,
 )
+from scripts.cancellation import budget_expired, check_cancelled, time_budget
 from scripts.crysol_handler import CrysolHandler
 from scripts.error_handling import logger
-from scripts.utils import format_concentration, get_state_from_index, save_file
+from scripts.export_service import export_service
+from scripts.jobs import job_runner
+from scripts.preflight import preflight_check
+from scripts.profile_stack import ProfileStack
+from scripts.result_cache import result_cache
+from scripts.result_store import ResultStore
+from scripts.scheduler import scheduler
+from scripts.saxs_parser import check_q_units, load_profile
+from scripts.utils import (
+    content_hash,
+    fingerprint,
+    format_concentration,
+    get_state_from_index,
+    save_file,
+    session_directory,
+)
+from scripts.worker_pool import analysis_arenas, connect, pool_enabled
+from scripts.workspace import SessionWorkspace
 
 
 def validate_inputs(
@@ -35,20 +77,37 @@ def validate_inputs(
     receptor_concentration,
     kd_points,
     conc_points,
+    n_scan=None,
+    stack=False,
 ):
     errors = []
     if not selected_model:
         errors.append("No model selected.")
     if not n_value or n_value <= 0:
         errors.append("Invalid n value.")
-    if not upload_container:
+    # A high-throughput series is uploaded as a stack instead
+    if not upload_container and not stack:
         errors.append("No experimental SAXS data uploaded.")
+    if stack and selected_model in MULTI_KD_MODELS:
+        errors.append("High-throughput series can only be fitted with single-Kd models.")
+    if stack and FIT_BACKEND != "native":
+        errors.append("High-throughput series are fitted natively; set KDSAXS_FIT_BACKEND=native to use them.")
     if not theoretical_saxs_uploads:
         errors.append("No theoretical SAXS data uploaded.")
     if not kd_range or len(kd_range) != 2 or kd_range[0] >= kd_range[1]:
         errors.append("Invalid Kd range.")
-    if selected_model == "kds_saxs_oligomer_fitting" and receptor_concentration is None:
+    if (
+        selected_model in ["kds_saxs_oligomer_fitting", "kds_saxs_cooperative_binding"]
+        and receptor_concentration is None
+    ):
         errors.append("Receptor concentration is required for the selected model.")
+    if selected_model in MULTI_KD_MODELS and n_value and n_value > 0:
+        dimensions = ModelFactory.kd_dimensions(selected_model, n_value)
+        if not 2 <= dimensions <= MAX_KD_DIMENSIONS:
+            errors.append(
+                f"The selected model fits between 2 and {MAX_KD_DIMENSIONS} Kds, "
+                f"but n = {n_value} gives {dimensions}."
+            )
 
     # Add validation for maximum points
     if kd_points > MAX_KD_POINTS:
@@ -58,9 +117,32 @@ def validate_inputs(
             f"Number of concentration points cannot exceed {MAX_CONCENTRATION_POINTS}"
         )
 
+    if n_scan:
+        try:
+            parse_n_scan(n_scan)
+        except ValueError as e:
+            errors.append(str(e))
+
     return errors
 
 
+def parse_n_scan(n_scan):
+    """
+    Stoichiometries of a scan from the comma or space separated input
+    Raises:
+        ValueError: if the input is not a list of 2 or more stoichiometries
+    """
+    try:
+        n_values = sorted({int(value) for value in n_scan.replace(",", " ").split()})
+    except ValueError:
+        raise ValueError("Stoichiometries to scan must be whole numbers, e.g. 2, 3, 4.")
+    if len(n_values) < 2 or n_values[0] < 1:
+        raise ValueError("Scan at least two stoichiometries of 1 or more.")
+    if len(n_values) > MAX_SCAN_N_VALUES:
+        raise ValueError(f"Cannot scan more than {MAX_SCAN_N_VALUES} stoichiometries at once.")
+    return n_values
+
+
 def process_saxs_data(
     selected_model,
     n_value,
@@ -76,10 +158,376 @@ def process_saxs_data(
     logger.debug(f"Model: {selected_model}")
 
     model = ModelFactory.get_model(selected_model)
+    experiments, concentration_colors = collect_experiments(upload_container, q_units)
+    if not experiments:
+        return [], concentration_colors
+
+    # Everything a (concentration, Kd) cell depends on besides the Kd itself
+    store = ResultStore(session_dir)
+    theoretical_key = theoretical_fingerprint(theoretical_saxs_uploads)
+    # Theoretical profiles (CRYSOL for PDB ensembles) are prepared once for all concentrations
+    theoretical_files = prepare_theoretical_files(
+        selected_model, theoretical_saxs_uploads, session_dir, n_value
+    )
+
+    def prepare_experiment(experiment):
+        i, exp_saxs, formatted_conc = experiment
+        exp_file_path = save_file(
+            f"exp_saxs_{i + 1}.dat", exp_saxs, session_dir, "uploads/experimental"
+        )
+        check_q_units(exp_file_path, q_units)
+
+        # Reuse cells computed by the previous run when none of the inputs changed
+        cells_key = fingerprint(
+            model=selected_model,
+            n=n_value,
+            receptor_concentration=(
+                receptor_concentration
+                if selected_model in ["kds_saxs_oligomer_fitting", "kds_saxs_cooperative_binding"]
+                else None
+            ),
+            q_units=q_units,
+            experimental=content_hash(exp_saxs),
+            theoretical=theoretical_key,
+            concentration=formatted_conc,
+            # The backends differ in chi², so cells of one are not reused by the other
+            backend=FIT_BACKEND,
+            projected=OLIGOMER_PROJECT_BASIS,
+        )
+        completed = store.load_cells(formatted_conc, cells_key)
+
+        # Fractions, profiles and checkpoint are prepared once for all passes
+        check_cancelled(os.path.basename(session_dir))
+        if selected_model == "kds_saxs_mon_oligomer":
+            mon_file_path, dim_file_path = theoretical_files
+            sweep = model.sweep(
+                exp_file_path,
+                mon_file_path,
+                dim_file_path,
+                float(formatted_conc),
+                n_value,
+                kd_range,
+                kd_points,
+                session_dir,
+                q_units,
+                completed=completed,
+            )
+        else:  # protein binding model
+            sweep = model.sweep(
+                exp_file_path,
+                theoretical_files,
+                receptor_concentration,
+                float(formatted_conc),
+                n_value,
+                kd_range,
+                kd_points,
+                session_dir,
+                q_units,
+                completed=completed,
+            )
+        return formatted_conc, cells_key, sweep
+
+    def advance_experiment(job, coverage):
+        check_cancelled(os.path.basename(session_dir))
+        job[2].advance(coverage)
+
+    def finish_experiment(job):
+        formatted_conc, cells_key, sweep = job
+        chi_squared_df = sweep.result()
+        store.save_cells(formatted_conc, cells_key, chi_squared_df.copy())
+        # Format concentration in results DataFrame
+        chi_squared_df["concentration"] = chi_squared_df["concentration"].apply(
+            format_concentration
+        )
+        return chi_squared_df
+
+    # Jobs only share read-only inputs and write through the session
+    # workspace, so concentrations can be fitted side by side. They advance
+    # together one level of the coarse-to-fine Kd order at a time, so a
+    # time budget leaves the same Kd values fitted at every concentration;
+    # each pass only fits the Kd values it adds.
+    with ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS) as executor:
+        jobs = list(executor.map(prepare_experiment, experiments))
+        for coverage in coarse_to_fine_passes(kd_grid(kd_range, kd_points)):
+            list(executor.map(lambda job: advance_experiment(job, coverage), jobs))
+            if budget_expired(os.path.basename(session_dir)):
+                break
+
+    # Cells are saved once, after the last pass or when the budget expired
+    results = [finish_experiment(job) for job in jobs]
+    return results, concentration_colors
+
+
+def prepare_theoretical_files(
+    selected_model, theoretical_saxs_uploads, session_dir, n_value
+):
+    """
+    Store one theoretical profile per species, running CRYSOL on PDB ensembles
+    Returns:
+        List of profile paths in upload order
+    """
+    if "props" in theoretical_saxs_uploads[0] and isinstance(
+        theoretical_saxs_uploads[0]["props"].get("contents"), list
+    ):
+        logger.debug(f"Processing PDB files for {selected_model}")
+        crysol_handler = CrysolHandler(session_dir)
+        theoretical_files = []
+
+        for j, upload in enumerate(theoretical_saxs_uploads):
+            state = get_state_from_index(selected_model, j, n_value)
+            pdb_files = []
+            filenames = upload["props"].get("filename") or []
+
+            for k, cont in enumerate(upload["props"]["contents"]):
+                # mmCIF files keep their extension so CRYSOL reads them as such
+                name = filenames[k].lower() if k < len(filenames) else ""
+                name = name[:-3] if name.endswith(".gz") else name
+                suffix = ".cif" if name.endswith((".cif", ".mmcif")) else ".pdb"
+                pdb_path = save_file(
+                    name=f"pdb_{state}_{len(pdb_files)}{suffix}",
+                    content=cont,
+                    directory=session_dir,
+                    file_type="pdb",
+                    model=selected_model,
+                    state=state,
+                )
+                pdb_files.append(pdb_path)
+
+            # Process PDbs with CRYSOL and average
+            theo_file_path = crysol_handler.process_multiple_pdbs(pdb_files, state)
+            theoretical_files.append(theo_file_path)
+        return theoretical_files
+
+    # Handle regular SAXS profiles
+    return [
+        save_file(
+            f"theo_saxs_{j + 1}.dat",
+            upload["props"]["contents"],
+            session_dir,
+            "uploads/theoretical",
+        )
+        for j, upload in enumerate(theoretical_saxs_uploads)
+    ]
+
+
+def process_multi_kd_data(
+    selected_model,
+    n_value,
+    upload_container,
+    theoretical_saxs_uploads,
+    kd_range,
+    receptor_concentration,
+    session_dir,
+    kd_points,
+    q_units,
+):
+    """
+    Fit a model with one Kd per step by a coarse-to-fine search over all Kds.
+    Every grid point is fitted at all concentrations so their χ² can be averaged.
+    Returns:
+        Tuple of (per-concentration results, concentration colors) as process_saxs_data
+    """
+    logger.debug(f"Starting multi-Kd search with session_dir: {session_dir}")
+
+    model = ModelFactory.get_model(selected_model)
+    experiments, concentration_colors = collect_experiments(upload_container, q_units)
+    if not experiments:
+        return [], concentration_colors
+
+    theoretical_files = prepare_theoretical_files(
+        selected_model, theoretical_saxs_uploads, session_dir, n_value
+    )
+    exp_files = [
+        save_file(f"exp_saxs_{i + 1}.dat", exp_saxs, session_dir, "uploads/experimental")
+        for i, exp_saxs, _ in experiments
+    ]
+    for exp_file_path in exp_files:
+        check_q_units(exp_file_path, q_units)
+
+    batches = []
+
+    def evaluate_concentration(points, exp_file_path, formatted_conc):
+        if selected_model == "kds_saxs_cooperative_binding":
+            return model.calculate(
+                exp_file_path,
+                theoretical_files,
+                receptor_concentration,
+                float(formatted_conc),
+                n_value,
+                points,
+                session_dir,
+                q_units,
+            )
+        return model.calculate(
+            exp_file_path,
+            theoretical_files,
+            float(formatted_conc),
+            n_value,
+            points,
+            session_dir,
+            q_units,
+        )
+
+    def evaluate(points):
+        check_cancelled(os.path.basename(session_dir))
+        with ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS) as executor:
+            frames = list(
+                executor.map(
+                    lambda job: evaluate_concentration(points, *job),
+                    [(path, conc) for path, (_, _, conc) in zip(exp_files, experiments)],
+                )
+            )
+        batches.append(frames)
+        # Same objective as the single-Kd models: χ² averaged over concentrations
+        return np.mean([frame["chi2"].to_numpy() for frame in frames], axis=0)
+
+    search = CoarseToFineSearch(
+        kd_range, ModelFactory.kd_dimensions(selected_model, n_value), kd_points
+    )
+    search.run(evaluate)
+
     results = []
+    for j in range(len(experiments)):
+        chi_squared_df = pd.concat([frames[j] for frames in batches], ignore_index=True)
+        kd_columns = [c for c in chi_squared_df.columns if c.startswith("kd_")]
+        chi_squared_df = chi_squared_df.sort_values(kd_columns, ignore_index=True)
+        chi_squared_df["concentration"] = chi_squared_df["concentration"].apply(
+            format_concentration
+        )
+        results.append(chi_squared_df)
+    return results, concentration_colors
+
+
+def process_stoichiometry_scan(
+    n_values,
+    upload_container,
+    theoretical_saxs_uploads,
+    kd_range,
+    session_dir,
+    kd_points,
+    q_units,
+):
+    """
+    Fit the Monomer-Oligomer model for several stoichiometries in one job.
+    Uploads are stored and CRYSOL runs once; each concentration job loads the
+    profiles once for all n.
+    Returns:
+        Tuple of (per-concentration results with an n column, concentration colors)
+    """
+    logger.debug(f"Starting stoichiometry scan {n_values} with session_dir: {session_dir}")
+
+    model = ModelFactory.get_model("kds_saxs_mon_oligomer")
+    experiments, concentration_colors = collect_experiments(upload_container, q_units)
+    if not experiments:
+        return [], concentration_colors
+
+    mon_file_path, dim_file_path = prepare_theoretical_files(
+        "kds_saxs_mon_oligomer", theoretical_saxs_uploads, session_dir, n_values[0]
+    )
+
+    def prepare_experiment(experiment):
+        i, exp_saxs, formatted_conc = experiment
+        exp_file_path = save_file(
+            f"exp_saxs_{i + 1}.dat", exp_saxs, session_dir, "uploads/experimental"
+        )
+        check_q_units(exp_file_path, q_units)
+        check_cancelled(os.path.basename(session_dir))
+        return model.sweep_scan(
+            exp_file_path,
+            mon_file_path,
+            dim_file_path,
+            float(formatted_conc),
+            n_values,
+            kd_range,
+            kd_points,
+            session_dir,
+            q_units,
+        )
+
+    def advance_experiment(sweeps, coverage):
+        check_cancelled(os.path.basename(session_dir))
+        for sweep in sweeps:
+            sweep.advance(coverage)
+
+    def finish_experiment(sweeps):
+        chi_squared_df = pd.concat([sweep.result() for sweep in sweeps], ignore_index=True)
+        chi_squared_df["concentration"] = chi_squared_df["concentration"].apply(
+            format_concentration
+        )
+        return chi_squared_df
+
+    # Passes over the coarse-to-fine Kd order, as in process_saxs_data
+    with ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS) as executor:
+        jobs = list(executor.map(prepare_experiment, experiments))
+        for coverage in coarse_to_fine_passes(kd_grid(kd_range, kd_points)):
+            list(executor.map(lambda sweeps: advance_experiment(sweeps, coverage), jobs))
+            if budget_expired(os.path.basename(session_dir)):
+                break
+
+    results = [finish_experiment(sweeps) for sweeps in jobs]
+    return results, concentration_colors
+
+
+def process_stack(
+    selected_model,
+    n_value,
+    theoretical_saxs_uploads,
+    kd_range,
+    receptor_concentration,
+    session_dir,
+    kd_points,
+    q_units,
+):
+    """
+    Fit every frame of the session's high-throughput series at every Kd.
+    Frames are fitted natively in blocks read from the memory-mapped stack;
+    only the fitted parameters are stored, fits are rebuilt when shown.
+    Returns:
+        Tuple of (per-frame results with a frame column, concentration colors)
+    """
+    if selected_model in MULTI_KD_MODELS:
+        raise ValueError("High-throughput series can only be fitted with single-Kd models.")
+    if FIT_BACKEND != "native":
+        raise ValueError("High-throughput series are fitted natively; set KDSAXS_FIT_BACKEND=native to use them.")
+    stack = ProfileStack(session_dir)
+    metadata = stack.metadata()
+    if metadata is None:
+        raise ValueError("No high-throughput series uploaded.")
+    logger.debug(f"Fitting a series of {len(metadata['filenames'])} profiles in {session_dir}")
+
+    theoretical_files = prepare_theoretical_files(
+        selected_model, theoretical_saxs_uploads, session_dir, n_value
+    )
+    basis = np.stack([load_profile(path).data[:, :2] for path in theoretical_files])
+    kd_values = kd_grid(kd_range, kd_points)
+    fractions, chi_squared, scale, offset = fit_stack(
+        session_dir, stack, selected_model, basis, n_value, kd_values, q_units, receptor_concentration
+    )
+    ResultStore(session_dir).save_stack_fits(kd_values, fractions, scale, offset, basis, q_units)
+
+    results = [
+        pd.DataFrame({
+            "frame": frame,
+            "kd": kd_values,
+            "concentration": format_concentration(concentration),
+            "chi2": chi_squared[frame],
+        })
+        for frame, concentration in enumerate(metadata["concentrations"])
+    ]
+    # Frames are too many for a colour each; their fits take colours page by page
+    return results, {}
+
+
+def collect_experiments(upload_container, q_units):
+    """
+    Experimental profiles with a concentration, in upload order
+    Returns:
+        Tuple of ([(index, contents, formatted concentration)], concentration colors)
+    """
     concentration_colors = {}
     color_sequence = DEFAULT_PLOTLY_COLORS
 
+    experiments = []
     for i, item in enumerate(upload_container):
         exp_saxs, ligand_concentration, q_units = extract_saxs_data(item, q_units)
         if exp_saxs and ligand_concentration:
@@ -87,136 +535,323 @@ def process_saxs_data(
             if formatted_conc not in concentration_colors:
                 color_index = len(concentration_colors) % len(color_sequence)
                 concentration_colors[formatted_conc] = color_sequence[color_index]
+            experiments.append((i, exp_saxs, formatted_conc))
+    return experiments, concentration_colors
 
-            exp_file_path = save_file(
-                f"exp_saxs_{i + 1}.dat", exp_saxs, session_dir, "uploads/experimental"
-            )
 
-            if selected_model == "kds_saxs_mon_oligomer":
-                if "props" in theoretical_saxs_uploads[0] and isinstance(
-                    theoretical_saxs_uploads[0]["props"].get("contents"), list
-                ):
-                    logger.debug("Processing PDB files")
-                    crysol_handler = CrysolHandler(session_dir)
-
-                    # Process monomer PDbs
-                    mon_files = []
-                    for cont in theoretical_saxs_uploads[0]["props"]["contents"]:
-                        pdb_path = save_file(
-                            name=f"pdb_mon_{len(mon_files)}.pdb",
-                            content=cont,
-                            directory=session_dir,
-                            file_type="pdb",
-                            model=selected_model,
-                            state="monomer",
-                        )
-                        mon_files.append(pdb_path)
-                    mon_file_path = crysol_handler.process_multiple_pdbs(
-                        mon_files, "monomer"
-                    )
+def theoretical_fingerprint(theoretical_saxs_uploads):
+    """Hash of the theoretical profiles or PDB ensembles and how they are processed"""
+    return fingerprint(
+        contents=[
+            content_hash(json.dumps(upload["props"].get("contents")))
+            for upload in theoretical_saxs_uploads
+        ],
+        crysol=CRYSOL_PARAMS,
+    )
+
+
+def analysis_fingerprint(
+    selected_model,
+    n_value,
+    upload_container,
+    theoretical_saxs_uploads,
+    kd_range,
+    receptor_concentration,
+    kd_points,
+    q_units,
+):
+    """Canonical hash of every input that determines the results of an analysis"""
+    experiments, _ = collect_experiments(upload_container, q_units)
+    return fingerprint(
+        model=selected_model,
+        n=n_value,
+        receptor_concentration=(
+            receptor_concentration
+            if selected_model in ["kds_saxs_oligomer_fitting", "kds_saxs_cooperative_binding"]
+            else None
+        ),
+        q_units=q_units,
+        kd_range=list(kd_range),
+        kd_points=kd_points,
+        experiments=[
+            (content_hash(exp_saxs), formatted_conc)
+            for _, exp_saxs, formatted_conc in experiments
+        ],
+        theoretical=theoretical_fingerprint(theoretical_saxs_uploads),
+        # oligomer and the native fit do not give identical χ²
+        backend=FIT_BACKEND,
+        projected=OLIGOMER_PROJECT_BASIS,
+        **(
+            {"search": [SEARCH_COARSE_BUDGET, SEARCH_REFINE_POINTS, SEARCH_REFINE_LEVELS]}
+            if selected_model in MULTI_KD_MODELS
+            else {}
+        ),
+    )
+
+
+def cached_results(session_dir, upload_container, q_units):
+    """Per-concentration results restored from the result cache, as process_saxs_data returns them"""
+    _, concentration_colors = collect_experiments(upload_container, q_units)
+    chi2 = ResultStore(session_dir).load_chi2()
+    results = [
+        df.reset_index(drop=True)
+        for _, df in chi2.groupby("concentration", sort=False)
+    ]
+    return results, concentration_colors
 
-                    # Process oligomer PDbs
-                    dim_files = []
-                    for cont in theoretical_saxs_uploads[1]["props"]["contents"]:
-                        pdb_path = save_file(
-                            name=f"pdb_dim_{len(dim_files)}.pdb",
-                            content=cont,
-                            directory=session_dir,
-                            file_type="pdb",
-                            model=selected_model,
-                            state="oligomer",
-                        )
-                        dim_files.append(pdb_path)
-                    dim_file_path = crysol_handler.process_multiple_pdbs(
-                        dim_files, "oligomer"
+
+def run_analysis(session_dir, params):
+    """
+    Run an analysis job and keep its results in the session's result store
+    Args:
+        session_dir: session directory
+        params: analysis inputs as submitted by start_analysis
+    Raises:
+        SessionBusyError: if another analysis of the session is running
+        SchedulerBusyError: if the server admits no further analyses
+        AnalysisCancelled: if the analysis was cancelled
+        ValueError: if no experimental profile could be processed
+    """
+    selected_model = params["model"]
+    n_value = params["n"]
+    n_values = params["n_values"]
+    upload_container = params["upload_container"]
+    theoretical_saxs_uploads = params["theoretical_saxs_uploads"]
+    kd_range = tuple(params["kd_range"])
+    receptor_concentration = params["receptor_concentration"]
+    kd_points = params["kd_points"]
+    q_units = params["q_units"]
+    stack = params.get("stack", False)
+
+    with SessionWorkspace(session_dir).lock():
+        store = ResultStore(session_dir)
+        # Cells, fits and checkpoints survive, so a resumed job skips what it had computed
+        store.clear()
+
+        # Identical analyses are served from the server-wide cache
+        analysis_key = analysis_fingerprint(
+            selected_model,
+            n_values or n_value,
+            upload_container,
+            theoretical_saxs_uploads,
+            kd_range,
+            receptor_concentration,
+            kd_points,
+            q_units,
+        )
+        partial = False
+        if not stack and result_cache.restore(analysis_key, session_dir):
+            results, concentration_colors = cached_results(
+                session_dir, upload_container, q_units
+            )
+        else:
+            # Only analyses that compute count against the server's admission limit
+            session_id = os.path.basename(session_dir)
+            budget = params.get("time_budget") or ANALYSIS_TIME_BUDGET
+            with scheduler.admit(session_id), time_budget(session_id, budget), analysis_arenas(session_id):
+                if stack:
+                    results, concentration_colors = process_stack(
+                        selected_model,
+                        n_value,
+                        theoretical_saxs_uploads,
+                        kd_range,
+                        receptor_concentration,
+                        session_dir,
+                        kd_points,
+                        q_units,
+                    )
+                elif n_values:
+                    results, concentration_colors = process_stoichiometry_scan(
+                        n_values,
+                        upload_container,
+                        theoretical_saxs_uploads,
+                        kd_range,
+                        session_dir,
+                        kd_points,
+                        q_units,
                     )
                 else:
-                    logger.debug("Processing regular SAXS profiles")
-                    mon_contents = theoretical_saxs_uploads[0]["props"]["contents"]
-                    dim_contents = theoretical_saxs_uploads[1]["props"]["contents"]
-                    mon_file_path = save_file(
-                        "mon_saxs.dat", mon_contents, session_dir, "uploads/theoretical"
+                    process = (
+                        process_multi_kd_data
+                        if selected_model in MULTI_KD_MODELS
+                        else process_saxs_data
                     )
-                    dim_file_path = save_file(
-                        "oligomer_saxs.dat",
-                        dim_contents,
+                    results, concentration_colors = process(
+                        selected_model,
+                        n_value,
+                        upload_container,
+                        theoretical_saxs_uploads,
+                        kd_range,
+                        receptor_concentration,
                         session_dir,
-                        "uploads/theoretical",
+                        kd_points,
+                        q_units,
                     )
-
-                chi_squared_df = model.calculate(
-                    exp_file_path,
-                    mon_file_path,
-                    dim_file_path,
-                    float(formatted_conc),
-                    n_value,
-                    kd_range,
-                    kd_points,
-                    session_dir,
-                    q_units
-                )
-                # Format concentration in results DataFrame
-                chi_squared_df["concentration"] = chi_squared_df["concentration"].apply(
-                    format_concentration
-                )
-                results.append(chi_squared_df)
-            else:  # protein binding model
-                if "props" in theoretical_saxs_uploads[0] and isinstance(
-                    theoretical_saxs_uploads[0]["props"].get("contents"), list
-                ):
-                    logger.debug("Processing PDB files for protein binding model")
-                    crysol_handler = CrysolHandler(session_dir)
-                    theoretical_files = []
-
-                    for j, upload in enumerate(theoretical_saxs_uploads):
-                        state = get_state_from_index(selected_model, j, n_value)
-                        pdb_files = []
-
-                        for cont in upload["props"]["contents"]:
-                            pdb_path = save_file(
-                                name=f"pdb_{state}_{len(pdb_files)}.pdb",
-                                content=cont,
-                                directory=session_dir,
-                                file_type="pdb",
-                                model=selected_model,
-                                state=state,
-                            )
-                            pdb_files.append(pdb_path)
-
-                        # Process PDbs with CRYSOL and average
-                        theo_file_path = crysol_handler.process_multiple_pdbs(
-                            pdb_files, state
-                        )
-                        theoretical_files.append(theo_file_path)
-                else:
-                    # Handle regular SAXS profiles
-                    theoretical_files = []
-                    for j, upload in enumerate(theoretical_saxs_uploads):
-                        theo_file_path = save_file(
-                            f"theo_saxs_{j + 1}.dat",
-                            upload["props"]["contents"],
-                            session_dir,
-                            "uploads/theoretical",
-                        )
-                        theoretical_files.append(theo_file_path)
-
-                chi_squared_df = model.calculate(
-                    exp_file_path,
-                    theoretical_files,
-                    receptor_concentration,
-                    float(formatted_conc),
-                    n_value,
-                    kd_range,
-                    kd_points,
-                    session_dir,
-                    q_units
+                # A series is fitted whole, whatever the budget
+                partial = not stack and budget_expired(session_id)
+        if not results:
+            raise ValueError("No valid data processed.")
+        if partial:
+            results, fitted_points, grid_points = completed_points(results)
+            if not fitted_points:
+                raise ValueError(
+                    f"The time budget of {budget:g} s expired before any Kd value was fitted "
+                    "at every concentration."
                 )
-                chi_squared_df["concentration"] = chi_squared_df["concentration"].apply(
-                    format_concentration
+            logger.info(f"Time budget expired: {fitted_points} of {grid_points} points fitted")
+        store.save_chi2(results)
+
+        chi_squared_values = pd.concat(results)
+        metadata = {
+            "model": selected_model,
+            "n": n_value,
+            "receptor_concentration": receptor_concentration,
+            "concentration_range": params["concentration_range"],
+            "q_units": q_units,
+            "experimental_concentrations": [
+                result["concentration"].unique()[0] for result in results
+            ],
+            "concentration_colors": concentration_colors,
+            "units": params["units"],
+        }
+        if stack:
+            metadata.update(stack=True, frames=ProfileStack(session_dir).metadata()["filenames"])
+        if n_values:
+            average = chi_squared_values.groupby(["n", "kd"])["chi2"].mean()
+            best_n, best_kd = average.idxmin()
+            # Metadata keeps the scanned n values; the rendered store maps each n to its best Kd
+            metadata.update(
+                n=int(best_n),
+                best_n=int(best_n),
+                best_kd=float(best_kd),
+                n_scan=n_values,
+                chi2_values=[
+                    float(result.loc[result["n"] == best_n, "chi2"].min()) for result in results
+                ],
+            )
+        else:
+            avg_chi_squared = chi_squared_values.groupby("kd")["chi2"].mean()
+            best_kd = avg_chi_squared.index[avg_chi_squared.argmin()]
+            # Kds of multi-Kd models are grid point labels; the L-curve needs a single Kd axis
+            if selected_model not in MULTI_KD_MODELS and store.load_lcurve_summary() is None:
+                l_curve_summary = LCurveAnalysis.analyze_results(
+                    chi_squared_values, LCURVE_BOOTSTRAP_REPLICATES
                 )
-                results.append(chi_squared_df)
+                # Too few Kd values of a partial run for an L-curve; the best Kd still stands
+                if l_curve_summary is not None:
+                    store.save_lcurve(l_curve_summary)
+            metadata.update(
+                best_kd=best_kd if isinstance(best_kd, str) else float(best_kd),
+                chi2_values=[float(result["chi2"].min()) for result in results],
+            )
+        if partial:
+            # A partial result is not cached; the next run resumes from the checkpoints
+            metadata.update(partial=True, fitted_points=fitted_points, grid_points=grid_points)
+        elif not stack:
+            # Fits of a series are rebuilt from the session's stack, so it is not cached
+            result_cache.put(analysis_key, session_dir)
+        store.save_metadata(metadata)
+
+
+def completed_points(results):
+    """
+    Keep the grid points fitted at every concentration, for an analysis
+    stopped by its time budget
+    Returns:
+        Tuple of (per-concentration results, number of points kept, number of grid points)
+    """
+    keys = ["n", "kd"] if "n" in results[0].columns else ["kd"]
+    fitted = [
+        set(result.loc[result["chi2"].notna(), keys].itertuples(index=False, name=None))
+        for result in results
+    ]
+    common = set.intersection(*fitted)
+    grid_points = max(len(result) for result in results)
+    results = [
+        result[[point in common for point in result[keys].itertuples(index=False, name=None)]]
+        .reset_index(drop=True)
+        for result in results
+    ]
+    return results, len(common), grid_points
+
+
+def render_analysis(session_dir):
+    """
+    Plots of the analysis stored in a session, as shown when its job finishes
+    Returns:
+        Tuple of (χ² figure, fraction figure, SAXS fit plots, experimental data store)
+    """
+    store = ResultStore(session_dir)
+    metadata = store.load_metadata()
+    chi2 = store.load_chi2()
+    units = metadata["units"]
+    experimental_concentrations = metadata["experimental_concentrations"]
+    concentration_colors = metadata["concentration_colors"]
+    stored_data = {
+        "experimental_concentrations": experimental_concentrations,
+        "concentration_colors": concentration_colors,
+        "best_kd": metadata["best_kd"],
+        "chi2_values": metadata["chi2_values"],
+        "units": units,
+    }
+    if metadata.get("stack"):
+        # χ² of every frame, and the first page of fits at the best Kd
+        stored_data.update(stack=True, frames=len(metadata["frames"]))
+        return (
+            create_stack_heatmap(chi2, units=units),
+            create_empty_fraction_plot(),
+            create_stack_fit_plots(session_dir, metadata["best_kd"], units=units),
+            stored_data,
+        )
 
-    return results, concentration_colors
+    results = [
+        chi2[chi2["concentration"] == concentration].reset_index(drop=True)
+        for concentration in experimental_concentrations
+    ]
+    if metadata.get("partial"):
+        stored_data.update(
+            partial=True,
+            fitted_points=metadata["fitted_points"],
+            grid_points=metadata["grid_points"],
+        )
+
+    if metadata.get("n_scan"):
+        # χ² per n and the best fit of every n side by side
+        average = chi2.groupby(["n", "kd"])["chi2"].mean()
+        scan_kds = {
+            str(n): float(kd) for n, kd in average.groupby(level="n").idxmin().str[1].items()
+        }
+        stored_data.update(best_n=metadata["best_n"], n_scan=scan_kds)
+        return (
+            create_stoichiometry_scan_plot(results, units=units),
+            create_empty_fraction_plot(),
+            create_scan_fit_plots(
+                experimental_concentrations,
+                concentration_colors,
+                session_dir,
+                scan_kds,
+                units=units,
+            ),
+            stored_data,
+        )
+
+    if metadata["model"] in MULTI_KD_MODELS:
+        chi_squared_plot = create_chi_squared_heatmap(results, units=units)
+    else:
+        chi_squared_plot = create_chi_squared_plot(
+            results,
+            concentration_colors,
+            units=units,
+            l_curve_summary=store.load_lcurve_summary(),
+        )
+    saxs_fit_plots = create_saxs_fit_plots(
+        results,
+        concentration_colors,
+        session_dir,
+        units=units,
+    )
+    # The fraction plot waits for a Kd to be clicked
+    return chi_squared_plot, create_empty_fraction_plot(), saxs_fit_plots, stored_data
 
 
 def extract_saxs_data(item, q_units):
@@ -316,7 +951,198 @@ def register_callbacks_analysis(app, get_session_dir):
             raise PreventUpdate
         return True, {"n_clicks": n_clicks}
 
-    # Main callback for calculations
+    # Validate the inputs and start the analysis as a background job
+    @app.callback(
+        [
+            Output("job-store", "data"),
+            Output("message-modal", "is_open", allow_duplicate=True),
+            Output("modal-content", "children", allow_duplicate=True),
+        ],
+        Input("calculation-trigger", "data"),
+        [
+            State("model-selection", "value"),
+            State("input-n", "value"),
+            State("saxs-upload-container", "children"),
+            State("theoretical-saxs-upload-container", "children"),
+            State("kd-min", "value"),
+            State("kd-max", "value"),
+            State("kd-points", "value"),
+            State("conc-min", "value"),
+            State("conc-max", "value"),
+            State("conc-points", "value"),
+            State("input-receptor-concentration", "value"),
+            State("concentration-units", "value"),
+            State("q-units", "value"),
+            State("input-n-scan", "value"),
+            State("time-budget", "value"),
+            State("stack-mode", "value"),
+        ],
+        prevent_initial_call=True,
+    )
+    def start_analysis(
+        calculation_trigger,
+        selected_model,
+        n_value,
+        upload_container,
+        theoretical_saxs_uploads,
+        kd_min,
+        kd_max,
+        kd_points,
+        conc_min,
+        conc_max,
+        conc_points,
+        receptor_concentration,
+        units,
+        q_units,
+        n_scan,
+        time_budget_seconds,
+        stack_mode,
+    ):
+        # Basic validation first
+        if not os.path.exists(ATSAS_PATH):
+            return dash.no_update, True, f"Error: ATSAS path '{ATSAS_PATH}' does not exist."
+
+        if None in [kd_min, kd_max, kd_points, conc_min, conc_max, conc_points]:
+            return dash.no_update, True, "Please fill in all Kd and concentration fields."
+
+        kd_range = (kd_min, kd_max)
+        input_errors = validate_inputs(
+            selected_model,
+            n_value,
+            upload_container,
+            theoretical_saxs_uploads,
+            kd_range,
+            receptor_concentration,
+            kd_points,
+            conc_points,
+            n_scan if selected_model == "kds_saxs_mon_oligomer" and not stack_mode else None,
+            stack=stack_mode,
+        )
+        if time_budget_seconds is not None and not 0 < time_budget_seconds <= MAX_TIME_BUDGET:
+            input_errors.append(f"The time limit must be between 0 and {MAX_TIME_BUDGET} s.")
+        if stack_mode:
+            stack_session = session_directory(create=False)
+            if not stack_session or not ProfileStack(stack_session).exists():
+                input_errors.append("No high-throughput series uploaded.")
+        if not input_errors:
+            # Reject unusable files before any compute is spent on them; the
+            # frames of a series were parsed when the stack was built, and
+            # only their overlap with the basis is left to check
+            input_errors = preflight_check(
+                selected_model,
+                n_value,
+                [] if stack_mode else upload_container,
+                theoretical_saxs_uploads,
+                q_units,
+                stack=ProfileStack(stack_session) if stack_mode else None,
+            )
+        if input_errors:
+            return (
+                dash.no_update,
+                True,
+                html.Div(
+                    [html.P(error) for error in input_errors],
+                    className="message-error",
+                ),
+            )
+
+        # All tabs of a browser share the session directory and its lock;
+        # it is only created once there is an analysis to run
+        session_dir = session_directory()
+        job_id = job_runner.submit(
+            session_dir,
+            {
+                "model": selected_model,
+                "n": n_value,
+                "n_values": (
+                    parse_n_scan(n_scan)
+                    if n_scan and selected_model == "kds_saxs_mon_oligomer" and not stack_mode
+                    else []
+                ),
+                "upload_container": upload_container,
+                "theoretical_saxs_uploads": theoretical_saxs_uploads,
+                "kd_range": list(kd_range),
+                "receptor_concentration": receptor_concentration,
+                "kd_points": kd_points,
+                "concentration_range": [conc_min, conc_max, conc_points],
+                "q_units": q_units,
+                "units": units,
+                "time_budget": time_budget_seconds,
+                "stack": bool(stack_mode),
+            },
+            run_analysis,
+        )
+        return {"id": job_id}, dash.no_update, dash.no_update
+
+    # The job id outlives a page reload, so the page reattaches to its job
+    @app.callback(
+        Output("job-poll", "disabled"),
+        Input("job-store", "data"),
+    )
+    def attach_job(job):
+        return not job
+
+    @app.callback(
+        [
+            Output("job-store", "data", allow_duplicate=True),
+            Output("loading-modal", "is_open", allow_duplicate=True),
+            Output("message-modal", "is_open", allow_duplicate=True),
+            Output("modal-content", "children", allow_duplicate=True),
+            Output("chi2-plot", "figure", allow_duplicate=True),
+            Output("fraction-plot", "figure", allow_duplicate=True),
+            Output("saxs-fit-plots", "children", allow_duplicate=True),
+            Output("experimental-data-store", "data", allow_duplicate=True),
+        ],
+        Input("job-poll", "n_intervals"),
+        State("job-store", "data"),
+        prevent_initial_call=True,
+    )
+    def poll_analysis(n_intervals, job):
+        if not job:
+            raise PreventUpdate
+
+        session_dir = get_session_dir()
+        status = job_runner.status(job["id"])
+        if status is None or status["session_dir"] != session_dir:
+            # Unknown job, or one of a session that has since expired
+            return (None,) + (dash.no_update,) * 7
+        job_runner.touch(job["id"])
+
+        if status["status"] == "interrupted":
+            # The worker running the job died; continue from its checkpoints
+            job_runner.resume(job["id"], run_analysis)
+        if status["status"] in ("running", "interrupted"):
+            return (dash.no_update, True) + (dash.no_update,) * 6
+
+        if status["status"] in ("failed", "cancelled"):
+            return (
+                None,
+                dash.no_update,
+                True,
+                html.Div(status["error"], className="message-error"),
+            ) + (dash.no_update,) * 4
+
+        chi_squared_plot, fraction_plot, saxs_fit_plots, stored_data = render_analysis(session_dir)
+        if stored_data.get("partial"):
+            message = html.Div(
+                f"Partial result: the time budget ran out after {stored_data['fitted_points']} "
+                f"of {stored_data['grid_points']} Kd values. Run the analysis again to continue.",
+                className="message-warning",
+            )
+        else:
+            message = html.Div("Analysis Complete!", className="message-success")
+        return (
+            None,
+            dash.no_update,
+            True,
+            message,
+            chi_squared_plot,
+            fraction_plot,
+            saxs_fit_plots,
+            stored_data,
+        )
+
+    # Message modal and Kd selection in the χ² plot
     @app.callback(
         [
             Output("message-modal", "is_open"),
@@ -327,48 +1153,32 @@ def register_callbacks_analysis(app, get_session_dir):
             Output("experimental-data-store", "data"),
         ],
         [
-            Input("calculation-trigger", "data"),
             Input("close-modal", "n_clicks"),
             Input("chi2-plot", "clickData"),
         ],
         [
             State("model-selection", "value"),
             State("input-n", "value"),
-            State("saxs-upload-container", "children"),
-            State("theoretical-saxs-upload-container", "children"),
-            State("kd-min", "value"),
-            State("kd-max", "value"),
-            State("kd-points", "value"),
             State("conc-min", "value"),
             State("conc-max", "value"),
             State("conc-points", "value"),
             State("input-receptor-concentration", "value"),
             State("concentration-units", "value"),
             State("experimental-data-store", "data"),
-            State("message-modal", "is_open"),
-            State("q-units", "value"),
         ],
         prevent_initial_call=True,
     )
     def update_all(
-        calculation_trigger,
         close_clicks,
         click_data,
         selected_model,
         n_value,
-        upload_container,
-        theoretical_saxs_uploads,
-        kd_min,
-        kd_max,
-        kd_points,
         conc_min,
         conc_max,
         conc_points,
         receptor_concentration,
         units,
         stored_data,
-        modal_is_open,
-        q_units,
     ):
         ctx = dash.callback_context
         if not ctx.triggered:
@@ -386,134 +1196,37 @@ def register_callbacks_analysis(app, get_session_dir):
                 dash.no_update,
             )
 
-        elif trigger_id == "calculation-trigger":
-            # Basic validation first
-            if not os.path.exists(ATSAS_PATH):
-                return (
-                    True,
-                    f"Error: ATSAS path '{ATSAS_PATH}' does not exist.",
-                    dash.no_update,
-                    dash.no_update,
-                    dash.no_update,
-                    dash.no_update,
-                )
+        elif trigger_id == "chi2-plot":
+            if click_data is None or stored_data is None:
+                raise PreventUpdate
 
-            if None in [kd_min, kd_max, kd_points, conc_min, conc_max, conc_points]:
-                return (
-                    True,
-                    "Please fill in all Kd and concentration fields.",
-                    dash.no_update,
-                    dash.no_update,
-                    dash.no_update,
-                    dash.no_update,
+            point = click_data["points"][0]
+            if stored_data.get("n_scan"):
+                return select_scan_point(
+                    point, stored_data, conc_min, conc_max, conc_points,
+                    selected_model, receptor_concentration, units,
                 )
 
-            # Create new session for this analysis
-            from config import create_session_dir
-
-            session["session_dir"] = create_session_dir()
-
-            kd_range = (kd_min, kd_max)
-            concentration_range = np.linspace(conc_min, conc_max, conc_points)
-            input_errors = validate_inputs(
-                selected_model,
-                n_value,
-                upload_container,
-                theoretical_saxs_uploads,
-                kd_range,
-                receptor_concentration,
-                kd_points,
-                conc_points,
-            )
-            if input_errors:
-                return (
-                    True,
-                    html.Div(
-                        [html.P(error) for error in input_errors],
-                        className="message-error",
-                    ),
-                    dash.no_update,
-                    dash.no_update,
-                    dash.no_update,
-                    dash.no_update,
-                )
-
-            try:
-                results, concentration_colors = process_saxs_data(
-                    selected_model,
+            if stored_data.get("stack"):
+                # Any cell of a frame's row selects its Kd for all frames
+                stored_data["selected_kd"] = point["x"]
+                fraction_plot = create_fraction_plot(
+                    point["x"],
                     n_value,
-                    upload_container,
-                    theoretical_saxs_uploads,
-                    kd_range,
+                    np.linspace(conc_min, conc_max, conc_points),
+                    selected_model,
                     receptor_concentration,
-                    session["session_dir"],
-                    kd_points,
-                    q_units,
-                )
-                if results:
-                    chi_squared_plot = create_chi_squared_plot(
-                        results, concentration_colors, units=units
-                    )
-                    saxs_fit_plots = create_saxs_fit_plots(
-                        results,
-                        concentration_colors,
-                        session["session_dir"],
-                        units=units,
-                    )
-
-                    experimental_concentrations = [
-                        result["concentration"].unique()[0] for result in results
-                    ]
-
-                    # Get chi² values from the average curve
-                    chi_squared_values = pd.concat(results)
-                    avg_chi_squared = chi_squared_values.groupby("kd")["chi2"].mean()
-                    best_kd = avg_chi_squared.index[avg_chi_squared.argmin()]
-
-                    # Instead of creating fraction plot, create empty plot with instruction
-                    fraction_plot = create_empty_fraction_plot()
-
-                    stored_data = {
-                        "experimental_concentrations": experimental_concentrations,
-                        "concentration_colors": concentration_colors,
-                        "best_kd": best_kd,
-                        "chi2_values": [result["chi2"].min() for result in results],
-                        "units": units,
-                    }
-
-                    return (
-                        True,
-                        html.Div("Analysis Complete!", className="message-success"),
-                        chi_squared_plot,
-                        fraction_plot,
-                        saxs_fit_plots,
-                        stored_data,
-                    )
-                else:
-                    return (
-                        True,
-                        html.Div("No valid data processed.", className="message-error"),
-                        dash.no_update,
-                        dash.no_update,
-                        dash.no_update,
-                        dash.no_update,
-                    )
-            except Exception as e:
-                logger.exception("Error during analysis")
-                return (
-                    True,
-                    f"An error occurred during analysis: {str(e)}",
-                    dash.no_update,
-                    dash.no_update,
-                    dash.no_update,
-                    dash.no_update,
+                    [],
+                    {},
+                    units=units,
                 )
+                saxs_fit_plots = create_stack_fit_plots(get_session_dir(), point["x"], units=units)
+                return False, "", dash.no_update, fraction_plot, saxs_fit_plots, stored_data
 
-        elif trigger_id == "chi2-plot":
-            if click_data is None or stored_data is None:
+            # Heatmap cells of multi-Kd models carry their grid point label
+            clicked_kd = point.get("customdata", point["x"])
+            if clicked_kd is None:
                 raise PreventUpdate
-
-            clicked_kd = click_data["points"][0]["x"]
             # Update stored data with selected Kd
             stored_data["selected_kd"] = clicked_kd
             concentration_range = np.linspace(conc_min, conc_max, conc_points)
@@ -538,7 +1251,7 @@ def register_callbacks_analysis(app, get_session_dir):
             saxs_fit_plots = create_saxs_fit_plots(
                 experimental_concentrations,
                 concentration_colors,
-                session["session_dir"],
+                get_session_dir(),
                 clicked_kd,
                 stored_data["chi2_values"],
                 units=units,
@@ -548,6 +1261,80 @@ def register_callbacks_analysis(app, get_session_dir):
 
         return False, "", dash.no_update, dash.no_update, dash.no_update, dash.no_update
 
+    # Fits of a high-throughput series are shown a page at a time
+    @app.callback(
+        [
+            Output("fit-pagination", "style"),
+            Output("fit-page", "max_value"),
+            Output("fit-page", "active_page"),
+        ],
+        Input("experimental-data-store", "data"),
+        prevent_initial_call=True,
+    )
+    def update_fit_pagination(stored_data):
+        if not stored_data or not stored_data.get("stack"):
+            return {"display": "none"}, 1, 1
+        pages = -(-stored_data["frames"] // STACK_FITS_PER_PAGE)
+        return {"display": "flex", "justifyContent": "center"}, pages, 1
+
+    @app.callback(
+        Output("saxs-fit-plots", "children", allow_duplicate=True),
+        Input("fit-page", "active_page"),
+        State("experimental-data-store", "data"),
+        prevent_initial_call=True,
+    )
+    def show_fit_page(page, stored_data):
+        if not page or not stored_data or not stored_data.get("stack"):
+            raise PreventUpdate
+        kd = stored_data.get("selected_kd", stored_data["best_kd"])
+        return create_stack_fit_plots(get_session_dir(), kd, page, units=stored_data["units"])
+
+    @app.callback(
+        Output("queue-status", "children", allow_duplicate=True),
+        Input("cancel-analysis", "n_clicks"),
+        State("job-store", "data"),
+        prevent_initial_call=True,
+    )
+    def cancel_analysis(n_clicks, job):
+        if not n_clicks or not job:
+            raise PreventUpdate
+        job_runner.cancel(job["id"])
+        return "Cancelling..."
+
+    @app.callback(
+        Output("queue-poll", "disabled"),
+        Input("loading-modal", "is_open"),
+    )
+    def toggle_queue_poll(loading):
+        return not loading
+
+    @app.callback(
+        Output("queue-status", "children"),
+        Input("queue-poll", "n_intervals"),
+        prevent_initial_call=True,
+    )
+    def update_queue_status(n_intervals):
+        session_dir = get_session_dir()
+        if not session_dir:
+            return ""
+        session_id = os.path.basename(session_dir)
+        statuses = []
+        if pool_enabled():
+            # Pool tasks wait in the broker queue, then on the server's
+            # host also for one of its ATSAS slots
+            try:
+                statuses.append(("worker pool", connect().status(session_id)))
+            except (ConnectionError, EOFError):
+                pass
+        statuses.append(("server", scheduler.status(session_id)))
+        for place, status in statuses:
+            if status["position"] is not None and not status["running"]:
+                return f"Waiting for a free ATSAS slot: position {status['position']} of {status['waiting']} in the {place} queue"
+        for place, status in statuses:
+            if status["running"]:
+                return f"Running {status['running']} ATSAS job(s), {status['waiting']} waiting on the {place}"
+        return ""
+
     # Callback to close loading modal after calculations
     @app.callback(
         Output("loading-modal", "is_open", allow_duplicate=True),
@@ -564,23 +1351,26 @@ def register_callbacks_analysis(app, get_session_dir):
         prevent_initial_call=True,
     )
     def save_chi2_csv(n_clicks, figure):
-        if figure is not None:
-            df = pd.DataFrame(
-                {"Kd": figure["data"][0]["x"], "Chi2": figure["data"][0]["y"]}
-            )
-            return dcc.send_data_frame(df.to_csv, "chi2_plot.csv", index=False)
+        session_dir = get_session_dir()
+        if figure is not None and session_dir:
+            df = ResultStore(session_dir).chi2_table()
+            if df is not None:
+                return dcc.send_data_frame(df.to_csv, "chi2_plot.csv", index=False)
         return dash.no_update
 
     @app.callback(
-        Output("download-chi2-pdf", "data"),
+        [
+            Output("export-job-store", "data", allow_duplicate=True),
+            Output("export-poll", "disabled", allow_duplicate=True),
+        ],
         Input("save-chi2-pdf", "n_clicks"),
-        State("chi2-plot", "figure"),
+        [State("chi2-plot", "figure"), State("export-job-store", "data")],
         prevent_initial_call=True,
     )
-    def save_chi2_pdf(n_clicks, figure):
-        if figure is not None:
-            return dcc.send_bytes(create_pdf(figure), "chi2_plot.pdf")
-        return dash.no_update
+    def save_chi2_pdf(n_clicks, figure, export_jobs):
+        if figure is None:
+            raise PreventUpdate
+        return queue_export(export_jobs, [figure], "chi2_plot.pdf")
 
     @app.callback(
         Output("download-fraction-csv", "data"),
@@ -589,26 +1379,29 @@ def register_callbacks_analysis(app, get_session_dir):
         prevent_initial_call=True,
     )
     def save_fraction_csv(n_clicks, figure):
-        if figure is not None:
-            df = pd.DataFrame(
-                {
-                    "Concentration": figure["data"][0]["x"],
-                    "Fraction": figure["data"][0]["y"],
-                }
-            )
+        if figure is not None and figure.get("data"):
+            # One column per species; the 2-point experimental markers are skipped
+            concentrations = figure["data"][0]["x"]
+            df = pd.DataFrame({"Concentration": concentrations})
+            for trace in figure["data"]:
+                if len(trace["x"]) == len(concentrations):
+                    df[trace["name"]] = trace["y"]
             return dcc.send_data_frame(df.to_csv, "fraction_plot.csv", index=False)
         return dash.no_update
 
     @app.callback(
-        Output("download-fraction-pdf", "data"),
+        [
+            Output("export-job-store", "data", allow_duplicate=True),
+            Output("export-poll", "disabled", allow_duplicate=True),
+        ],
         Input("save-fraction-pdf", "n_clicks"),
-        State("fraction-plot", "figure"),
+        [State("fraction-plot", "figure"), State("export-job-store", "data")],
         prevent_initial_call=True,
     )
-    def save_fraction_pdf(n_clicks, figure):
-        if figure is not None:
-            return dcc.send_bytes(create_pdf(figure), "fraction_plot.pdf")
-        return dash.no_update
+    def save_fraction_pdf(n_clicks, figure, export_jobs):
+        if figure is None:
+            raise PreventUpdate
+        return queue_export(export_jobs, [figure], "fraction_plot.pdf")
 
     @app.callback(
         Output({"type": "download-saxs-fit-csv", "index": MATCH}, "data"),
@@ -622,6 +1415,8 @@ def register_callbacks_analysis(app, get_session_dir):
 
         # Get current session directory
         session_dir = get_session_dir()
+        if not session_dir:
+            raise PreventUpdate
 
         ctx = dash.callback_context
         button_id = ctx.triggered[0]["prop_id"]
@@ -630,31 +1425,32 @@ def register_callbacks_analysis(app, get_session_dir):
         concentration = stored_data["experimental_concentrations"][index]
         kd = stored_data.get("selected_kd", stored_data["best_kd"])
 
-        fit_file = os.path.join(
-            session_dir, "fits", f"fit_{format_concentration(concentration)}_{kd}.fit"
-        )
-        fit_data = pd.read_csv(
-            fit_file, sep="\s+", skiprows=1, names=["s", "Iexp", "sigma", "Ifit"]
-        )
+        fit_data = ResultStore(session_dir).load_fit(concentration, kd)
 
         return dcc.send_data_frame(
             fit_data.to_csv, f"saxs_fit_{index + 1}.csv", index=False
         )
 
     @app.callback(
-        Output({"type": "download-saxs-fit-pdf", "index": MATCH}, "data"),
-        Input({"type": "save-saxs-fit-pdf", "index": MATCH}, "n_clicks"),
-        State("experimental-data-store", "data"),
+        [
+            Output("export-job-store", "data", allow_duplicate=True),
+            Output("export-poll", "disabled", allow_duplicate=True),
+        ],
+        Input({"type": "save-saxs-fit-pdf", "index": ALL}, "n_clicks"),
+        [State("experimental-data-store", "data"), State("export-job-store", "data")],
         prevent_initial_call=True,
     )
-    def save_saxs_fit_pdf(n_clicks, stored_data):
-        if n_clicks is None:
+    def save_saxs_fit_pdf(n_clicks_list, stored_data, export_jobs):
+        # Also triggered when the fit plots are (re)built, with no click
+        ctx = dash.callback_context
+        if not ctx.triggered or not ctx.triggered[0]["value"]:
             raise PreventUpdate
 
         # Get current session directory
         session_dir = get_session_dir()
+        if not session_dir:
+            raise PreventUpdate
 
-        ctx = dash.callback_context
         button_id = ctx.triggered[0]["prop_id"]
         index = json.loads(button_id.split(".")[0])["index"]
 
@@ -664,26 +1460,156 @@ def register_callbacks_analysis(app, get_session_dir):
         kd = stored_data.get("selected_kd", stored_data["best_kd"])
         chi2 = stored_data["chi2_values"][index]
 
-        # Get the fit data from the fits directory
-        fit_file = os.path.join(
-            session_dir, "fits", f"fit_{format_concentration(concentration)}_{kd}.fit"
-        )
-        fit_data = pd.read_csv(
-            fit_file, sep="\s+", skiprows=1, names=["s", "Iexp", "sigma", "Ifit"]
+        figure = fit_figure_factory(ResultStore(session_dir), concentration, kd, chi2, color)
+        return queue_export(export_jobs, [figure], f"saxs_fit_{index + 1}.pdf")
+
+    @app.callback(
+        Output("export-analysis-link", "href"),
+        Input("experimental-data-store", "data"),
+        prevent_initial_call=True,
+    )
+    def update_export_analysis_link(stored_data):
+        if not stored_data:
+            return None
+        kd = stored_data.get("selected_kd", stored_data["best_kd"])
+        if stored_data.get("n_scan"):
+            n = stored_data.get("selected_n", stored_data["best_n"])
+            return f"/export/analysis.zip?kd={kd}&n={n}"
+        return f"/export/analysis.zip?kd={kd}"
+
+    @app.callback(
+        [Output("export-job-store", "data"), Output("export-poll", "disabled")],
+        Input("save-all-pdf", "n_clicks"),
+        [
+            State("chi2-plot", "figure"),
+            State("fraction-plot", "figure"),
+            State("experimental-data-store", "data"),
+            State("export-job-store", "data"),
+        ],
+        prevent_initial_call=True,
+    )
+    def start_export_all_pdf(n_clicks, chi2_figure, fraction_figure, stored_data, export_jobs):
+        if n_clicks is None or stored_data is None:
+            raise PreventUpdate
+
+        session_dir = get_session_dir()
+        if not session_dir:
+            raise PreventUpdate
+        kd = stored_data.get("selected_kd", stored_data["best_kd"])
+
+        n = (
+            stored_data.get("selected_n", stored_data["best_n"])
+            if stored_data.get("n_scan")
+            else None
         )
 
-        # Create plot with all required arguments
-        fig = create_single_saxs_fit_plot(fit_data, concentration, kd, chi2, color)
+        store = ResultStore(session_dir)
+        figures = [chi2_figure, fraction_figure]
+        for index, concentration in enumerate(
+            stored_data["experimental_concentrations"]
+        ):
+            if store.has_fit(concentration, kd, n):
+                chi2 = (
+                    store.chi2_value(concentration, kd, n)
+                    if n is not None
+                    else stored_data["chi2_values"][index]
+                )
+                figures.append(
+                    fit_figure_factory(
+                        store,
+                        concentration,
+                        kd,
+                        chi2,
+                        stored_data["concentration_colors"][concentration],
+                        n,
+                    )
+                )
 
-        # Convert to PDF
-        buffer = io.BytesIO()
-        pio.write_image(fig, buffer, format="pdf")
-        buffer.seek(0)
+        return queue_export(export_jobs, figures, "kdsaxs_analysis.pdf")
 
-        return dcc.send_bytes(buffer.getvalue(), f"saxs_fit_{index + 1}.pdf")
+    @app.callback(
+        [
+            Output("download-pdf", "data"),
+            Output("export-job-store", "data", allow_duplicate=True),
+            Output("export-poll", "disabled", allow_duplicate=True),
+        ],
+        Input("export-poll", "n_intervals"),
+        State("export-job-store", "data"),
+        prevent_initial_call=True,
+    )
+    def poll_exports(n_intervals, export_jobs):
+        if not export_jobs:
+            return dash.no_update, dash.no_update, True
+
+        # One finished export is downloaded per poll, the others on the next ones
+        download = dash.no_update
+        pending = []
+        for job in export_jobs:
+            output_path = job["path"]
+            if download is dash.no_update and os.path.exists(output_path):
+                download = dcc.send_file(output_path, job["filename"])
+                os.remove(output_path)
+            elif os.path.exists(f"{output_path}.error"):
+                logger.error(f"PDF export failed for {output_path}")
+                os.remove(f"{output_path}.error")
+            else:
+                pending.append(job)
+        if len(pending) == len(export_jobs):
+            raise PreventUpdate
+        return download, pending, not pending
+
+    def select_scan_point(
+        point, stored_data, conc_min, conc_max, conc_points,
+        selected_model, receptor_concentration, units,
+    ):
+        """Fractions and fits for a (n, Kd) point clicked in the scan plot"""
+        clicked_n = int(point["customdata"])
+        clicked_kd = point["x"]
+        stored_data["selected_n"] = clicked_n
+        stored_data["selected_kd"] = clicked_kd
+
+        fraction_plot = create_fraction_plot(
+            clicked_kd,
+            clicked_n,
+            np.linspace(conc_min, conc_max, conc_points),
+            selected_model,
+            receptor_concentration,
+            stored_data["experimental_concentrations"],
+            stored_data["concentration_colors"],
+            units=units,
+        )
+        saxs_fit_plots = create_scan_fit_plots(
+            stored_data["experimental_concentrations"],
+            stored_data["concentration_colors"],
+            get_session_dir(),
+            {**stored_data["n_scan"], str(clicked_n): clicked_kd},
+            units=units,
+        )
+        return False, "", dash.no_update, fraction_plot, saxs_fit_plots, stored_data
+
+    def fit_figure_factory(store, concentration, kd, chi2, color, n=None):
+        # Deferred so the fit is loaded on the render thread
+        return lambda: create_single_saxs_fit_plot(
+            store.load_fit(concentration, kd, n), concentration, kd, chi2, color
+        )
 
-    def create_pdf(figure):
-        buffer = io.BytesIO()
-        pio.write_image(figure, buffer, format="pdf")
-        buffer.seek(0)
-        return buffer.getvalue()
+    def queue_export(export_jobs, figures, filename):
+        """
+        Render figures to a PDF in the background, downloaded by poll_exports
+        once written
+        Args:
+            export_jobs: exports the page is already waiting for
+            figures: figures or callables building them, one page each
+            filename: name the PDF is downloaded as
+        Returns:
+            Tuple of (exports to wait for, export-poll disabled)
+        """
+        session_dir = get_session_dir()
+        if not session_dir:
+            raise PreventUpdate
+        output_path = os.path.join(session_dir, "exports", f"{uuid.uuid4().hex}.pdf")
+        if len(figures) == 1:
+            export_service.submit(figures[0], output_path)
+        else:
+            export_service.submit_batch(figures, output_path)
+        return (export_jobs or []) + [{"path": output_path, "filename": filename}], False
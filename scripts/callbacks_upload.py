@@ -7,9 +7,83 @@ from dash import dcc, html
 from dash.dependencies import MATCH, Input, Output, State, ALL
 from dash.exceptions import PreventUpdate
 
-from config import BASE_DIR, MAX_PDB_SIZE, MAX_PDB_UPLOADS
+from config import ALLOWED_MODELS, BASE_DIR, MAX_PDB_SIZE, MAX_PDB_UPLOADS
 from scripts.error_handling import logger
-from scripts.utils import truncate_filename
+from scripts.profile_stack import ProfileStack
+from scripts.utils import (
+    STORED_UPLOAD,
+    concentration_from_filename,
+    decode_contents,
+    session_directory,
+    theoretical_upload_labels,
+    truncate_filename,
+)
+
+
+def inline_upload_size(contents):
+    """Size in bytes of a base64 upload; files sent in parts were checked by their route"""
+    if not contents or contents.startswith(STORED_UPLOAD):
+        return 0
+    return len(base64.b64decode(contents.split(",")[1]))
+
+
+def experimental_upload_row(index, contents=None, filename=None, concentration=None):
+    """Upload field and concentration input of one experimental profile"""
+    return html.Div(
+        [
+            html.Div(
+                [
+                    dcc.Upload(
+                        id={"type": "upload-exp-saxs", "index": index},
+                        children=html.Div(
+                            [
+                                html.Span(truncate_filename(filename), className="truncated-filename", title=filename)
+                                if filename
+                                else "Drag and Drop or Select Experimental SAXS File"
+                            ]
+                        ),
+                        contents=contents,
+                        filename=filename,
+                        className="upload-style",
+                        multiple=False,
+                    ),
+                    html.I(
+                        className="fas fa-minus-circle",
+                        id={"type": "delete-saxs", "index": index},
+                        n_clicks=0,
+                        style={
+                            "position": "absolute",
+                            "top": "5px",
+                            "right": "5px",
+                            "cursor": "pointer",
+                        },
+                    ),
+                ],
+                style={"position": "relative", "flex": "3", "marginRight": "10px"},
+            ),
+            dcc.Input(
+                id={"type": "input-concentration", "index": index},
+                type="number",
+                placeholder="Concentration",
+                value=concentration,
+                min=0,
+                step=0.1,
+                className="input-style",
+                style={"flex": "1"},
+            ),
+        ],
+        style={"display": "flex", "alignItems": "center", "marginBottom": "10px"},
+    )
+
+
+def upload_index(row):
+    """Index of an experimental upload row"""
+    return row["props"]["children"][0]["props"]["children"][0]["props"]["id"]["index"]
+
+
+def upload_contents(row):
+    """Contents of an experimental upload row, None while empty"""
+    return row["props"]["children"][0]["props"]["children"][0]["props"].get("contents")
 
 
 def register_callbacks_upload(app):
@@ -23,45 +97,7 @@ def register_callbacks_upload(app):
             return dash.no_update
 
         new_index = len(children) + 1
-        new_upload = html.Div(
-            [
-                html.Div(
-                    [
-                        dcc.Upload(
-                            id={"type": "upload-exp-saxs", "index": new_index},
-                            children=html.Div(
-                                ["Drag and Drop or Select Experimental SAXS File"]
-                            ),
-                            className="upload-style",
-                            multiple=False,
-                        ),
-                        html.I(
-                            className="fas fa-minus-circle",
-                            id={"type": "delete-saxs", "index": new_index},
-                            n_clicks=0,
-                            style={
-                                "position": "absolute",
-                                "top": "5px",
-                                "right": "5px",
-                                "cursor": "pointer",
-                            },
-                        ),
-                    ],
-                    style={"position": "relative", "flex": "3", "marginRight": "10px"},
-                ),
-                dcc.Input(
-                    id={"type": "input-concentration", "index": new_index},
-                    type="number",
-                    placeholder="Concentration",
-                    value=None,
-                    min=0,
-                    step=0.1,
-                    className="input-style",
-                    style={"flex": "1"},
-                ),
-            ],
-            style={"display": "flex", "alignItems": "center", "marginBottom": "10px"},
-        )
+        new_upload = experimental_upload_row(new_index)
         children.append(new_upload)
         return children
 
@@ -81,7 +117,15 @@ def register_callbacks_upload(app):
         Output("n-input-container", "style"), [Input("model-selection", "value")]
     )
     def display_n_input(selected_model):
-        if selected_model in ["kds_saxs_mon_oligomer", "kds_saxs_oligomer_fitting"]:
+        if selected_model in ALLOWED_MODELS:
+            return {"display": "inline-block", "marginRight": "20px"}
+        return {"display": "none"}
+
+    @app.callback(
+        Output("n-scan-container", "style"), [Input("model-selection", "value")]
+    )
+    def display_n_scan_input(selected_model):
+        if selected_model == "kds_saxs_mon_oligomer":
             return {"display": "inline-block", "marginRight": "20px"}
         return {"display": "none"}
 
@@ -90,7 +134,7 @@ def register_callbacks_upload(app):
         [Input("model-selection", "value")],
     )
     def toggle_receptor_concentration_input(selected_model):
-        if selected_model == "kds_saxs_oligomer_fitting":
+        if selected_model in ["kds_saxs_oligomer_fitting", "kds_saxs_cooperative_binding"]:
             return {"display": "inline-block"}
         return {"display": "none"}
 
@@ -104,52 +148,28 @@ def register_callbacks_upload(app):
         prevent_initial_call=False,
     )
     def update_theoretical_saxs_uploads(selected_model, n_value, use_pdb):
-        if selected_model == "kds_saxs_oligomer_fitting" and n_value is not None:
-            uploads = []
-            total_files = n_value + 2
-
-            labels = ["Free Receptor"]
-            labels.extend([f"Receptor-Ligand_{i}" for i in range(1, n_value + 1)])
-            labels.append("Free Ligand")
-
-            for i, label in enumerate(labels):
-                file_type = "PDB" if use_pdb else "SAXS"
-                uploads.append(
-                    dcc.Upload(
-                        id={"type": "upload-theoretical-saxs", "index": i},
-                        children=html.Div(
-                            [f"Drag and Drop or Select {label} {file_type} File"]
-                        ),
-                        className="upload-style",
-                        multiple=use_pdb,
-                        accept=".pdb" if use_pdb else ".dat,.int",
-                    )
-                )
-            return uploads
-
-        elif selected_model == "kds_saxs_mon_oligomer":
-            file_type = "PDB" if use_pdb else "SAXS"
-            return [
-                dcc.Upload(
-                    id={"type": "upload-theoretical-saxs", "index": 0},
-                    children=html.Div(
-                        [f"Drag and Drop or Select Monomeric {file_type} File"]
-                    ),
-                    className="upload-style",
-                    multiple=use_pdb,
-                    accept=".pdb" if use_pdb else ".dat,.int",
-                ),
-                dcc.Upload(
-                    id={"type": "upload-theoretical-saxs", "index": 1},
-                    children=html.Div(
-                        [f"Drag and Drop or Select Oligomeric {file_type} File"]
-                    ),
-                    className="upload-style",
-                    multiple=use_pdb,
-                    accept=".pdb" if use_pdb else ".dat,.int",
-                ),
-            ]
-        return []
+        file_type = "PDB" if use_pdb else "SAXS"
+        if use_pdb:
+            # Structures are sent to /uploads/chunked by assets/chunked_upload.js,
+            # which fills in contents and filename; Dash's own upload stays off
+            upload_props = {
+                "disabled": True,
+                "className": "upload-style chunked-upload",
+                "className_disabled": "upload-style chunked-upload",
+                "style_disabled": {},
+                "accept": ".pdb,.cif,.mmcif,.gz",
+            }
+        else:
+            upload_props = {"className": "upload-style", "accept": ".dat,.int"}
+        return [
+            dcc.Upload(
+                id={"type": "upload-theoretical-saxs", "index": i},
+                children=html.Div([f"Drag and Drop or Select {label} {file_type} File"]),
+                multiple=use_pdb,
+                **upload_props,
+            )
+            for i, label in enumerate(theoretical_upload_labels(selected_model, n_value))
+        ]
 
     @app.callback(
         Output(
@@ -181,12 +201,10 @@ def register_callbacks_upload(app):
             # Add file size validation
             if isinstance(filename, list):
                 for cont in contents:
-                    content_bytes = base64.b64decode(cont.split(",")[1])
-                    if len(content_bytes) > MAX_PDB_SIZE:
+                    if inline_upload_size(cont) > MAX_PDB_SIZE:
                         raise PreventUpdate
             else:
-                content_bytes = base64.b64decode(contents.split(",")[1])
-                if len(content_bytes) > MAX_PDB_SIZE:
+                if inline_upload_size(contents) > MAX_PDB_SIZE:
                     raise PreventUpdate
 
             # Just return the raw contents - store metadata in a different way
@@ -226,8 +244,7 @@ def register_callbacks_upload(app):
                         if contents and isinstance(contents, list):
                             for cont in contents:
                                 if cont:  # Check if content exists
-                                    content_bytes = base64.b64decode(cont.split(",")[1])
-                                    if len(content_bytes) > MAX_PDB_SIZE:
+                                    if inline_upload_size(cont) > MAX_PDB_SIZE:
                                         return html.Div(
                                             [
                                                 f"Error: File exceeds {MAX_PDB_SIZE / 1024 / 1024:.1f}MB limit"
@@ -245,8 +262,7 @@ def register_callbacks_upload(app):
                     try:
                         # For single file, only check size if content is available
                         if contents:
-                            content_bytes = base64.b64decode(contents.split(",")[1])
-                            if len(content_bytes) > MAX_PDB_SIZE:
+                            if inline_upload_size(contents) > MAX_PDB_SIZE:
                                 return html.Div(
                                     [
                                         f"Error: File exceeds {MAX_PDB_SIZE / 1024 / 1024:.1f}MB limit"
@@ -283,15 +299,8 @@ def register_callbacks_upload(app):
         index = id_dict["index"] if id_dict else 0
         file_type = "PDB" if use_pdb else "SAXS"
 
-        if selected_model == "kds_saxs_mon_oligomer":
-            label = "Monomeric" if index == 0 else "Oligomeric"
-        else:
-            if index == 0:
-                label = "Free Receptor"
-            elif index == n_value + 1:
-                label = "Free Ligand"
-            else:
-                label = f"Receptor-Ligand_{index}"
+        labels = theoretical_upload_labels(selected_model, n_value)
+        label = labels[index] if index < len(labels) else ""
 
         return html.Div(
             [
@@ -317,57 +326,7 @@ def register_callbacks_upload(app):
                 raise PreventUpdate
 
             # Return to initial state with single empty upload field
-            initial_state = [
-                html.Div(
-                    [
-                        html.Div(
-                            [
-                                dcc.Upload(
-                                    id={"type": "upload-exp-saxs", "index": 1},
-                                    children=html.Div(
-                                        [
-                                            "Drag and Drop or Select Experimental SAXS File"
-                                        ]
-                                    ),
-                                    className="upload-style",
-                                    multiple=False,
-                                ),
-                                html.I(
-                                    className="fas fa-minus-circle",
-                                    id={"type": "delete-saxs", "index": 1},
-                                    n_clicks=0,
-                                    style={
-                                        "position": "absolute",
-                                        "top": "5px",
-                                        "right": "5px",
-                                        "cursor": "pointer",
-                                    },
-                                ),
-                            ],
-                            style={
-                                "position": "relative",
-                                "flex": "3",
-                                "marginRight": "10px",
-                            },
-                        ),
-                        dcc.Input(
-                            id={"type": "input-concentration", "index": 1},
-                            type="number",
-                            placeholder="Concentration",
-                            value=None,
-                            min=0,
-                            step=0.1,
-                            className="input-style",
-                            style={"flex": "1"},
-                        ),
-                    ],
-                    style={
-                        "display": "flex",
-                        "alignItems": "center",
-                        "marginBottom": "10px",
-                    },
-                )
-            ]
+            initial_state = [experimental_upload_row(1)]
             return initial_state
 
         return dash.no_update
@@ -376,8 +335,10 @@ def register_callbacks_upload(app):
         Output("n-input-label", "children"), [Input("model-selection", "value")]
     )
     def update_n_input_label(selected_model):
-        if selected_model == "kds_saxs_oligomer_fitting":
+        if selected_model in ["kds_saxs_oligomer_fitting", "kds_saxs_cooperative_binding"]:
             return "Number of binding sites: "
+        elif selected_model == "kds_saxs_sequential_oligomer":
+            return "Largest oligomer: "
         else:
             return "Stoichiometry: "
 
@@ -634,3 +595,100 @@ def register_callbacks_upload(app):
         
         # If all fields are deleted, prevent update
         return updated_children if updated_children else dash.no_update
+
+    @app.callback(
+        [
+            Output("saxs-upload-container", "children", allow_duplicate=True),
+            Output("bulk-upload-status", "children"),
+        ],
+        Input("bulk-upload-store", "data"),
+        [
+            State("saxs-upload-container", "children"),
+            State("concentration-units", "value"),
+        ],
+        prevent_initial_call=True,
+    )
+    def add_bulk_uploads(result, children, units):
+        if not result:
+            raise PreventUpdate
+
+        # Dropped files fill the rows left empty, in order of concentration
+        rows = [child for child in children if upload_contents(child)]
+        index = max((upload_index(child) for child in children), default=0) + 1
+        files = sorted(
+            ((concentration_from_filename(file["filename"], units), file) for file in result["files"]),
+            key=lambda item: (item[0] is None, item[0] or 0),
+        )
+        unnamed = []
+        for concentration, file in files:
+            if concentration is None:
+                unnamed.append(file["filename"])
+            rows.append(experimental_upload_row(index, file["contents"], file["filename"], concentration))
+            index += 1
+
+        status = []
+        if files:
+            status.append(html.P(f"Added {len(files)} profiles.", className="message-success"))
+        if unnamed:
+            status.append(html.P(
+                f"No concentration in the names of {len(unnamed)} files, e.g. {unnamed[0]}; please enter it.",
+                className="message-warning",
+            ))
+        status.extend(html.P(error, className="message-error") for error in result.get("errors", []))
+        return (rows or [experimental_upload_row(index)]), status
+
+    @app.callback(
+        [
+            Output("stack-upload", "style"),
+            Output("bulk-exp-upload", "style"),
+            Output("saxs-upload-container", "style"),
+            Output("add-saxs-button", "style"),
+        ],
+        Input("stack-mode", "value"),
+    )
+    def toggle_stack_mode(stack_mode):
+        if stack_mode:
+            return {"display": "block"}, {"display": "none"}, {"display": "none"}, {"display": "none"}
+        return {"display": "none"}, {"display": "block"}, {"display": "block"}, {"display": "inline-block"}
+
+    @app.callback(
+        Output("stack-status", "children"),
+        Input("stack-upload-store", "data"),
+        State("concentration-units", "value"),
+        prevent_initial_call=True,
+    )
+    def upload_stack(result, units):
+        if not result:
+            raise PreventUpdate
+        if result.get("errors"):
+            return [html.P(error, className="message-error") for error in result["errors"]]
+
+        session_dir = session_directory()
+        frames = []
+        unnamed = []
+        for file in result["files"]:
+            concentration = concentration_from_filename(file["filename"], units)
+            if concentration is None:
+                unnamed.append(file["filename"])
+                continue
+            text = decode_contents(file["contents"], session_dir).decode("utf8", errors="replace")
+            frames.append((file["filename"], concentration, text))
+
+        try:
+            metadata = ProfileStack(session_dir).build(frames)
+        except ValueError as e:
+            return html.Div(str(e), className="message-error")
+
+        concentrations = metadata["concentrations"]
+        status = [
+            html.P(
+                f"{len(frames)} profiles from {min(concentrations):g} to {max(concentrations):g} {units}.",
+                className="message-success",
+            )
+        ]
+        if unnamed:
+            status.append(html.P(
+                f"Skipped {len(unnamed)} files without a concentration in their name, e.g. {unnamed[0]}.",
+                className="message-warning",
+            ))
+        return status
@@ -0,0 +1,117 @@
+import os
+import signal
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+from config import CANCEL_GRACE_PERIOD, CANCEL_POLL
+from scripts.error_handling import logger
+
+_tokens = {}
+_tokens_lock = threading.Lock()
+_deadlines = {}
+
+
+class AnalysisCancelled(Exception):
+    """Raised inside an analysis whose cancellation was requested"""
+
+
+@contextmanager
+def cancellation_token(session_id):
+    """
+    Register the cancellation token of the analysis running in a session
+    Yields:
+        threading.Event that cancels the analysis when set
+    """
+    token = threading.Event()
+    with _tokens_lock:
+        previous = _tokens.get(session_id)
+        _tokens[session_id] = token
+    try:
+        yield token
+    finally:
+        with _tokens_lock:
+            if previous is None:
+                _tokens.pop(session_id, None)
+            else:
+                _tokens[session_id] = previous
+
+
+def is_cancelled(session_id):
+    token = _tokens.get(session_id)
+    return token is not None and token.is_set()
+
+
+def check_cancelled(session_id):
+    """
+    Stop the analysis of a session between two steps if it was cancelled
+    Raises:
+        AnalysisCancelled: if cancellation was requested
+    """
+    if is_cancelled(session_id):
+        raise AnalysisCancelled("Analysis cancelled.")
+
+
+def _terminate(process):
+    """Stop a process and everything it started, forcibly after the grace period"""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            process.wait(CANCEL_GRACE_PERIOD)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+
+def run_process(cmd, session_id, timeout, cwd=None):
+    """
+    Run an external program like subprocess.run with captured text output,
+    terminating it as soon as the session's analysis is cancelled
+    Raises:
+        AnalysisCancelled: if the analysis was cancelled while it ran
+        subprocess.TimeoutExpired: if it ran longer than the timeout
+    """
+    check_cancelled(session_id)
+    # A process group of its own, so helpers it spawns are terminated too
+    process = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, cwd=cwd,
+        start_new_session=True,
+    )
+    waited = 0.0
+    try:
+        while True:
+            try:
+                stdout, stderr = process.communicate(timeout=CANCEL_POLL)
+                break
+            except subprocess.TimeoutExpired:
+                waited += CANCEL_POLL
+                if is_cancelled(session_id):
+                    logger.info(f"Terminating {os.path.basename(cmd[0])} of cancelled analysis {session_id}")
+                    raise AnalysisCancelled("Analysis cancelled.")
+                if waited >= timeout:
+                    raise subprocess.TimeoutExpired(cmd, timeout)
+    except BaseException:
+        _terminate(process)
+        process.communicate()
+        raise
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+
+@contextmanager
+def time_budget(session_id, seconds):
+    """Give the analysis running in a session a wall-clock budget"""
+    _deadlines[session_id] = time.monotonic() + seconds
+    try:
+        yield
+    finally:
+        _deadlines.pop(session_id, None)
+
+
+def budget_expired(session_id):
+    """Whether the analysis of a session has used up its time budget"""
+    deadline = _deadlines.get(session_id)
+    return deadline is not None and time.monotonic() > deadline
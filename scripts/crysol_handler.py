@@ -1,8 +1,13 @@
 import os
 import subprocess
 import numpy as np
-from config import ATSAS_PATH, CRYSOL_COMMAND, CRYSOL_PARAMS
+from config import ATSAS_PATH, CRYSOL_COMMAND, CRYSOL_PARAMS, MAX_DECOMPRESSED_SIZE
+from scripts.cancellation import AnalysisCancelled, run_process
 from scripts.error_handling import logger
+from scripts.saxs_parser import load_profile
+from scripts.scheduler import scheduler
+from scripts.worker_pool import pool_enabled, run_tasks
+from scripts.workspace import SessionWorkspace, atomic_write
 
 class CrysolHandler:
     def __init__(self, session_dir):
@@ -12,61 +17,115 @@ class CrysolHandler:
             session_dir: Path to current session directory
         """
         self.session_dir = session_dir
+        self.workspace = SessionWorkspace(session_dir)
         self.crysol_path = os.path.join(ATSAS_PATH, CRYSOL_COMMAND)
         
     def run_crysol(self, pdb_file, output_prefix=None):
         """
-        Run CRYSOL on a single PDB file
+        Run CRYSOL on a single PDB or mmCIF file
         Args:
-            pdb_file: Path to PDB file
+            pdb_file: Path to PDB (.pdb) or mmCIF (.cif) file
             output_prefix: Prefix for output files (optional)
         Returns:
             Path to calculated intensity file
         """
         try:
-            if not os.path.exists(pdb_file):
-                raise FileNotFoundError(f"PDB file not found: {pdb_file}")
-            if not pdb_file.lower().endswith('.pdb'):
-                raise ValueError("Invalid file format. Must be .pdb")
-            
-            if not self.crysol_path:
-                raise RuntimeError("ATSAS path not found. Please set ATSAS environment variable.")
-            
-            # Create command with default parameters
-            cmd = [
-                self.crysol_path,
-                pdb_file,
-                '-ns', str(CRYSOL_PARAMS['points']),
-                '--implicit-hydrogen=' + str(CRYSOL_PARAMS['implicit_hydrogens'])
-            ]
-            
-            if output_prefix:
-                cmd.extend(['-p', output_prefix])
-            
-            # Run CRYSOL with timeout
-            result = subprocess.run(cmd, 
-                                 capture_output=True, 
-                                 text=True,
-                                 timeout=60,  # 60 second timeout per PDB
-                                 cwd=os.path.dirname(pdb_file))
-            
-            if result.returncode != 0:
-                raise RuntimeError(f"CRYSOL failed: {result.stderr}")
-            
-            # Get output intensity file
-            output_file = pdb_file.rsplit('.', 1)[0] + ".int"
-            if not os.path.exists(output_file):
-                raise FileNotFoundError(f"CRYSOL output file not found: {output_file}")
-            
-            return output_file
+            output_prefix = self._check_input(pdb_file, output_prefix)
+            if pool_enabled():
+                return self.run_crysol_pool([pdb_file], [output_prefix])[0]
+
+            session_id = os.path.basename(self.session_dir)
+
+            # Run CRYSOL in a private directory so concurrent runs cannot
+            # clobber each other's outputs
+            with self.workspace.scratch(f"crysol_{output_prefix}") as scratch:
+                scratch_output = os.path.join(scratch, output_prefix + ".int")
+                with scheduler.slot(session_id):
+                    result = run_process(self.command(self.crysol_path, pdb_file, output_prefix),
+                                         session_id,
+                                         timeout=60,  # 60 second timeout per PDB
+                                         cwd=scratch)
+
+                if result.returncode != 0:
+                    raise RuntimeError(f"CRYSOL failed: {result.stderr}")
+
+                # Get output intensity file
+                if not os.path.exists(scratch_output):
+                    raise FileNotFoundError(f"CRYSOL output file not found: {scratch_output}")
+                
+                return self.workspace.publish(scratch_output, self._output_file(output_prefix))
             
         except subprocess.TimeoutExpired:
             logger.error(f"CRYSOL timed out processing {pdb_file}")
             raise RuntimeError(f"CRYSOL processing timed out for {pdb_file}")
+        except AnalysisCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error running CRYSOL on {pdb_file}: {str(e)}")
             raise
     
+    def _check_input(self, pdb_file, output_prefix=None):
+        """
+        Returns:
+            Output prefix of the structure's profile
+        """
+        if not os.path.exists(pdb_file):
+            raise FileNotFoundError(f"PDB file not found: {pdb_file}")
+        if not pdb_file.lower().endswith(('.pdb', '.cif')):
+            raise ValueError("Invalid file format. Must be .pdb or .cif")
+        if os.path.getsize(pdb_file) > MAX_DECOMPRESSED_SIZE:
+            raise ValueError(f"{os.path.basename(pdb_file)} exceeds {MAX_DECOMPRESSED_SIZE / 1024 / 1024:.1f}MB")
+        if not self.crysol_path:
+            raise RuntimeError("ATSAS path not found. Please set ATSAS environment variable.")
+        return output_prefix or os.path.splitext(os.path.basename(pdb_file))[0]
+
+    def _output_file(self, output_prefix):
+        return os.path.join(self.session_dir, 'pdbs', 'calculated_profiles', output_prefix + ".int")
+
+    def run_crysol_pool(self, pdb_files, output_prefixes=None):
+        """
+        Run CRYSOL on structures on the worker pool, all submitted at once so
+        an ensemble is spread over every free worker
+        Args:
+            pdb_files: paths to PDB (.pdb) or mmCIF (.cif) files
+            output_prefixes: prefixes of the output files (optional)
+        Returns:
+            Paths to the calculated intensity files, in the order of pdb_files
+        """
+        output_prefixes = [
+            self._check_input(pdb_file, prefix)
+            for pdb_file, prefix in zip(pdb_files, output_prefixes or [None] * len(pdb_files))
+        ]
+        tasks = []
+        for pdb_file, prefix in zip(pdb_files, output_prefixes):
+            with open(pdb_file, 'rb') as fp:
+                tasks.append({"kind": "crysol", "pdb": fp.read(), "prefix": prefix,
+                              "suffix": os.path.splitext(pdb_file)[1].lower()})
+
+        results = run_tasks(os.path.basename(self.session_dir), tasks, budgeted=False)
+        output_files = []
+        for pdb_file, prefix, result in zip(pdb_files, output_prefixes, results):
+            if result is None or "error" in result:
+                raise RuntimeError(f"CRYSOL failed on {os.path.basename(pdb_file)}: "
+                                   f"{'cancelled' if result is None else result['error']}")
+            output_file = self._output_file(prefix)
+            with atomic_write(output_file) as fp:
+                fp.write(result["profile"])
+            output_files.append(output_file)
+        return output_files
+
+    @staticmethod
+    def command(crysol_path, pdb_file, output_prefix):
+        """CRYSOL command with the default parameters, run by the server or a pool worker"""
+        return [
+            crysol_path,
+            pdb_file,
+            '-ns', str(CRYSOL_PARAMS['points']),
+            '-sm', str(CRYSOL_PARAMS['smax']),
+            '--implicit-hydrogen=' + str(CRYSOL_PARAMS['implicit_hydrogens']),
+            '-p', output_prefix
+        ]
+
     def process_multiple_pdbs(self, pdb_files, state):
         """
         Process multiple PDB files for a given state
@@ -77,12 +136,15 @@ class CrysolHandler:
             Path to averaged intensity file
         """
         try:
-            # Calculate profiles for each PDB
+            # Calculate profiles for each PDB; the pool runs the whole ensemble at once
+            if pool_enabled():
+                output_files = self.run_crysol_pool(pdb_files)
+            else:
+                output_files = [self.run_crysol(pdb_file) for pdb_file in pdb_files]
             intensity_files = []
-            for pdb_file in pdb_files:
-                intensity_file = self.run_crysol(pdb_file)
+            for intensity_file in output_files:
                 # Load only q and I(q) columns from the intensity file
-                data = np.loadtxt(intensity_file, skiprows=1)
+                data = load_profile(intensity_file).data
                 intensity_files.append(data[:, [0, 1]])  # Only keep q and I(q) columns
             
             # Average the profiles if multiple files
@@ -94,10 +156,13 @@ class CrysolHandler:
                 
             # Save averaged/processed profile
             avg_file = os.path.join(self.session_dir, 'pdbs', 'averaged_profiles', f'avg_{state}.int')
-            np.savetxt(avg_file, avg_profile)
+            with atomic_write(avg_file) as fp:
+                np.savetxt(fp, avg_profile)
             
             return avg_file
             
+        except AnalysisCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error processing multiple PDBs for {state}: {str(e)}")
             raise
@@ -0,0 +1,141 @@
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from config import EXPORT_RENDERERS
+from scripts.error_handling import logger
+
+
+def merge_pdfs(pages):
+    """
+    Concatenate single-figure PDFs into one multi-page document
+    Args:
+        pages: list of PDF documents as bytes
+    Returns:
+        Merged PDF as bytes
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    writer = PdfWriter()
+    for page in pages:
+        for pdf_page in PdfReader(io.BytesIO(page)).pages:
+            writer.add_page(pdf_page)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+class PDFExportService:
+    """
+    Long-lived figure-to-PDF renderer shared by all requests of a worker.
+
+    The renderer (kaleido) is started once in the background and kept warm,
+    so exports no longer pay its startup cost on every click. Exports are
+    written to a file in the background and never block the request thread;
+    the page polls for the finished file. Batch exports are coordinated on a
+    separate thread.
+    """
+
+    def __init__(self, renderers=EXPORT_RENDERERS):
+        self.renderers = renderers if self._has_sync_server() else 1
+        self._render_pool = ThreadPoolExecutor(
+            max_workers=self.renderers, thread_name_prefix="pdf-render"
+        )
+        self._batch_pool = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="pdf-batch"
+        )
+        self._lock = threading.Lock()
+        self._warm = None
+
+    @staticmethod
+    def _has_sync_server():
+        try:
+            import kaleido
+        except ImportError:
+            return False
+        return hasattr(kaleido, "start_sync_server")
+
+    def start(self):
+        """Start and warm up the renderer without blocking the caller"""
+        with self._lock:
+            if self._warm is None:
+                self._warm = self._render_pool.submit(self._warm_up)
+        return self._warm
+
+    def _warm_up(self):
+        try:
+            # A one-shot render fails fast if the renderer is not installed
+            pio.to_image(go.Figure(), format="pdf")
+            if self._has_sync_server():
+                # Kaleido >= 1.0 launches a new browser per call unless a
+                # persistent server is running in this process
+                import kaleido
+
+                kaleido.start_sync_server(n=self.renderers, silence_warnings=True)
+            logger.info("PDF renderer ready")
+        except Exception as e:
+            logger.warning(f"Could not warm up PDF renderer: {str(e)}")
+
+    @staticmethod
+    def _render(figure):
+        if callable(figure):
+            figure = figure()
+        buffer = io.BytesIO()
+        pio.write_image(figure, buffer, format="pdf")
+        return buffer.getvalue()
+
+    def submit(self, figure, output_path):
+        """
+        Render one figure to a PDF file using the warm renderer
+        Args:
+            figure: plotly figure, figure dict or a callable returning one,
+                evaluated on the render thread
+            output_path: where the finished PDF is written
+        Returns:
+            Future resolving to output_path
+        """
+        self.start()
+        return self._render_pool.submit(self._write, output_path, lambda: self._render(figure))
+
+    def submit_batch(self, figures, output_path):
+        """
+        Render several figures concurrently into one multi-page PDF
+        Args:
+            figures: list of figures or callables building them; callables are
+                evaluated on the render threads, off the request path
+            output_path: where the finished PDF is written
+        Returns:
+            Future resolving to output_path
+        """
+        self.start()
+        return self._batch_pool.submit(self._run_batch, list(figures), output_path)
+
+    def _run_batch(self, figures, output_path):
+        def document():
+            futures = [self._render_pool.submit(self._render, fig) for fig in figures]
+            return merge_pdfs([future.result() for future in futures])
+
+        return self._write(output_path, document)
+
+    @staticmethod
+    def _write(output_path, document):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        try:
+            # Write under a temporary name so pollers never see a partial file
+            tmp_path = f"{output_path}.part"
+            with open(tmp_path, "wb") as fp:
+                fp.write(document())
+            os.replace(tmp_path, output_path)
+            return output_path
+        except Exception as e:
+            logger.exception(f"Error exporting PDF to {output_path}")
+            with open(f"{output_path}.error", "w") as fp:
+                fp.write(str(e))
+            raise
+
+
+export_service = PDFExportService()
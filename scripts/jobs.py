@@ -0,0 +1,253 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from config import (
+    JOB_ABANDONED_AFTER, JOB_CANCEL_CHECK, JOB_HEARTBEAT, JOB_RETENTION, JOB_STALE_AFTER, JOBS_DB,
+)
+from scripts.cancellation import AnalysisCancelled, cancellation_token
+from scripts.error_handling import logger
+from scripts.scheduler import HOST, _alive
+from scripts.utils import get_session_path
+from scripts.workspace import atomic_write
+
+
+class JobRunner:
+    """
+    Durable analysis jobs, shared by all workers through SQLite.
+
+    A job runs in a background thread of the worker that submitted it and
+    keeps a heartbeat. A job whose worker died (its pid is gone, or its
+    heartbeat stopped) counts as interrupted and can be resumed by any
+    worker from its parameters, kept in the session's ``jobs`` directory;
+    the fits checkpointed by the interrupted run are not computed again.
+
+    Cancellation is requested through the database, so any worker can
+    cancel a job; the worker running it notices within a fraction of a
+    second and terminates its ATSAS processes. Jobs no page has polled for
+    a while (the tab was closed) are cancelled the same way.
+
+    Records of jobs finished or interrupted longer than the retention period
+    ago are pruned by the session collector.
+    """
+
+    def __init__(self, path=JOBS_DB, heartbeat=JOB_HEARTBEAT, stale_after=JOB_STALE_AFTER,
+                 cancel_check=JOB_CANCEL_CHECK, abandoned_after=JOB_ABANDONED_AFTER,
+                 retention=JOB_RETENTION):
+        self.path = path
+        self.heartbeat = heartbeat
+        self.stale_after = stale_after
+        self.cancel_check = cancel_check
+        self.abandoned_after = abandoned_after
+        self.retention = retention
+        # Cancellation tokens of the jobs running in this process
+        self._tokens = {}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY, session_dir TEXT, status TEXT,
+                    host TEXT, pid INTEGER, heartbeat REAL,
+                    created REAL, finished REAL, error TEXT,
+                    cancelled INTEGER DEFAULT 0, seen REAL)
+            """)
+
+    def _connect(self):
+        # Autocommit; transactions are opened explicitly with BEGIN IMMEDIATE
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    @contextmanager
+    def _transaction(self):
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            yield db
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    def _params_path(self, session_dir, job_id):
+        return os.path.join(get_session_path(session_dir, "jobs"), f"{job_id}.json")
+
+    def _interrupted(self, host, pid, heartbeat):
+        if host == HOST and not _alive(pid):
+            return True
+        return time.time() - heartbeat > self.stale_after
+
+    def submit(self, session_dir, params, target):
+        """
+        Start a job in the background
+        Args:
+            session_dir: session the job computes in
+            params: JSON-serializable parameters, passed to the target
+            target: function called with (session_dir, params)
+        Returns:
+            Id of the job
+        """
+        job_id = uuid.uuid4().hex
+        with atomic_write(self._params_path(session_dir, job_id)) as fp:
+            json.dump(params, fp)
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO jobs (id, session_dir, status, host, pid, heartbeat, created, seen) "
+                "VALUES (?, ?, 'running', ?, ?, ?, ?, ?)",
+                (job_id, session_dir, HOST, os.getpid(), now, now, now),
+            )
+        self._start(job_id, session_dir, params, target)
+        return job_id
+
+    def resume(self, job_id, target):
+        """
+        Take over an interrupted job and run it again from its checkpoints
+        Returns:
+            True if this worker resumed the job, False if it is not interrupted
+            or another worker took it first
+        """
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT session_dir, status, host, pid, heartbeat FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None or row[1] != "running" or not self._interrupted(*row[2:]):
+                return False
+            session_dir = row[0]
+            now = time.time()
+            db.execute(
+                "UPDATE jobs SET host = ?, pid = ?, heartbeat = ?, seen = ? WHERE id = ?",
+                (HOST, os.getpid(), now, now, job_id),
+            )
+        try:
+            with open(self._params_path(session_dir, job_id)) as fp:
+                params = json.load(fp)
+        except OSError:
+            # The session was collected in the meantime
+            self._finish(job_id, "failed", "The session of this analysis no longer exists.")
+            return False
+        logger.info(f"Resuming interrupted job {job_id}")
+        self._start(job_id, session_dir, params, target)
+        return True
+
+    def _start(self, job_id, session_dir, params, target):
+        thread = threading.Thread(
+            target=self._run, args=(job_id, session_dir, params, target), daemon=True
+        )
+        thread.start()
+
+    def _run(self, job_id, session_dir, params, target):
+        stopped = threading.Event()
+
+        with cancellation_token(os.path.basename(session_dir)) as token:
+
+            def monitor():
+                last_beat = time.time()
+                while not stopped.wait(self.cancel_check):
+                    now = time.time()
+                    with self._transaction() as db:
+                        if now - last_beat >= self.heartbeat:
+                            db.execute("UPDATE jobs SET heartbeat = ? WHERE id = ?", (now, job_id))
+                            last_beat = now
+                        cancelled, seen = db.execute(
+                            "SELECT cancelled, COALESCE(seen, created) FROM jobs WHERE id = ?", (job_id,)
+                        ).fetchone()
+                    if cancelled or now - seen > self.abandoned_after:
+                        if not cancelled:
+                            logger.info(f"Cancelling job {job_id}: no page is waiting for it")
+                        token.set()
+
+            self._tokens[job_id] = token
+            threading.Thread(target=monitor, daemon=True).start()
+            try:
+                target(session_dir, params)
+            except AnalysisCancelled as e:
+                logger.info(f"Job {job_id} cancelled")
+                self._finish(job_id, "cancelled", str(e))
+            except Exception as e:
+                logger.exception(f"Job {job_id} failed")
+                self._finish(job_id, "failed", str(e))
+            else:
+                self._finish(job_id, "done")
+            finally:
+                stopped.set()
+                self._tokens.pop(job_id, None)
+
+    def cancel(self, job_id):
+        """
+        Request the cancellation of a job; one that lost its worker is
+        cancelled right away instead of being resumed
+        """
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT status, host, pid, heartbeat FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None or row[0] != "running":
+                return
+            db.execute("UPDATE jobs SET cancelled = 1 WHERE id = ?", (job_id,))
+            if self._interrupted(*row[1:]):
+                db.execute(
+                    "UPDATE jobs SET status = 'cancelled', finished = ?, error = ? WHERE id = ?",
+                    (time.time(), "Analysis cancelled.", job_id),
+                )
+        # Jobs of this worker stop without waiting for their monitor
+        token = self._tokens.get(job_id)
+        if token is not None:
+            token.set()
+
+    def touch(self, job_id):
+        """Record that a page is still waiting for the job"""
+        with self._transaction() as db:
+            db.execute("UPDATE jobs SET seen = ? WHERE id = ?", (time.time(), job_id))
+
+    def _finish(self, job_id, status, error=None):
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, finished = ?, error = ? WHERE id = ?",
+                (status, time.time(), error, job_id),
+            )
+
+    def prune(self):
+        """
+        Delete the records of jobs finished, or interrupted and never resumed,
+        longer than the retention period ago
+        Returns:
+            Number of records deleted
+        """
+        cutoff = time.time() - self.retention
+        with self._transaction() as db:
+            return db.execute(
+                "DELETE FROM jobs WHERE (status != 'running' AND finished < ?) "
+                "OR (status = 'running' AND heartbeat < ?)",
+                (cutoff, cutoff),
+            ).rowcount
+
+    def status(self, job_id):
+        """
+        Returns:
+            Dict with the job's status ("running", "interrupted", "done",
+            "failed" or "cancelled"), its session directory and error, or None
+            if unknown
+        """
+        db = self._connect()
+        try:
+            row = db.execute(
+                "SELECT session_dir, status, host, pid, heartbeat, error FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        finally:
+            db.close()
+        if row is None:
+            return None
+        session_dir, status, host, pid, heartbeat, error = row
+        if status == "running" and self._interrupted(host, pid, heartbeat):
+            status = "interrupted"
+        return {"id": job_id, "session_dir": session_dir, "status": status, "error": error}
+
+
+job_runner = JobRunner()
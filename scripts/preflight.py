@@ -0,0 +1,184 @@
+import binascii
+
+import numpy as np
+
+from config import CRYSOL_PARAMS, PREFLIGHT_MIN_POINTS
+from models.profile_fit import Q_UNIT_SCALE
+from scripts.saxs_parser import header_q_units, profile_cache
+from scripts.utils import decode_contents, session_directory, theoretical_upload_labels
+
+Q_UNIT_NAMES = {"1": "Å⁻¹", "2": "nm⁻¹"}
+
+
+def decode_upload(contents):
+    """Raw bytes of a file uploaded with Plotly Dash or streamed to the session"""
+    return decode_contents(contents, session_directory(create=False) or "")
+
+
+def _parse(contents, name, errors):
+    try:
+        return profile_cache.load_content(decode_upload(contents))
+    except (IndexError, binascii.Error, OSError):
+        errors.append(f"{name}: the upload could not be read.")
+    except ValueError as e:
+        errors.append(f"{name}: {str(e)}.")
+    return None
+
+
+def _check_values(profile, name, columns):
+    """Problems of the first columns of a profile, as messages"""
+    errors = []
+    data = profile.data
+    if data.shape[1] < columns:
+        errors.append(f"{name}: expected at least {columns} columns, found {data.shape[1]}.")
+        return errors
+    if not np.isfinite(data[:, :columns]).all():
+        errors.append(f"{name}: contains NaN or infinite values.")
+        return errors
+    if np.any(np.diff(profile.q) <= 0):
+        errors.append(f"{name}: q values are not strictly increasing.")
+    if columns > 2 and np.any(profile.sigma <= 0):
+        bad = int(np.sum(profile.sigma <= 0))
+        errors.append(f"{name}: {bad} points have zero or negative errors (sigma).")
+    return errors
+
+
+def check_theoretical(selected_model, n_value, theoretical_saxs_uploads):
+    """
+    Check the theoretical profiles or PDB ensembles
+    Returns:
+        Tuple of (error messages, q range of the basis in Å⁻¹ or None if unknown)
+    """
+    errors = []
+    labels = theoretical_upload_labels(selected_model, n_value)
+    missing = [
+        label
+        for label, upload in zip(labels, theoretical_saxs_uploads)
+        if not upload.get("props", {}).get("contents")
+    ]
+    missing += labels[len(theoretical_saxs_uploads):]
+    if missing:
+        errors.append(f"Theoretical profiles missing: {', '.join(missing)}.")
+        return errors, None
+
+    if isinstance(theoretical_saxs_uploads[0]["props"]["contents"], list):
+        # CRYSOL computes the profiles later, on its own q grid
+        for label, upload in zip(labels, theoretical_saxs_uploads):
+            for contents in upload["props"]["contents"]:
+                try:
+                    text = decode_upload(contents)
+                except (IndexError, binascii.Error, OSError):
+                    errors.append(f"{label} PDB: an upload could not be read.")
+                    continue
+                except ValueError as e:
+                    errors.append(f"{label} PDB: {str(e)}.")
+                    continue
+                if b"ATOM" not in text and b"HETATM" not in text:
+                    errors.append(f"{label} PDB: a file contains no atoms.")
+        return errors, (0.0, CRYSOL_PARAMS["smax"])
+
+    grid = None
+    for label, upload in zip(labels, theoretical_saxs_uploads):
+        name = upload["props"].get("filename") or f"{label} profile"
+        profile = _parse(upload["props"]["contents"], name, errors)
+        if profile is None:
+            continue
+        problems = _check_values(profile, name, 2)
+        errors.extend(problems)
+        if problems:
+            continue
+        if grid is None:
+            grid = profile.q
+        elif len(profile.q) != len(grid) or not np.allclose(profile.q, grid):
+            errors.append(f"{name}: q grid differs from the other theoretical profiles.")
+    return errors, None if grid is None else (grid[0], grid[-1])
+
+
+def check_experimental(upload_container, q_units, q_range):
+    """
+    Check the experimental profiles against the selected units and the
+    q range of the theoretical basis
+    Returns:
+        List of error messages
+    """
+    errors = []
+    for i, item in enumerate(upload_container):
+        try:
+            upload = item["props"]["children"][0]["props"]["children"][0]["props"]
+        except (KeyError, IndexError, TypeError):
+            continue
+        name = upload.get("filename") or f"Experimental profile {i + 1}"
+        if not upload.get("contents"):
+            errors.append(f"{name}: no file uploaded.")
+            continue
+        profile = _parse(upload["contents"], name, errors)
+        if profile is None:
+            continue
+        problems = _check_values(profile, name, 3)
+        errors.extend(problems)
+        if problems:
+            continue
+
+        stated = header_q_units(profile.header)
+        if stated is not None and stated != str(q_units):
+            errors.append(
+                f"{name}: the header gives q in {Q_UNIT_NAMES[stated]}, "
+                f"but {Q_UNIT_NAMES.get(str(q_units), q_units)} is selected."
+            )
+            continue
+        if stated is None and str(q_units) == "1" and profile.q_units == "2":
+            errors.append(
+                f"{name}: q extends to {profile.q.max():.3g}, too large for Å⁻¹; "
+                f"the file looks like nm⁻¹."
+            )
+            continue
+        if q_range is not None:
+            q = profile.q * Q_UNIT_SCALE.get(str(q_units), 1.0)
+            inside = int(np.sum((q >= q_range[0]) & (q <= q_range[1])))
+            if inside < PREFLIGHT_MIN_POINTS:
+                errors.append(
+                    f"{name}: only {inside} points fall within the q range of the "
+                    f"theoretical profiles ({q_range[0]:.3g}-{q_range[1]:.3g} Å⁻¹); "
+                    f"check the q units."
+                )
+    return errors
+
+
+def check_stack(stack, q_units, q_range):
+    """
+    Check that every frame of a high-throughput series has enough measured
+    points within the q range of the theoretical basis
+    Returns:
+        List of error messages
+    """
+    if q_range is None:
+        return []
+    scale = Q_UNIT_SCALE.get(str(q_units), 1.0)
+    inside = stack.points_within(q_range[0] / scale, q_range[1] / scale)
+    short = np.flatnonzero(inside < PREFLIGHT_MIN_POINTS)
+    if not len(short):
+        return []
+    filenames = stack.metadata()["filenames"]
+    names = ", ".join(f"{filenames[i]} ({inside[i]})" for i in short[:5])
+    more = f" and {len(short) - 5} more" if len(short) > 5 else ""
+    return [
+        f"{len(short)} profiles of the series have fewer than {PREFLIGHT_MIN_POINTS} points "
+        f"within the q range of the theoretical profiles ({q_range[0]:.3g}-{q_range[1]:.3g} Å⁻¹): "
+        f"{names}{more}; check the q units."
+    ]
+
+
+def preflight_check(selected_model, n_value, upload_container, theoretical_saxs_uploads, q_units, stack=None):
+    """
+    Parse every upload and reject inputs that cannot be fitted, before any
+    computation. Parsed profiles stay in the profile cache for the analysis.
+    Args:
+        stack: ProfileStack of a high-throughput series fitted instead of the uploads
+    Returns:
+        List of error messages, one or more per faulty file
+    """
+    errors, q_range = check_theoretical(selected_model, n_value, theoretical_saxs_uploads)
+    errors.extend(check_experimental(upload_container, q_units, q_range))
+    if stack is not None and not errors:
+        errors.extend(check_stack(stack, q_units, q_range))
+    return errors
@@ -0,0 +1,158 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from config import MAX_STACK_FRAMES, STACK_BLOCK_FRAMES
+from scripts.saxs_parser import parse_profile
+from scripts.utils import content_hash, fingerprint, format_concentration
+
+
+class ProfileStack:
+    """
+    Experimental profiles of a high-throughput series as one array.
+
+    Intensities and errors of all frames are stored in ``<session>/stack``
+    as 2-D arrays (frames, q points) on the common q grid of the series, and
+    are memory-mapped when read, so fits go through them in blocks of frames
+    and memory does not grow with the length of the series.
+    """
+
+    def __init__(self, session_dir):
+        self.root = os.path.join(session_dir, "stack")
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def exists(self):
+        return os.path.exists(self._path("stack.json"))
+
+    def build(self, frames):
+        """
+        Replace the stack with a new series
+        Args:
+            frames: list of (filename, concentration, profile text); profiles
+                must be sampled on one q grid, though they may cover
+                different parts of it
+        Returns:
+            Metadata of the stack, see metadata()
+        Raises:
+            ValueError: if a frame cannot be parsed or is sampled on another grid
+        """
+        if not frames:
+            raise ValueError("The series has no profiles.")
+        if len(frames) > MAX_STACK_FRAMES:
+            raise ValueError(f"A series cannot have more than {MAX_STACK_FRAMES} profiles.")
+
+        # First pass: the common grid of all frames
+        grids = [self._parse(filename, text)[:, 0] for filename, _, text in frames]
+        q = np.unique(np.concatenate(grids))
+        q = q[np.concatenate([[True], ~np.isclose(q[1:], q[:-1], rtol=1e-6, atol=0)])]
+        del grids
+
+        parent = os.path.dirname(self.root)
+        os.makedirs(parent, exist_ok=True)
+        # Built next to the stack and swapped in once complete
+        building = tempfile.mkdtemp(prefix=".stack_", dir=parent)
+        try:
+            shape = (len(frames), len(q))
+            intensity = np.lib.format.open_memmap(
+                os.path.join(building, "intensity.npy"), mode="w+", dtype=float, shape=shape)
+            sigma = np.lib.format.open_memmap(
+                os.path.join(building, "sigma.npy"), mode="w+", dtype=float, shape=shape)
+            hashes = []
+            for i, (filename, _, text) in enumerate(frames):
+                data = self._parse(filename, text)
+                columns = np.clip(np.searchsorted(q, data[:, 0]), 0, len(q) - 1)
+                if not np.allclose(q[columns], data[:, 0], rtol=1e-6, atol=0):
+                    raise ValueError(f"{filename}: its q values are not on the grid of the series.")
+                # q points a frame does not cover carry no weight in its fits
+                intensity[i] = 0
+                sigma[i] = np.inf
+                intensity[i, columns] = data[:, 1]
+                sigma[i, columns] = data[:, 2]
+                hashes.append(content_hash(text))
+            intensity.flush()
+            sigma.flush()
+            del intensity, sigma
+            np.save(os.path.join(building, "q.npy"), q)
+
+            metadata = {
+                "filenames": [filename for filename, _, _ in frames],
+                "concentrations": [float(format_concentration(c)) for _, c, _ in frames],
+                "key": fingerprint(frames=[(h, format_concentration(c)) for h, (_, c, _) in zip(hashes, frames)]),
+            }
+            with open(os.path.join(building, "stack.json"), "w") as fp:
+                json.dump(metadata, fp)
+
+            previous = None
+            if os.path.exists(self.root):
+                previous = tempfile.mkdtemp(prefix=".stack_old_", dir=parent)
+                os.replace(self.root, os.path.join(previous, "stack"))
+            os.replace(building, self.root)
+            if previous:
+                shutil.rmtree(previous, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(building, ignore_errors=True)
+            raise
+        return metadata
+
+    @staticmethod
+    def _parse(filename, text):
+        """q, I and σ of a frame, checked for values that cannot be fitted"""
+        try:
+            data = parse_profile(text).data
+        except ValueError as e:
+            raise ValueError(f"{filename}: {str(e)}")
+        if data.shape[1] < 3:
+            raise ValueError(f"{filename}: profiles need q, I and σ columns.")
+        data = data[:, :3]
+        if not np.isfinite(data).all() or np.any(data[:, 2] <= 0):
+            raise ValueError(f"{filename}: contains NaN values or non-positive errors.")
+        if np.any(np.diff(data[:, 0]) <= 0):
+            raise ValueError(f"{filename}: q values must increase.")
+        return data
+
+    def metadata(self):
+        """
+        Returns:
+            Dict with the filenames and concentrations of the frames, and the
+            key identifying their contents; None if there is no stack
+        """
+        if not self.exists():
+            return None
+        with open(self._path("stack.json")) as fp:
+            return json.load(fp)
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    @property
+    def q(self):
+        return np.load(self._path("q.npy"))
+
+    @property
+    def intensity(self):
+        """Intensities as a read-only memory map (frames, q points)"""
+        return np.load(self._path("intensity.npy"), mmap_mode="r")
+
+    @property
+    def sigma(self):
+        """Errors as a read-only memory map (frames, q points)"""
+        return np.load(self._path("sigma.npy"), mmap_mode="r")
+
+    def points_within(self, q_min, q_max):
+        """
+        Measured points of every frame within a q range, in the units of the stack
+        Returns:
+            Array with one count per frame
+        """
+        q = self.q
+        columns = (q >= q_min) & (q <= q_max)
+        sigma = self.sigma
+        return np.concatenate([
+            np.isfinite(sigma[start:start + STACK_BLOCK_FRAMES][:, columns]).sum(axis=1)
+            for start in range(0, len(sigma), STACK_BLOCK_FRAMES)
+        ])
@@ -0,0 +1,162 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from config import CACHE_STAGING_MAX_AGE, RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL
+from scripts.error_handling import logger
+from scripts.result_store import ResultStore, fit_name
+from scripts.utils import directory_size
+
+CACHED_FILES = ["chi2.pkl", "lcurve.json", "lcurve.pkl"]
+
+
+class ResultCache:
+    """
+    Server-wide cache of complete analyses, shared by all sessions and workers.
+
+    Entries live on disk under a canonical fingerprint of every input, so an
+    identical analysis (e.g. the bundled example) is served without running
+    ATSAS again, also after a restart. Entries expire after a TTL and the
+    least recently used ones are evicted above a size cap.
+    """
+
+    def __init__(self, root=RESULT_CACHE_DIR, ttl=RESULT_CACHE_TTL, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def _entry(self, key):
+        return os.path.join(self.root, key)
+
+    def _expired(self, path):
+        return time.time() - os.path.getmtime(path) > self.ttl
+
+    def get(self, key):
+        """
+        Look up a cached analysis
+        Args:
+            key: fingerprint of the analysis inputs
+        Returns:
+            Path of the cache entry, or None on a miss
+        """
+        path = self._entry(key)
+        if not os.path.isdir(path):
+            return None
+        if self._expired(path):
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        # The modification time doubles as last access for LRU eviction
+        os.utime(path)
+        return path
+
+    def restore(self, key, session_dir):
+        """
+        Copy a cached analysis into a session's result store
+        Returns:
+            True if the analysis was found in the cache
+        """
+        path = self.get(key)
+        if path is None:
+            return False
+
+        store = ResultStore(session_dir)
+        for name in CACHED_FILES + ["fits.npz"]:
+            source = os.path.join(path, name)
+            if os.path.exists(source):
+                shutil.copyfile(source, os.path.join(store.root, name))
+        logger.info(f"Restored cached analysis {key[:12]}")
+        return True
+
+    def put(self, key, session_dir):
+        """
+        Add the analysis just computed in a session to the cache.
+
+        Small files are copied right away; packing the fits runs in the
+        background so the response is not delayed.
+        """
+        if os.path.isdir(self._entry(key)):
+            return
+
+        store = ResultStore(session_dir)
+        chi2 = store.load_chi2()
+        if chi2 is None:
+            return
+
+        os.makedirs(self.root, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=".staging_", dir=self.root)
+        for name in CACHED_FILES:
+            source = os.path.join(store.root, name)
+            if os.path.exists(source):
+                shutil.copyfile(source, os.path.join(staging, name))
+
+        cells = chi2[["concentration", "kd"]].assign(
+            n=chi2["n"] if "n" in chi2.columns else None
+        ).drop_duplicates().values.tolist()
+        threading.Thread(
+            target=self._finish_put, args=(key, staging, store, cells), daemon=True
+        ).start()
+
+    def _finish_put(self, key, staging, store, cells):
+        try:
+            fits = {}
+            for concentration, kd, n in cells:
+                n = None if pd.isna(n) else int(n)
+                fit_data = store.load_fit(concentration, kd, n, persist=False)
+                if fit_data is not None:
+                    fits[fit_name(concentration, kd, n)] = fit_data.to_numpy(dtype=float)
+            np.savez(os.path.join(staging, "fits.npz"), **fits)
+
+            # Publishing the entry is a single rename, so readers in other
+            # workers never see a half-written entry
+            try:
+                os.rename(staging, self._entry(key))
+            except OSError:
+                # Another worker cached the same analysis first
+                shutil.rmtree(staging, ignore_errors=True)
+            self.evict()
+        except Exception as e:
+            logger.error(f"Error caching analysis {key[:12]}: {str(e)}")
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def evict(self):
+        """
+        Drop expired entries and staging directories abandoned by a worker
+        that died while packing, then least recently used entries until
+        under the size cap
+        """
+        if not os.path.isdir(self.root):
+            return
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path):
+                continue
+            try:
+                if name.startswith("."):
+                    # Packing takes seconds; older staging directories have no writer left
+                    if time.time() - os.path.getmtime(path) > CACHE_STAGING_MAX_AGE:
+                        shutil.rmtree(path, ignore_errors=True)
+                        logger.info(f"Removed abandoned cache staging directory {name}")
+                    continue
+                if self._expired(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                    continue
+                entries.append((os.path.getmtime(path), directory_size(path), path))
+            except OSError:
+                continue
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            logger.info(f"Evicted cached analysis {os.path.basename(path)[:12]}")
+
+
+result_cache = ResultCache()
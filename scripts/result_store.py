@@ -0,0 +1,364 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from models.profile_fit import StackFitter
+from scripts.profile_stack import ProfileStack
+from scripts.saxs_parser import load_profile
+from scripts.utils import format_concentration, get_session_path
+from scripts.workspace import SessionWorkspace, atomic_write
+
+FIT_COLUMNS = ["s", "Iexp", "sigma", "Ifit"]
+
+
+def fit_name(concentration, kd, n=None):
+    """Name of a fit; n is only part of it for stoichiometry scans"""
+    name = f"fit_{format_concentration(concentration)}_{kd}"
+    return f"{name}_n{n}" if n is not None else name
+
+
+class ResultStore:
+    """
+    Computed results of the analysis run in a session.
+
+    Results are kept in binary form under ``<session>/results`` so exports and
+    plots can be produced from them without re-running or re-parsing anything.
+    Fits are spooled in the session's scratch area (tmpfs when configured) as
+    they are computed, and only those viewed or exported are copied into the
+    results.
+    """
+
+    def __init__(self, session_dir):
+        self.session_dir = session_dir
+        self.root = get_session_path(session_dir, "results")
+        self.spool = os.path.join(SessionWorkspace(session_dir).scratch_root, "fits")
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def clear(self):
+        """
+        Drop the results of a previous run, keeping its reusable cells and
+        checkpoints; its spooled fits stay available to the next run
+        """
+        for name in os.listdir(self.root):
+            if name in ("cells", "checkpoints"):
+                continue
+            path = self._path(name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+    def load_cells(self, concentration, key):
+        """
+        Get the (concentration, Kd) cells computed by an earlier run
+        Args:
+            concentration: concentration of the experimental profile
+            key: fingerprint of every input the cells depend on
+        Returns:
+            DataFrame of previously computed rows, or None if inputs changed
+        """
+        path = self._path("cells", f"{format_concentration(concentration)}.pkl")
+        if not os.path.exists(path):
+            return None
+        stored_key, cells = pd.read_pickle(path)
+        return cells if stored_key == key else None
+
+    def save_cells(self, concentration, key, cells):
+        """Keep the computed cells of a concentration for the next run"""
+        path = self._path("cells", f"{format_concentration(concentration)}.pkl")
+        with atomic_write(path, "wb") as fp:
+            pd.to_pickle((key, cells), fp)
+
+    def save_chi2(self, results):
+        """
+        Store the chi² table of all concentrations
+        Args:
+            results: list of per-concentration DataFrames with kd, concentration and chi2
+        """
+        with atomic_write(self._path("chi2.pkl"), "wb") as fp:
+            pd.concat(results, ignore_index=True).to_pickle(fp)
+
+    def load_chi2(self):
+        path = self._path("chi2.pkl")
+        if not os.path.exists(path):
+            return None
+        return pd.read_pickle(path)
+
+    def chi2_table(self):
+        """Chi² of every concentration and their average, one row per Kd"""
+        chi2 = self.load_chi2()
+        if chi2 is None:
+            return None
+        # Stoichiometry scans have one row per (n, Kd)
+        index = ["n", "kd"] if "n" in chi2.columns else "kd"
+        if "frame" in chi2.columns:
+            # Frames of a high-throughput series may share a concentration
+            table = chi2.pivot_table(index=index, columns="frame", values="chi2")
+            concentrations = chi2.groupby("frame")["concentration"].first()
+            table.columns = [f"chi2_{frame + 1}_{concentrations[frame]}" for frame in table.columns]
+        else:
+            table = chi2.pivot_table(index=index, columns="concentration", values="chi2")
+            table = table[sorted(table.columns, key=float)]
+            table.columns = [f"chi2_{concentration}" for concentration in table.columns]
+        table["chi2_average"] = chi2.groupby(index)["chi2"].mean()
+        return table.reset_index()
+
+    def save_lcurve(self, l_curve_summary):
+        average = l_curve_summary.average
+        data = {
+            "optimal_kd": float(average.optimal_kd),
+            "kd_error": float(average.kd_error),
+            "change_points": [float(cp) for cp in average.change_points],
+            "per_concentration": {
+                concentration: {
+                    "optimal_kd": float(result.optimal_kd),
+                    "kd_error": float(result.kd_error),
+                }
+                for concentration, result in l_curve_summary.per_concentration.items()
+            },
+            "bootstrap": {
+                "replicates": len(l_curve_summary.bootstrap_kds),
+                "kd_mean": float(np.mean(l_curve_summary.bootstrap_kds)),
+                "kd_std": float(np.std(l_curve_summary.bootstrap_kds)),
+            },
+        }
+        with atomic_write(self._path("lcurve.json")) as fp:
+            json.dump(data, fp)
+        with atomic_write(self._path("lcurve.pkl"), "wb") as fp:
+            pd.to_pickle(l_curve_summary, fp)
+
+    def load_lcurve_summary(self):
+        """Full L-curve analysis (curves included) as needed for plotting"""
+        path = self._path("lcurve.pkl")
+        if not os.path.exists(path):
+            return None
+        return pd.read_pickle(path)
+
+    def load_lcurve(self):
+        path = self._path("lcurve.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as fp:
+            return json.load(fp)
+
+    def save_metadata(self, metadata):
+        """Store the parameters the results were computed with"""
+        with atomic_write(self._path("metadata.json")) as fp:
+            json.dump(metadata, fp)
+
+    def chi2_value(self, concentration, kd, n=None):
+        """Chi² of one (concentration, Kd) cell, or None if not computed"""
+        chi2 = self.load_chi2()
+        if chi2 is None:
+            return None
+        if isinstance(kd, str):
+            # Grid point label of a multi-Kd model
+            same_kd = chi2["kd"] == kd
+        else:
+            same_kd = np.isclose(chi2["kd"], float(kd))
+        if n is not None:
+            same_kd &= chi2["n"] == n
+        cell = chi2[(chi2["concentration"] == format_concentration(concentration)) & same_kd]
+        return None if cell.empty else cell["chi2"].iloc[0]
+
+    def load_metadata(self):
+        path = self._path("metadata.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as fp:
+            return json.load(fp)
+
+    def spool_fits(self, concentration, key, fits, n=None):
+        """
+        Spool the fits of one batch of a concentration in a single archive
+        Args:
+            concentration: concentration value
+            key: fingerprint of the inputs the fits were computed from
+            fits: dict of Kd (or grid point label) to array of s, Iexp, sigma and Ifit
+            n: stoichiometry, for results of a stoichiometry scan
+        """
+        if not fits:
+            return
+        arrays = {
+            fit_name(concentration, kd, n): np.asarray(fit_data, dtype=float)
+            for kd, fit_data in fits.items()
+        }
+        # Batches of one concentration (checkpoints, search levels, scanned n)
+        # get their own archive
+        directory = self.spool
+        os.makedirs(directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(
+            prefix=f".batch_{format_concentration(concentration)}_{key}_", suffix=".npz", dir=directory
+        )
+        with os.fdopen(fd, "wb") as fp:
+            np.savez(fp, **arrays)
+        os.replace(path, os.path.join(directory, os.path.basename(path)[1:]))
+
+    def save_stack_fits(self, kd_values, fractions, scale, offset, basis, q_units):
+        """
+        Store the fitted parameters of a high-throughput series; its fits are
+        rebuilt from them page by page instead of being stored
+        Args:
+            kd_values: Kd grid
+            fractions: array (Kd values, frames, species) of molecular fractions
+            scale, offset: arrays (frames, Kd values) of the fitted parameters
+            basis: array (species, q points, 2) of theoretical profiles
+            q_units: angular units of the experimental q
+        """
+        with atomic_write(self._path("stack_fits.npz"), "wb") as fp:
+            np.savez(fp, kd=np.asarray(kd_values, dtype=float), fractions=fractions, scale=scale,
+                     offset=offset, basis=basis, q_units=str(q_units))
+
+    def load_stack_fit(self, frame, kd):
+        """
+        Fit of one frame of a high-throughput series at one Kd
+        Returns:
+            DataFrame with s, Iexp, sigma and Ifit columns, or None if not computed
+        """
+        path = self._path("stack_fits.npz")
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as fits:
+            k = int(np.argmin(np.abs(np.log(fits["kd"]) - np.log(float(kd)))))
+            if np.isnan(fits["scale"][frame, k]):
+                return None
+            fitter = StackFitter(ProfileStack(self.session_dir), fits["basis"], str(fits["q_units"]))
+            fit_data = fitter.fit_curve(frame, fits["fractions"][k, frame], fits["scale"][frame, k],
+                                        fits["offset"][frame, k])
+        return pd.DataFrame(fit_data, columns=FIT_COLUMNS)
+
+    def _checkpoint_path(self, concentration, key):
+        return self._path("checkpoints", f"{format_concentration(concentration)}_{key}.jsonl")
+
+    def load_checkpoint(self, concentration, key):
+        """
+        Fits of a concentration completed by this or an interrupted earlier run
+        Args:
+            concentration: concentration value
+            key: fingerprint of the inputs the fits depend on; fits and
+                checkpoints of the concentration under other inputs are dropped
+        Returns:
+            Dict of fit name to (molecular fractions, chi²)
+        """
+        prefix = format_concentration(concentration)
+        stale = glob.glob(os.path.join(self.spool, f"batch_{prefix}_*.npz"))
+        stale += glob.glob(self._path("checkpoints", f"{prefix}_*.jsonl"))
+        for path in stale:
+            if f"_{key}" not in os.path.basename(path):
+                os.remove(path)
+
+        cells = {}
+        path = self._checkpoint_path(concentration, key)
+        if os.path.exists(path):
+            with open(path, "rb+") as fp:
+                data = fp.read()
+                if not data.endswith(b"\n"):
+                    # Drop the last line of a run killed while writing it, so
+                    # new records are not appended to it
+                    fp.truncate(data.rfind(b"\n") + 1)
+            for line in data.splitlines(keepends=True):
+                try:
+                    name, fractions, chi_squared = json.loads(line)
+                except ValueError:
+                    continue
+                cells[name] = (fractions, chi_squared)
+        return cells
+
+    def append_checkpoint(self, concentration, key, cells):
+        """
+        Durably record completed fits, after their archive was written
+        Args:
+            cells: list of (fit name, molecular fractions, chi²)
+        """
+        path = self._checkpoint_path(concentration, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a") as fp:
+            for name, fractions, chi_squared in cells:
+                fp.write(json.dumps([name, [float(f) for f in fractions], float(chi_squared)]) + "\n")
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    def _spooled(self, concentration):
+        """
+        Returns:
+            Archives spooled for a concentration, newest first
+        """
+        batches = []
+        for path in glob.glob(os.path.join(self.spool, f"batch_{format_concentration(concentration)}_*.npz")):
+            try:
+                batches.append((os.path.getmtime(path), path))
+            except OSError:
+                # Dropped by a run with other inputs meanwhile
+                continue
+        return [path for _, path in sorted(batches, reverse=True)]
+
+    @staticmethod
+    def _packed_fit(path, name):
+        """Fit of an archive, or None if the archive does not hold it"""
+        try:
+            with np.load(path) as fits:
+                return fits[name] if name in fits.files else None
+        except OSError:
+            return None
+
+    def has_fit(self, concentration, kd, n=None):
+        """Whether the fit of a (concentration, Kd) cell is available"""
+        name = fit_name(concentration, kd, n)
+        if os.path.exists(self._path("fits", f"{name}.npy")) or os.path.exists(
+            os.path.join(self.session_dir, "fits", f"{name}.fit")
+        ):
+            return True
+        for archive in [self._path("fits.npz")] + self._spooled(concentration):
+            try:
+                with np.load(archive) as fits:
+                    if name in fits.files:
+                        return True
+            except OSError:
+                continue
+        return False
+
+    def load_fit(self, concentration, kd, n=None, persist=True):
+        """
+        Get the fit of one (concentration, Kd) cell
+        Args:
+            concentration: concentration value
+            kd: Kd value
+            n: stoichiometry, for results of a stoichiometry scan
+            persist: copy a fit read from the spool into the store, as for a
+                fit that is viewed or exported
+        Returns:
+            DataFrame with s, Iexp, sigma and Ifit columns, or None if not computed
+        """
+        name = fit_name(concentration, kd, n)
+        stored = self._path("fits", f"{name}.npy")
+        # Fits restored from the result cache, then fits of this run viewed before
+        fit_data = self._packed_fit(self._path("fits.npz"), name)
+        if fit_data is None and os.path.exists(stored):
+            fit_data = np.load(stored)
+        if fit_data is None:
+            for batch in self._spooled(concentration):
+                fit_data = self._packed_fit(batch, name)
+                if fit_data is not None:
+                    if persist:
+                        with atomic_write(stored, "wb") as fp:
+                            np.save(fp, fit_data)
+                    break
+        if fit_data is not None:
+            return pd.DataFrame(fit_data, columns=FIT_COLUMNS)
+
+        fit_file = os.path.join(self.session_dir, "fits", f"{name}.fit")
+        if not os.path.exists(fit_file):
+            return None
+
+        # Parse the text output once and keep the arrays for later reads
+        fit_data = pd.DataFrame(load_profile(fit_file).data[:, :4], columns=FIT_COLUMNS)
+        with atomic_write(stored, "wb") as fp:
+            np.save(fp, fit_data.to_numpy(dtype=float))
+        return fit_data
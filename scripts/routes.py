@@ -0,0 +1,111 @@
+from flask import Response, abort, jsonify, request, stream_with_context
+
+from config import MAX_BULK_UPLOADS, MAX_PDB_SIZE, MAX_PROFILE_SIZE, UPLOAD_PART_SIZE
+from scripts.jobs import job_runner
+from scripts.result_store import ResultStore
+from scripts.upload_store import UploadOffsetError, UploadStore
+from scripts.utils import session_directory
+from scripts.zip_export import analysis_members, stream_zip
+
+
+def register_routes(server):
+    @server.route("/export/analysis.zip")
+    def export_analysis():
+        session_dir = session_directory(create=False)
+        if not session_dir:
+            abort(404)
+
+        store = ResultStore(session_dir)
+        metadata = store.load_metadata()
+        if metadata is None:
+            abort(404)
+
+        # Multi-Kd models identify a grid point by its label instead of a number
+        kd_type = str if isinstance(metadata["best_kd"], str) else float
+        kd = request.args.get("kd", default=metadata["best_kd"], type=kd_type)
+        # Stoichiometry scans export the selected n
+        n = request.args.get("n", type=int)
+        if n is not None and n in metadata.get("n_scan", []):
+            metadata = dict(metadata, n=n)
+        archive = stream_zip(analysis_members(store, metadata, kd))
+        return Response(
+            stream_with_context(archive),
+            mimetype="application/zip",
+            headers={"Content-Disposition": "attachment; filename=kdsaxs_analysis.zip"},
+        )
+
+    @server.route("/jobs/<job_id>")
+    def job_status(job_id):
+        # Jobs are only visible to their own session
+        session_dir = session_directory(create=False)
+        status = job_runner.status(job_id)
+        if not session_dir or status is None or status["session_dir"] != session_dir:
+            abort(404)
+        return jsonify({key: status[key] for key in ("id", "status", "error")})
+
+    @server.route("/uploads/experimental", methods=["POST"])
+    def upload_experimental():
+        # Profiles dropped in bulk (multipart "files") are written to the session
+        # as they stream in; the page gets back a reference for each of them
+        files = request.files.getlist("files")
+        if not files:
+            abort(400)
+        if len(files) > MAX_BULK_UPLOADS:
+            return jsonify({"files": [], "errors": [f"At most {MAX_BULK_UPLOADS} files can be dropped at once."]}), 413
+
+        store = UploadStore(session_directory())
+        uploaded = []
+        errors = []
+        for upload in files:
+            try:
+                uploaded.append({"filename": upload.filename, "contents": store.save(upload.stream, MAX_PROFILE_SIZE)})
+            except ValueError as e:
+                errors.append(f"{upload.filename}: {str(e)}")
+        return jsonify({"files": uploaded, "errors": errors})
+
+    @server.route("/uploads/chunked", methods=["POST"])
+    def begin_chunked_upload():
+        # Structure files are sent in parts of UPLOAD_PART_SIZE bytes, see
+        # assets/chunked_upload.js; an interrupted upload resumes at its offset
+        announced = request.get_json(silent=True) or {}
+        filename = announced.get("filename")
+        size = announced.get("size")
+        if not isinstance(filename, str) or not isinstance(size, int):
+            abort(400)
+        try:
+            upload_id = UploadStore(session_directory()).begin(filename, size, MAX_PDB_SIZE)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"id": upload_id, "offset": 0, "part_size": UPLOAD_PART_SIZE})
+
+    @server.route("/uploads/chunked/<upload_id>")
+    def chunked_upload_status(upload_id):
+        session_dir = session_directory(create=False)
+        if not session_dir:
+            abort(404)
+        try:
+            status = UploadStore(session_dir).status(upload_id)
+        except FileNotFoundError:
+            abort(404)
+        return jsonify({"id": upload_id, "offset": status["offset"], "part_size": UPLOAD_PART_SIZE})
+
+    @server.route("/uploads/chunked/<upload_id>", methods=["PATCH"])
+    def append_chunked_upload(upload_id):
+        session_dir = session_directory(create=False)
+        offset = request.headers.get("Upload-Offset", type=int)
+        if not session_dir:
+            abort(404)
+        if offset is None:
+            abort(400)
+        try:
+            received, reference = UploadStore(session_dir).append(upload_id, offset, request.stream)
+        except FileNotFoundError:
+            abort(404)
+        except UploadOffsetError as e:
+            return jsonify({"offset": e.offset}), 409
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if reference is None:
+            return jsonify({"offset": received})
+        return jsonify({"offset": received, "contents": reference})
+
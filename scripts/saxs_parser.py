@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+
+from config import CACHE_STAGING_MAX_AGE, PROFILE_CACHE_DIR, PROFILE_CACHE_MAX_BYTES, PROFILE_CACHE_SIZE
+from scripts.error_handling import logger
+from scripts.workspace import atomic_write
+
+# Header keywords of the angular units, as oligomer -un values
+UNIT_KEYWORDS = {
+    "2": ("nm^-1", "nm-1", "1/nm", "nm**-1"),
+    "1": ("a^-1", "1/a", "å", "angstrom"),
+}
+# Header lines that label the q column or state units, e.g. "q(nm^-1) I(q) err",
+# "s [1/A]" or "Angular units: 1/nm"; other lines may mention Å for other
+# quantities, such as the wavelength
+Q_LABEL = re.compile(
+    r"(?:^|[\s#,;])[qs]\s*[(\[]"
+    r"|(?:^|[\s#,;])[qs](?:[\s,;]+(?:i|i\(q\)|i\(s\)|intensity)(?:[\s,;(\[]|$))"
+    r"|\bunits?\b|momentum transfer|scattering vector"
+)
+# Momentum transfer beyond this is only plausible in nm⁻¹
+MAX_Q_ANGSTROM = 1.5
+# Bump when parsing changes, so profiles cached on disk are parsed again
+PARSER_VERSION = 2
+
+NUMBER_START = set("+-.0123456789")
+
+
+@dataclass
+class SAXSProfile:
+    """Numeric columns of a .dat, .int or .fit file and what was detected about it"""
+
+    data: np.ndarray
+    q_units: Optional[str] = None
+    header: List[str] = field(default_factory=list)
+
+    @property
+    def q(self):
+        return self.data[:, 0]
+
+    @property
+    def intensity(self):
+        return self.data[:, 1]
+
+    @property
+    def sigma(self):
+        return self.data[:, 2] if self.data.shape[1] > 2 else None
+
+
+def _is_numeric(tokens):
+    if not tokens or tokens[0][0] not in NUMBER_START:
+        return False
+    try:
+        float(tokens[0])
+        float(tokens[-1])
+        return True
+    except ValueError:
+        return False
+
+
+def header_q_units(header):
+    """Angular units stated for q in a profile header, or None if it does not say"""
+    text = " ".join(line for line in (line.lower() for line in header) if Q_LABEL.search(line))
+    for units, keywords in UNIT_KEYWORDS.items():
+        if any(keyword in text for keyword in keywords):
+            return units
+    return None
+
+
+def detect_q_units(header, q):
+    """
+    Angular units of a profile from its header, or else from its q range
+    Returns:
+        '1' for Å⁻¹, '2' for nm⁻¹
+    """
+    units = header_q_units(header)
+    if units is not None:
+        return units
+    return "2" if len(q) and np.nanmax(q) > MAX_Q_ANGSTROM else "1"
+
+
+def parse_profile(text):
+    """
+    Parse a SAXS profile in one pass over its lines
+    Args:
+        text: file content
+    Returns:
+        SAXSProfile with the rows of the most common column count; header,
+        comment and footer lines are skipped wherever they occur
+    """
+    header = []
+    rows = []
+    for line in text.splitlines():
+        tokens = line.replace(",", " ").split()
+        if _is_numeric(tokens):
+            rows.append(tokens)
+        elif tokens:
+            header.append(line.strip())
+
+    if not rows:
+        raise ValueError("No numeric data found in profile")
+
+    columns = Counter(len(tokens) for tokens in rows).most_common(1)[0][0]
+    values = [value for tokens in rows if len(tokens) == columns for value in tokens]
+    data = np.array(values, dtype=float).reshape(-1, columns)
+    return SAXSProfile(data, detect_q_units(header, data[:, 0]), header)
+
+
+class ProfileCache:
+    """
+    Parsed profiles by content hash.
+
+    Identical files (the same upload in several sessions, or the fits read
+    again for plots and exports) are parsed once; the arrays are kept in
+    memory and in compact binary form on disk, shared by all workers. The
+    disk copies are trimmed to a size cap, least recently used first, by
+    the session collector.
+    """
+
+    def __init__(self, root=PROFILE_CACHE_DIR, max_size=PROFILE_CACHE_SIZE, max_bytes=PROFILE_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key, profile):
+        with self._lock:
+            self._profiles[key] = profile
+            self._profiles.move_to_end(key)
+            if len(self._profiles) > self.max_size:
+                self._profiles.popitem(last=False)
+
+    def load(self, path):
+        """
+        Args:
+            path: profile file
+        Returns:
+            SAXSProfile of the file
+        """
+        with open(path, "rb") as fp:
+            return self.load_content(fp.read())
+
+    def load_content(self, content):
+        """
+        Args:
+            content: raw bytes of a profile file
+        Returns:
+            SAXSProfile of the content
+        Raises:
+            ValueError: if the content holds no numeric data
+        """
+        key = hashlib.sha256(content).hexdigest()
+
+        with self._lock:
+            if key in self._profiles:
+                self._profiles.move_to_end(key)
+                return self._profiles[key]
+
+        cached = os.path.join(self.root, f"{key}.npz")
+        if os.path.exists(cached):
+            try:
+                with np.load(cached) as archive:
+                    meta = json.loads(str(archive["meta"]))
+                    profile = SAXSProfile(archive["data"], meta["q_units"], meta["header"])
+                if meta.get("version") == PARSER_VERSION:
+                    # The modification time doubles as last access for eviction
+                    os.utime(cached)
+                    self._remember(key, profile)
+                    return profile
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable parsed profile {cached}: {str(e)}")
+
+        profile = parse_profile(content.decode("utf8", errors="replace"))
+        meta = json.dumps({"q_units": profile.q_units, "header": profile.header, "version": PARSER_VERSION})
+        # atomic_write creates the cache directory on first use
+        with atomic_write(cached, "wb") as fp:
+            np.savez(fp, data=profile.data, meta=meta)
+        self._remember(key, profile)
+        return profile
+
+    def evict(self):
+        """Drop abandoned temporary files, then least recently used profiles until under the size cap"""
+        if not os.path.isdir(self.root):
+            return
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if name.startswith("."):
+                    # Left behind by a worker killed while writing
+                    if time.time() - os.path.getmtime(path) > CACHE_STAGING_MAX_AGE:
+                        os.remove(path)
+                    continue
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        logger.debug(f"Parsed profile cache holds {total / 2**20:.1f} MB")
+
+
+profile_cache = ProfileCache()
+
+
+def load_profile(path):
+    """Parsed SAXS profile of a file, from the cache when the same content was read before"""
+    return profile_cache.load(path)
+
+
+def check_q_units(path, q_units):
+    """Warn when the angular units detected in a profile differ from the selected ones"""
+    try:
+        detected = load_profile(path).q_units
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not parse {os.path.basename(path)}: {str(e)}")
+        return
+    if detected != str(q_units):
+        logger.warning(
+            f"{os.path.basename(path)} looks like q in {'nm⁻¹' if detected == '2' else 'Å⁻¹'}, "
+            f"which differs from the selected units"
+        )
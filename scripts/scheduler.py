@@ -0,0 +1,222 @@
+import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from config import ATSAS_SLOTS, MAX_ACTIVE_ANALYSES, SCHEDULER_DB, SCHEDULER_POLL, SCHEDULER_REAP_INTERVAL
+from scripts.cancellation import check_cancelled
+from scripts.error_handling import logger
+
+HOST = socket.gethostname()
+
+# Waiting jobs in the order they get slots, round-robin between sessions:
+# a session's k-th waiting job counts as if k more of its jobs were running,
+# ties go to the session served least recently, then to the first come
+FAIR_ORDER = """
+    SELECT w.ticket, w.session FROM (
+        SELECT ticket, session,
+               ROW_NUMBER() OVER (PARTITION BY session ORDER BY ticket) AS k
+        FROM waiting) w
+    LEFT JOIN (SELECT session, COUNT(*) AS jobs FROM running GROUP BY session) r
+        ON r.session = w.session
+    LEFT JOIN grants g ON g.session = w.session
+    ORDER BY COALESCE(r.jobs, 0) + w.k, COALESCE(g.last, 0), w.ticket
+"""
+
+
+class SchedulerBusyError(Exception):
+    """Raised when the server already runs as many analyses as it admits"""
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobScheduler:
+    """
+    Server-wide budget of concurrent ATSAS processes.
+
+    Every oligomer and CRYSOL run takes one of a fixed number of slots,
+    shared by all workers through SQLite. Free slots go round-robin between
+    sessions, so one large analysis cannot starve the others, and analyses
+    beyond a maximum are rejected up front instead of slowing everyone down.
+
+    Waiting jobs check for their turn in read-only snapshots, which neither
+    wait for nor block the writers, and take the write lock only to claim
+    the slot. Rows left by dead processes are swept on a timer.
+    """
+
+    def __init__(self, path=SCHEDULER_DB, slots=ATSAS_SLOTS,
+                 max_analyses=MAX_ACTIVE_ANALYSES, poll=SCHEDULER_POLL,
+                 reap_interval=SCHEDULER_REAP_INTERVAL):
+        self.path = path
+        self.slots = slots
+        self.max_analyses = max_analyses
+        self.poll = poll
+        self.reap_interval = reap_interval
+        self._last_reap = float("-inf")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS waiting (
+                    ticket INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session TEXT, host TEXT, pid INTEGER);
+                CREATE TABLE IF NOT EXISTS running (
+                    ticket INTEGER PRIMARY KEY, session TEXT, host TEXT, pid INTEGER);
+                CREATE TABLE IF NOT EXISTS grants (session TEXT PRIMARY KEY, last REAL);
+                CREATE TABLE IF NOT EXISTS analyses (
+                    session TEXT PRIMARY KEY, host TEXT, pid INTEGER, started REAL);
+            """)
+
+    def _connect(self):
+        # Autocommit; transactions are opened explicitly with BEGIN IMMEDIATE
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        # The queue is transient state, it need not survive a power loss
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            if self._reap_due():
+                self._reap(db)
+                self._last_reap = time.monotonic()
+            yield db
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    @contextmanager
+    def _snapshot(self):
+        """Read-only transaction; it takes no write lock"""
+        db = self._connect()
+        try:
+            db.execute("BEGIN")
+            yield db
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def _reap_due(self):
+        return time.monotonic() - self._last_reap >= self.reap_interval
+
+    @staticmethod
+    def _reap(db):
+        """Drop the rows of processes on this host that died holding them"""
+        for table in ("waiting", "running", "analyses"):
+            pids = {pid for (pid,) in db.execute(f"SELECT DISTINCT pid FROM {table} WHERE host = ?", (HOST,))}
+            for pid in pids:
+                if not _alive(pid):
+                    db.execute(f"DELETE FROM {table} WHERE host = ? AND pid = ?", (HOST, pid))
+
+    @contextmanager
+    def admit(self, session_id):
+        """
+        Register an analysis of a session for its whole run
+        Raises:
+            SchedulerBusyError: if the server already runs the maximum of analyses
+        """
+        with self._transaction() as db:
+            (active,) = db.execute(
+                "SELECT COUNT(*) FROM analyses WHERE session != ?", (session_id,)
+            ).fetchone()
+            if active >= self.max_analyses:
+                raise SchedulerBusyError(
+                    f"The server is busy with {active} analyses. Please try again in a few minutes."
+                )
+            db.execute(
+                "INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?)",
+                (session_id, HOST, os.getpid(), time.time()),
+            )
+        try:
+            yield
+        finally:
+            with self._transaction() as db:
+                db.execute("DELETE FROM analyses WHERE session = ?", (session_id,))
+
+    @contextmanager
+    def slot(self, session_id, cancel_id=None):
+        """
+        Wait for a free slot in this session's turn and hold it while the job runs
+        Args:
+            session_id: session the job belongs to
+            cancel_id: id whose cancellation stops the wait; the session's if None
+        """
+        with self._transaction() as db:
+            ticket = db.execute(
+                "INSERT INTO waiting (session, host, pid) VALUES (?, ?, ?)",
+                (session_id, HOST, os.getpid()),
+            ).lastrowid
+
+        waited = time.monotonic()
+        try:
+            while True:
+                with self._snapshot() as db:
+                    turn = self._in_turn(db, ticket)
+                # A slot held by a dead process only frees up when it is reaped
+                if turn or self._reap_due():
+                    with self._transaction() as db:
+                        turn = self._in_turn(db, ticket)
+                        if turn:
+                            db.execute("DELETE FROM waiting WHERE ticket = ?", (ticket,))
+                            db.execute(
+                                "INSERT INTO running VALUES (?, ?, ?, ?)",
+                                (ticket, session_id, HOST, os.getpid()),
+                            )
+                            db.execute(
+                                "INSERT OR REPLACE INTO grants VALUES (?, ?)", (session_id, time.time())
+                            )
+                    if turn:
+                        break
+                check_cancelled(cancel_id or session_id)
+                time.sleep(self.poll)
+        except BaseException:
+            with self._transaction() as db:
+                db.execute("DELETE FROM waiting WHERE ticket = ?", (ticket,))
+            raise
+
+        waited = time.monotonic() - waited
+        if waited > 1:
+            logger.debug(f"Job of {session_id} waited {waited:.1f} s for an ATSAS slot")
+        try:
+            yield
+        finally:
+            with self._transaction() as db:
+                db.execute("DELETE FROM running WHERE ticket = ?", (ticket,))
+
+    def _in_turn(self, db, ticket):
+        """Whether a waiting job is among those the free slots go to next"""
+        (busy,) = db.execute("SELECT COUNT(*) FROM running").fetchone()
+        free = self.slots - busy
+        turn = [row[0] for row in db.execute(f"{FAIR_ORDER} LIMIT ?", (max(free, 0),))]
+        return ticket in turn
+
+    def status(self, session_id):
+        """
+        Returns:
+            Dict with the session's running jobs, the queue position of its next
+            job (None if it has none waiting), all waiting jobs and the slots
+        """
+        with self._snapshot() as db:
+            (running,) = db.execute(
+                "SELECT COUNT(*) FROM running WHERE session = ?", (session_id,)
+            ).fetchone()
+            order = [row[1] for row in db.execute(FAIR_ORDER)]
+        position = order.index(session_id) + 1 if session_id in order else None
+        return {"running": running, "position": position, "waiting": len(order), "slots": self.slots}
+
+
+scheduler = JobScheduler()
@@ -0,0 +1,126 @@
+import json
+import os
+import secrets
+import sqlite3
+import time
+
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+from config import SECRET_KEY, SECRET_KEY_FILE, SESSION_COOKIE_NAME, SESSION_DB, SESSION_MAX_IDLE
+from scripts.error_handling import logger
+
+
+def stable_secret_key(key=SECRET_KEY, path=SECRET_KEY_FILE):
+    """
+    Secret key shared by every worker: the configured one, or else one
+    generated once and kept in a file
+    """
+    if key:
+        return key
+    try:
+        # O_EXCL makes exactly one of several starting workers write the key
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path) as fp:
+            return fp.read().strip()
+    key = secrets.token_hex(32)
+    with os.fdopen(fd, "w") as fp:
+        fp.write(key)
+    logger.info(f"Generated a new secret key in {path}")
+    return key
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, data=None, sid=None, expires=None, new=False):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(data, on_update)
+        self.sid = sid
+        self.expires = expires
+        self.new = new
+        self.modified = False
+
+
+class SQLiteSessionInterface(SessionInterface):
+    """
+    Flask sessions kept in SQLite, so every worker sees the same session.
+
+    The cookie only carries a signed random session id. Rows expire after
+    the session lifetime and are refreshed while the session is in use.
+    """
+
+    def __init__(self, path=SESSION_DB, lifetime=SESSION_MAX_IDLE, cookie_name=SESSION_COOKIE_NAME):
+        self.path = path
+        self.lifetime = lifetime
+        self.cookie_name = cookie_name
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    @staticmethod
+    def _signer(app):
+        return Signer(app.secret_key, salt="kdsaxs-session")
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.cookie_name)
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            if sid:
+                with self._connect() as db:
+                    row = db.execute(
+                        "SELECT data, expires FROM sessions WHERE sid = ? AND expires > ?",
+                        (sid, time.time()),
+                    ).fetchone()
+                if row is not None:
+                    return ServerSideSession(json.loads(row[0]), sid, row[1])
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if not session.new:
+                with self._connect() as db:
+                    db.execute("DELETE FROM sessions WHERE sid = ?", (session.sid,))
+                response.delete_cookie(self.cookie_name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        # Rows are refreshed once half their lifetime has passed, not on every request
+        stale = session.expires is None or session.expires - now < self.lifetime / 2
+        if not (session.modified or stale):
+            return
+
+        expires = now + self.lifetime
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+                (session.sid, json.dumps(dict(session)), expires),
+            )
+            if session.new:
+                db.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+
+        response.set_cookie(
+            self.cookie_name,
+            self._signer(app).sign(session.sid).decode(),
+            max_age=self.lifetime,
+            httponly=self.get_cookie_httponly(app),
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+            domain=domain,
+            path=path,
+        )
@@ -0,0 +1,74 @@
+import socket
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+HOST = socket.gethostname()
+ALIGNMENT = 64  # bytes, so every array starts on a cache line
+
+
+class SharedArena:
+    """
+    Read-only arrays of one analysis in a single shared-memory block.
+
+    Processes on the same host attach to the block by name and read the
+    arrays in place, so a task only has to name the arena and the indices
+    it works on, and memory does not grow with the number of processes.
+    """
+
+    def __init__(self, arrays):
+        """
+        Args:
+            arrays: dict of name to numpy array, copied into the block
+        """
+        self.layout = {}
+        offset = 0
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            self.layout[name] = (offset, array.shape, array.dtype.str)
+            offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        self._shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for name, array in arrays.items():
+            _view(self._shm, self.layout[name])[...] = array
+        self.name = self._shm.name
+
+    def descriptor(self):
+        """What another process needs to attach to the arena"""
+        return {"name": self.name, "host": HOST, "layout": self.layout}
+
+    def arrays(self):
+        return {name: _view(self._shm, spec) for name, spec in self.layout.items()}
+
+    def close(self):
+        """Free the block; processes still attached keep their mapping"""
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _view(shm, spec):
+    offset, shape, dtype = spec
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+
+
+def attach(descriptor):
+    """
+    Map an arena created by another process on this host
+    Returns:
+        Tuple of (SharedMemory to keep open while the arrays are used,
+        dict of name to read-only array)
+    Raises:
+        FileNotFoundError: if the arena was freed or lives on another host
+    """
+    if descriptor["host"] != HOST:
+        raise FileNotFoundError(f"Arena {descriptor['name']} is on {descriptor['host']}")
+    shm = shared_memory.SharedMemory(name=descriptor["name"])
+    # The creator frees the block; the tracker would unlink it when this process exits
+    resource_tracker.unregister(shm._name, "shared_memory")
+    arrays = {}
+    for name, spec in descriptor["layout"].items():
+        arrays[name] = _view(shm, spec)
+        arrays[name].flags.writeable = False
+    return shm, arrays
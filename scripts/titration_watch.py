@@ -0,0 +1,190 @@
+import glob
+import os
+import time
+
+import pandas as pd
+
+from config import FIT_BACKEND, LCURVE_BOOTSTRAP_REPLICATES, OLIGOMER_PROJECT_BASIS, WATCH_INTERVAL, WATCH_SETTLE
+from models.curve_analysis import LCurveAnalysis
+from models.model_factory import MULTI_KD_MODELS, ModelFactory
+from scripts.error_handling import logger
+from scripts.result_store import ResultStore
+from scripts.saxs_parser import check_q_units
+from scripts.utils import (
+    concentration_from_filename,
+    content_hash,
+    fingerprint,
+    format_concentration,
+    get_session_path,
+)
+from scripts.workspace import atomic_write
+
+
+class TitrationWatcher:
+    """
+    Fits the frames of a titration as they arrive in a directory.
+
+    The concentration of each frame is read from its filename. A new frame
+    is fitted over the Kd grid against the theoretical profiles loaded at
+    start; earlier frames are not fitted again, only the average chi² curve,
+    best Kd and L-curve are updated. Results are kept like those of a
+    session, so a restarted watcher picks up the frames it already fitted.
+    """
+
+    def __init__(self, directory, output_dir, model_name, theoretical_files, n, kd_range, kd_points,
+                 q_units, receptor_concentration=None, units="µM", pattern="*.dat", settle=WATCH_SETTLE):
+        """
+        Args:
+            directory: directory the frames arrive in
+            output_dir: directory of the results, laid out like a session
+            model_name: single-Kd model (kds_saxs_mon_oligomer or kds_saxs_oligomer_fitting)
+            theoretical_files: theoretical profile of every species, in the model's order
+            n: stoichiometry
+            kd_range: (min, max) of the Kd grid
+            kd_points: number of Kd values
+            q_units: angular units of the frames (oligomer -un)
+            receptor_concentration: receptor concentration of the protein binding model
+            units: concentration units of the analysis; filenames may state others
+            pattern: glob of the frame files
+            settle: seconds a file must stay unchanged before it is read
+        """
+        if model_name in MULTI_KD_MODELS:
+            raise ValueError("Watch mode fits single-Kd models only.")
+        self.directory = directory
+        self.session_dir = output_dir
+        self.model_name = model_name
+        self.model = ModelFactory.get_model(model_name)
+        self.theoretical_files = theoretical_files
+        self.n = n
+        self.kd_range = kd_range
+        self.kd_points = kd_points
+        self.q_units = q_units
+        self.receptor_concentration = receptor_concentration
+        self.units = units
+        self.pattern = pattern
+        self.settle = settle
+        self.store = ResultStore(output_dir)
+        contents = []
+        for path in theoretical_files:
+            with open(path, "rb") as fp:
+                contents.append(content_hash(fp.read()))
+        self.theoretical_key = fingerprint(contents=contents)
+        self.seen = set()
+        self.results = {}  # frame path -> chi² of its Kd grid
+
+    def fit_frame(self, path, concentration):
+        """
+        Fit one frame over the Kd grid, reusing its cells from an earlier run
+        Returns:
+            DataFrame of the frame's chi² and molecular fractions per Kd
+        """
+        formatted_conc = format_concentration(concentration)
+        with open(path, "rb") as fp:
+            content = fp.read()
+        exp_file_path = os.path.join(
+            get_session_path(self.session_dir, "uploads/experimental"), os.path.basename(path)
+        )
+        with atomic_write(exp_file_path, "wb") as fp:
+            fp.write(content)
+        check_q_units(exp_file_path, self.q_units)
+
+        cells_key = fingerprint(
+            model=self.model_name,
+            n=self.n,
+            receptor_concentration=self.receptor_concentration,
+            q_units=self.q_units,
+            experimental=content_hash(content),
+            theoretical=self.theoretical_key,
+            concentration=formatted_conc,
+            backend=FIT_BACKEND,
+            projected=OLIGOMER_PROJECT_BASIS,
+        )
+        completed = self.store.load_cells(formatted_conc, cells_key)
+        if self.model_name == "kds_saxs_mon_oligomer":
+            mon_file_path, dim_file_path = self.theoretical_files
+            chi_squared_df = self.model.calculate(
+                exp_file_path, mon_file_path, dim_file_path, concentration, self.n,
+                self.kd_range, self.kd_points, self.session_dir, self.q_units, completed=completed,
+            )
+        else:
+            chi_squared_df = self.model.calculate(
+                exp_file_path, self.theoretical_files, self.receptor_concentration, concentration,
+                self.n, self.kd_range, self.kd_points, self.session_dir, self.q_units,
+                completed=completed,
+            )
+        self.store.save_cells(formatted_conc, cells_key, chi_squared_df.copy())
+        chi_squared_df["concentration"] = chi_squared_df["concentration"].apply(format_concentration)
+        return chi_squared_df
+
+    def update(self):
+        """
+        Recompute the global results from the per-frame chi²
+        Returns:
+            Dict with the number of frames, the best Kd of the average chi²
+            curve and the L-curve Kd with its error (None while the Kd grid
+            is too coarse for an L-curve)
+        """
+        results = list(self.results.values())
+        self.store.save_chi2(results)
+        chi_squared_values = pd.concat(results)
+        average = chi_squared_values.groupby("kd")["chi2"].mean()
+        best_kd = float(average.idxmin())
+        l_curve_summary = LCurveAnalysis.analyze_results(chi_squared_values, LCURVE_BOOTSTRAP_REPLICATES)
+        if l_curve_summary is not None:
+            self.store.save_lcurve(l_curve_summary)
+        self.store.save_metadata({
+            "model": self.model_name,
+            "n": self.n,
+            "receptor_concentration": self.receptor_concentration,
+            "q_units": self.q_units,
+            "experimental_concentrations": [result["concentration"].iloc[0] for result in results],
+            "units": self.units,
+            "best_kd": best_kd,
+            "chi2_values": [float(result["chi2"].min()) for result in results],
+        })
+        return {
+            "frames": len(results),
+            "best_kd": best_kd,
+            "lcurve_kd": float(l_curve_summary.average.optimal_kd) if l_curve_summary else None,
+            "kd_error": float(l_curve_summary.average.kd_error) if l_curve_summary else None,
+        }
+
+    def poll(self):
+        """
+        Fit the frames that arrived since the last poll, in arrival order
+        Returns:
+            Summary of update() if any frame was fitted, else None
+        """
+        now = time.time()
+        fitted = False
+        for path in sorted(glob.glob(os.path.join(self.directory, self.pattern)), key=os.path.getmtime):
+            # Files modified within the settle time may still be being written
+            if path in self.seen or now - os.path.getmtime(path) < self.settle:
+                continue
+            self.seen.add(path)
+            concentration = concentration_from_filename(path, self.units)
+            if concentration is None:
+                logger.warning(f"Skipping {os.path.basename(path)}: no concentration in its name")
+                continue
+            try:
+                self.results[path] = self.fit_frame(path, concentration)
+            except Exception as e:
+                logger.error(f"Could not fit {os.path.basename(path)}: {str(e)}")
+                continue
+            logger.info(f"Fitted {os.path.basename(path)} at {format_concentration(concentration)} {self.units}")
+            fitted = True
+        return self.update() if fitted else None
+
+    def run(self, interval=WATCH_INTERVAL):
+        """Watch the directory until the process is stopped"""
+        logger.info(f"Watching {self.directory} for {self.pattern}, results in {self.session_dir}")
+        while True:
+            summary = self.poll()
+            if summary is not None:
+                l_curve = (
+                    f"L-curve Kd {summary['lcurve_kd']:.4g} ± {summary['kd_error']:.2g}"
+                    if summary["lcurve_kd"] is not None
+                    else "no L-curve"
+                )
+                logger.info(f"{summary['frames']} frames: best Kd {summary['best_kd']:.4g}, {l_curve}")
+            time.sleep(interval)
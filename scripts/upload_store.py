@@ -0,0 +1,228 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from config import UPLOAD_CHUNK_SIZE, UPLOAD_HASHES_SIZE, UPLOAD_PARTIAL_TTL
+from scripts.utils import STORED_UPLOAD, get_session_path, stored_upload_path
+from scripts.workspace import atomic_write
+
+STRUCTURE_EXTENSIONS = (".pdb", ".cif", ".mmcif")
+
+# Chunked upload id -> (SHA-256 of the bytes received by this worker, their
+# count, time of the last part), least recently used first. An upload whose
+# hash was dropped is hashed again from the disk when it resumes.
+_hashes = OrderedDict()
+_hashes_lock = threading.Lock()
+
+
+def _keep_hash(upload_id, digest, received):
+    with _hashes_lock:
+        now = time.time()
+        _hashes[upload_id] = (digest, received, now)
+        _hashes.move_to_end(upload_id)
+        # Abandoned uploads never finish, so their hashes expire
+        while _hashes and (len(_hashes) > UPLOAD_HASHES_SIZE
+                           or now - next(iter(_hashes.values()))[2] > UPLOAD_PARTIAL_TTL):
+            _hashes.popitem(last=False)
+
+
+def expire_partial_uploads(session_dir, max_age=UPLOAD_PARTIAL_TTL):
+    """
+    Delete the unfinished chunked uploads of a session that received no part
+    within max_age seconds
+    Returns:
+        Number of uploads deleted
+    """
+    partial_root = os.path.join(session_dir, "uploads", "partial")
+    try:
+        names = os.listdir(partial_root)
+    except FileNotFoundError:
+        return 0
+    now = time.time()
+    expired = 0
+    for name in names:
+        if not re.fullmatch(r"[0-9a-f]{32}\.json", name):
+            continue
+        path = os.path.join(partial_root, name[:-len(".json")])
+        try:
+            last_part = max(os.path.getmtime(path + ".json"),
+                            os.path.getmtime(path) if os.path.exists(path) else 0)
+        except FileNotFoundError:
+            continue
+        if now - last_part > max_age:
+            for stale in (path, path + ".json"):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+            expired += 1
+    return expired
+
+
+class UploadOffsetError(ValueError):
+    """Raised when a part does not start where its upload stands"""
+
+    def __init__(self, offset):
+        super().__init__(f"The upload continues at byte {offset}.")
+        self.offset = offset
+
+
+class UploadStore:
+    """
+    Files uploaded to a session through the upload routes instead of Dash.
+
+    Uploads are streamed to ``<session>/uploads/stored`` and named by the
+    SHA-256 computed while they are written, so the page and the callbacks
+    only pass a short reference around in place of base64 contents; see
+    scripts.utils.decode_contents.
+    """
+
+    def __init__(self, session_dir):
+        self.session_dir = session_dir
+        self.root = get_session_path(session_dir, "uploads/stored")
+        self.partial_root = get_session_path(session_dir, "uploads/partial")
+
+    def save(self, stream, max_size):
+        """
+        Write an upload stream to the store
+        Args:
+            stream: binary file-like object
+            max_size: largest accepted size in bytes
+        Returns:
+            Reference to use as the contents of the upload
+        Raises:
+            ValueError: if the upload is larger than max_size
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, partial = tempfile.mkstemp(prefix=".upload_", dir=self.root)
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                while True:
+                    chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_size:
+                        raise ValueError(f"exceeds the {max_size / 1024 / 1024:.1f}MB limit")
+                    digest.update(chunk)
+                    fp.write(chunk)
+            # Identical files share one copy
+            os.replace(partial, stored_upload_path(self.session_dir, digest.hexdigest()))
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        return STORED_UPLOAD + digest.hexdigest()
+
+    def _partial(self, upload_id):
+        if not re.fullmatch(r"[0-9a-f]{32}", upload_id):
+            raise FileNotFoundError(f"Unknown upload {upload_id}")
+        return os.path.join(self.partial_root, upload_id)
+
+    def begin(self, filename, size, max_size):
+        """
+        Start a chunked upload of a PDB or mmCIF file, optionally gzip-compressed
+        Args:
+            filename: name of the file
+            size: size of the file in bytes
+            max_size: largest accepted size in bytes
+        Returns:
+            Id of the upload
+        Raises:
+            ValueError: if the file is not a structure or is larger than max_size
+        """
+        name = filename.lower()
+        if name.endswith(".gz"):
+            name = name[:-3]
+        if not name.endswith(STRUCTURE_EXTENSIONS):
+            raise ValueError(f"{filename}: only PDB or mmCIF files, optionally gzip-compressed, are accepted")
+        if not 0 < size <= max_size:
+            raise ValueError(f"{filename}: exceeds the {max_size / 1024 / 1024:.1f}MB limit")
+
+        upload_id = uuid.uuid4().hex
+        path = self._partial(upload_id)
+        with atomic_write(path + ".json") as fp:
+            json.dump({"filename": filename, "size": size}, fp)
+        open(path, "wb").close()
+        return upload_id
+
+    def status(self, upload_id):
+        """
+        Returns:
+            Dict with the filename, size and bytes received of an unfinished upload
+        Raises:
+            FileNotFoundError: if the upload is unknown or already finished
+        """
+        path = self._partial(upload_id)
+        with open(path + ".json") as fp:
+            status = json.load(fp)
+        status["offset"] = os.path.getsize(path)
+        return status
+
+    def append(self, upload_id, offset, stream):
+        """
+        Write a part of a chunked upload, hashing it as it streams in
+        Args:
+            upload_id: id returned by begin()
+            offset: position of the part in the file
+            stream: binary file-like object with the part
+        Returns:
+            Tuple of (bytes received, reference once the file is complete else None)
+        Raises:
+            FileNotFoundError: if the upload is unknown or already finished
+            UploadOffsetError: if the part does not start at the bytes received so far
+            ValueError: if the upload grows beyond its announced size
+        """
+        size = self.status(upload_id)["size"]
+        path = self._partial(upload_id)
+        with open(path, "ab") as fp:
+            # One writer per upload, across the workers of the server
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            received = os.fstat(fp.fileno()).st_size
+            if offset != received:
+                raise UploadOffsetError(received)
+            digest = self._digest(upload_id, path, received)
+            try:
+                while True:
+                    chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if received + len(chunk) > size:
+                        raise ValueError("The upload is larger than announced.")
+                    fp.write(chunk)
+                    digest.update(chunk)
+                    received += len(chunk)
+            finally:
+                # A part cut short is resumed from what reached the disk
+                fp.flush()
+                _keep_hash(upload_id, digest, received)
+
+            if received < size:
+                return received, None
+            os.replace(path, stored_upload_path(self.session_dir, digest.hexdigest()))
+        os.remove(path + ".json")
+        with _hashes_lock:
+            _hashes.pop(upload_id, None)
+        return received, STORED_UPLOAD + digest.hexdigest()
+
+    @staticmethod
+    def _digest(upload_id, path, received):
+        """Hash of the bytes received so far, kept by this worker or else read back from disk"""
+        with _hashes_lock:
+            digest, hashed, _ = _hashes.pop(upload_id, (None, None, None))
+        if hashed == received:
+            return digest
+        digest = hashlib.sha256()
+        with open(path, "rb") as fp:
+            for chunk in iter(lambda: fp.read(UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest
+
@@ -1,7 +1,15 @@
 import base64
+import hashlib
+import json
 import os
+import re
+import zlib
 
 import pandas as pd
+from flask import session
+
+from config import MAX_DECOMPRESSED_SIZE, create_session_dir
+from scripts.workspace import atomic_write
 
 
 def save_file(
@@ -15,7 +23,7 @@ def save_file(
         directory: session directory
         subdir: subdirectory within session directory
         file_type: type of file ('pdb', 'saxs')
-        model: model type ('kds_saxs_mon_oligomer', 'kds_saxs_oligomer_fitting')
+        model: model type (one of config.ALLOWED_MODELS)
         state: state identifier ('monomer', 'oligomer', 'receptor', etc.)
     """
     if file_type == "pdb":
@@ -23,6 +31,9 @@ def save_file(
             # Handle monomer/oligomer states
             state_dir = "monomer" if state == "monomer" else "oligomer"
             save_dir = os.path.join(directory, "pdbs", state_dir)
+        elif model == "kds_saxs_sequential_oligomer":
+            # One directory per species: monomer, oligomer_2, oligomer_3, ...
+            save_dir = os.path.join(directory, "pdbs", state)
         else:
             # Handle protein binding states
             if state == "receptor":
@@ -36,13 +47,112 @@ def save_file(
 
     os.makedirs(save_dir, exist_ok=True)
 
-    data = content.encode("utf8").split(b";base64,")[1]
+    data = decode_contents(content, directory)
     file_path = os.path.join(save_dir, name)
-    with open(file_path, "wb") as fp:
-        fp.write(base64.decodebytes(data))
+
+    # Concurrent jobs never read a partially written file
+    with atomic_write(file_path, "wb") as fp:
+        fp.write(data)
     return file_path
 
 
+# Contents of uploads streamed to the session directory, in place of base64 data
+STORED_UPLOAD = "stored:"
+
+
+def stored_upload_path(session_dir, digest):
+    """
+    Path of an upload streamed to a session, named by its SHA-256
+    Raises:
+        ValueError: if digest is not a SHA-256
+    """
+    if not re.fullmatch(r"[0-9a-f]{64}", digest):
+        raise ValueError("Invalid upload reference")
+    return os.path.join(session_dir, "uploads", "stored", digest)
+
+
+def gunzip(data, limit=MAX_DECOMPRESSED_SIZE):
+    """
+    Decompress gzip data, never producing more than limit bytes
+    Raises:
+        ValueError: if the data is not valid gzip or decompresses to more than limit bytes
+    """
+    chunks, size = [], 0
+    try:
+        # A gzip file may hold several members, each a stream of its own
+        while data.strip(b"\0"):
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            chunk = decompressor.decompress(data, limit - size + 1)
+            size += len(chunk)
+            if size > limit:
+                raise ValueError(f"File exceeds {limit / 1024 / 1024:.1f}MB once decompressed")
+            if not decompressor.eof:
+                raise ValueError("Compressed file is truncated")
+            chunks.append(chunk)
+            data = decompressor.unused_data
+    except zlib.error as e:
+        raise ValueError(f"Invalid gzip file: {e}")
+    return b"".join(chunks)
+
+
+def decode_contents(content, session_dir):
+    """
+    Raw bytes of an upload
+    Args:
+        content: base64 data URL of dcc.Upload, or STORED_UPLOAD and the
+            SHA-256 of a file streamed to the session
+        session_dir: session directory
+    Returns:
+        Contents of the file; stored files uploaded gzip-compressed are decompressed
+    Raises:
+        ValueError: if a compressed file exceeds MAX_DECOMPRESSED_SIZE once decompressed
+    """
+    if content.startswith(STORED_UPLOAD):
+        with open(stored_upload_path(session_dir, content[len(STORED_UPLOAD):]), "rb") as fp:
+            data = fp.read()
+        return gunzip(data) if data.startswith(b"\x1f\x8b") else data
+    return base64.decodebytes(content.encode("utf8").split(b";base64,")[1])
+
+
+def session_directory(create=True):
+    """
+    Directory of the current browser session, created on its first analysis
+    and reused by every later run of the same session
+    Args:
+        create: create the directory if the session has none yet
+    Returns:
+        Session directory path, or None if there is none and create is False
+    """
+    session_dir = session.get("session_dir")
+    if session_dir is not None and not os.path.isdir(session_dir):
+        # Deleted by the session collector; the session starts over in a new one
+        session_dir = None
+    if session_dir is None:
+        if not create:
+            return None
+        session_dir = create_session_dir()
+        session["session_dir"] = session_dir
+    else:
+        # The modification time is the last access for session garbage collection
+        try:
+            os.utime(session_dir)
+        except OSError:
+            pass
+    return session_dir
+
+
+def directory_size(path):
+    """Total size in bytes of the files under a directory"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
 def get_session_path(session_dir, subdir):
     """Get full path for a subdirectory in session directory"""
     path = os.path.join(session_dir, subdir)
@@ -82,9 +192,50 @@ def format_concentration(concentration, precision=6):
     return f"{float(concentration):.{precision}g}"
 
 
+# Concentration units of the app, in µM
+CONCENTRATION_UNITS = {"nM": 1e-3, "µM": 1.0, "mM": 1e3}
+FILENAME_CONCENTRATION = re.compile(r"(?<![\d.])(\d+(?:\.\d+)?)_?(nM|uM|µM|μM|mM)(?![A-Za-z])")
+
+
+def concentration_from_filename(filename, units="µM"):
+    """
+    Concentration stated in the name of a profile, like 17.4 µM in
+    0.32_mgml_17.4uM_cut_28.dat
+    Args:
+        filename: file name or path
+        units: units to return the concentration in (nM, µM or mM)
+    Returns:
+        Concentration as float, or None if the name states none
+    """
+    match = FILENAME_CONCENTRATION.search(os.path.basename(filename))
+    if match is None:
+        return None
+    value, stated = match.groups()
+    stated = "µM" if stated in ("uM", "μM") else stated
+    return float(value) * CONCENTRATION_UNITS[stated] / CONCENTRATION_UNITS[units]
+
+
+def theoretical_upload_labels(selected_model, n_value):
+    """Species of the theoretical profiles a model needs, in upload order"""
+    if selected_model == "kds_saxs_mon_oligomer":
+        return ["Monomeric", "Oligomeric"]
+    if n_value is None:
+        return []
+    if selected_model == "kds_saxs_sequential_oligomer":
+        return ["Monomer"] + [f"{k}-mer" for k in range(2, n_value + 1)]
+    if selected_model in ["kds_saxs_oligomer_fitting", "kds_saxs_cooperative_binding"]:
+        labels = ["Free Receptor"]
+        labels.extend([f"Receptor-Ligand_{i}" for i in range(1, n_value + 1)])
+        labels.append("Free Ligand")
+        return labels
+    return []
+
+
 def get_state_from_index(selected_model, index, n_value):
     if selected_model == "kds_saxs_mon_oligomer":
         return "monomer" if index == 0 else "oligomer"
+    elif selected_model == "kds_saxs_sequential_oligomer":
+        return "monomer" if index == 0 else f"oligomer_{index + 1}"
     else:
         if index == 0:
             return "receptor"
@@ -92,3 +243,22 @@ def get_state_from_index(selected_model, index, n_value):
             return "ligand"
         else:
             return f"receptor_ligand_{index}"
+
+
+def content_hash(content):
+    """SHA-256 of an uploaded file's content (str or bytes)"""
+    if isinstance(content, str):
+        content = content.encode("utf8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def fingerprint(**inputs):
+    """
+    Canonical hash of analysis inputs
+    Args:
+        inputs: JSON-serialisable values; key order does not matter
+    Returns:
+        Hex digest identifying this exact combination of inputs
+    """
+    canonical = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf8")).hexdigest()
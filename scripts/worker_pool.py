@@ -0,0 +1,324 @@
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from multiprocessing.managers import BaseManager
+
+import numpy as np
+
+from config import WORKER_AUTHKEY, WORKER_BROKER, WORKER_BROKER_PORT, WORKER_POLL, WORKER_TASK_LEASE
+from scripts.cancellation import AnalysisCancelled, budget_expired, is_cancelled
+from scripts.error_handling import logger
+from scripts.scheduler import HOST
+from scripts.shared_arena import SharedArena
+from scripts.utils import content_hash, fingerprint
+
+
+class TaskBroker:
+    """
+    Queue of ATSAS tasks between the KdSAXS server and its pool workers.
+
+    Tasks wait in one queue per session and are handed out round-robin
+    between sessions, so a large analysis does not hold back the others.
+    A worker renews the lease of its task while running it; a task whose
+    worker went silent is handed to another one, and of two results for
+    the same task the first one counts.
+    """
+
+    def __init__(self, lease=WORKER_TASK_LEASE):
+        self.lease = lease
+        self._condition = threading.Condition()
+        self._ids = itertools.count()
+        self._queues = OrderedDict()  # session -> deque of waiting task ids
+        self._tasks = {}  # task id -> (session, task), until it has a result
+        self._running = {}  # task id -> (worker, time of the last renewal)
+        self._results = {}
+        self._cancelled = set()
+        self._workers = {}  # worker -> time it last asked for a task
+        self._arenas = {}  # arena name -> arrays, for workers on other hosts
+
+    def submit(self, session_id, tasks):
+        """
+        Queue tasks of a session
+        Returns:
+            List of task ids, in the order of the tasks
+        """
+        with self._condition:
+            queue = self._queues.setdefault(session_id, deque())
+            task_ids = []
+            for task in tasks:
+                task_id = f"{session_id}:{next(self._ids)}"
+                self._tasks[task_id] = (session_id, task)
+                queue.append(task_id)
+                task_ids.append(task_id)
+            self._condition.notify_all()
+            return task_ids
+
+    def _requeue_expired(self):
+        now = time.time()
+        for task_id, (worker, renewed) in list(self._running.items()):
+            if now - renewed > self.lease:
+                logger.warning(f"Worker {worker} went silent, requeueing task {task_id}")
+                del self._running[task_id]
+                self._queues.setdefault(self._tasks[task_id][0], deque()).appendleft(task_id)
+                self._queues.move_to_end(self._tasks[task_id][0], last=False)
+
+    def next_task(self, worker, timeout):
+        """
+        Lease the next task, in the turn of the session served least recently
+        Returns:
+            Tuple of (task id, task), or None if no task came within the timeout
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                self._workers[worker] = time.time()
+                self._requeue_expired()
+                if self._queues:
+                    session_id, queue = self._queues.popitem(last=False)
+                    task_id = queue.popleft()
+                    if queue:
+                        # Back of the line until the other sessions had a turn
+                        self._queues[session_id] = queue
+                    self._running[task_id] = (worker, time.time())
+                    return task_id, self._tasks[task_id][1]
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(min(remaining, self.lease))
+
+    def renew(self, task_id, worker):
+        """
+        Extend the lease of a running task
+        Returns:
+            False if the worker should stop it: it was cancelled or handed to another worker
+        """
+        with self._condition:
+            if task_id in self._cancelled or self._running.get(task_id, (None,))[0] != worker:
+                return False
+            now = time.time()
+            self._running[task_id] = (worker, now)
+            # A worker busy with a long task still counts as live
+            self._workers[worker] = now
+            return True
+
+    def complete(self, task_id, result):
+        """Record the result of a task, unless it already has one or was cancelled"""
+        with self._condition:
+            self._running.pop(task_id, None)
+            if task_id not in self._tasks:
+                return
+            del self._tasks[task_id]
+            if task_id in self._cancelled:
+                self._cancelled.discard(task_id)
+            else:
+                self._results[task_id] = result
+            self._condition.notify_all()
+
+    def fetch(self, task_ids, timeout):
+        """
+        Wait for results of tasks and take them from the broker
+        Returns:
+            Dict of task id to result, for the tasks finished within the timeout
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                done = {task_id: self._results.pop(task_id) for task_id in task_ids if task_id in self._results}
+                remaining = deadline - time.time()
+                if done or remaining <= 0:
+                    return done
+                self._condition.wait(remaining)
+
+    def cancel(self, task_ids, running=True):
+        """
+        Drop tasks that are no longer needed; waiting ones get None as result
+        Args:
+            task_ids: tasks to drop
+            running: also stop the tasks workers are running, and drop their results
+        """
+        task_ids = set(task_ids)
+        with self._condition:
+            for session_id, queue in list(self._queues.items()):
+                kept = deque(task_id for task_id in queue if task_id not in task_ids)
+                for task_id in queue:
+                    if task_id in task_ids:
+                        del self._tasks[task_id]
+                        self._results[task_id] = None
+                if kept:
+                    self._queues[session_id] = kept
+                else:
+                    del self._queues[session_id]
+            if running:
+                for task_id in task_ids:
+                    self._results.pop(task_id, None)
+                    if task_id in self._tasks:
+                        self._cancelled.add(task_id)
+            self._condition.notify_all()
+
+    def status(self, session_id):
+        """
+        Returns:
+            Dict with the session's running tasks, the queue position of its
+            next task (None if it has none waiting), all waiting tasks and the
+            live workers, in the layout of JobScheduler.status
+        """
+        with self._condition:
+            now = time.time()
+            # Sessions take turns in queue order, one task each
+            order = list(self._queues)
+            return {
+                "running": sum(1 for task_id in self._running if self._tasks[task_id][0] == session_id),
+                "position": order.index(session_id) + 1 if session_id in order else None,
+                "waiting": sum(len(queue) for queue in self._queues.values()),
+                "slots": sum(1 for seen in self._workers.values() if now - seen < self.lease),
+            }
+
+    def put_arena(self, name, arrays):
+        """Keep a copy of a shared arena for workers that cannot attach to it"""
+        with self._condition:
+            self._arenas[name] = arrays
+
+    def arena(self, name):
+        """Arrays of a shared arena, or None once it was dropped"""
+        with self._condition:
+            return self._arenas.get(name)
+
+    def drop_arena(self, name):
+        with self._condition:
+            self._arenas.pop(name, None)
+
+    def stats(self):
+        """
+        Returns:
+            Dict with the numbers of waiting and running tasks, and the
+            workers that asked for a task recently
+        """
+        with self._condition:
+            now = time.time()
+            return {
+                "waiting": sum(len(queue) for queue in self._queues.values()),
+                "running": len(self._running),
+                "workers": sorted(worker for worker, seen in self._workers.items() if now - seen < self.lease),
+            }
+
+
+class BrokerManager(BaseManager):
+    """Serves the task broker over TCP, authenticated by a shared key"""
+
+
+BrokerManager.register("broker")
+
+
+def parse_address(address):
+    """Tuple of (host, port) of a "host:port" or "host" broker address"""
+    host, _, port = address.rpartition(":") if ":" in address else (address, "", "")
+    return host or "0.0.0.0", int(port or WORKER_BROKER_PORT)
+
+
+def serve_broker(address, authkey):
+    """Run the task broker until the process is stopped"""
+    broker = TaskBroker()
+    BrokerManager.register("broker", callable=lambda: broker)
+    server = BrokerManager(address=parse_address(address), authkey=authkey.encode()).get_server()
+    logger.info(f"Task broker listening on {address}")
+    server.serve_forever()
+
+
+_proxies = {}
+
+
+def connect(address=WORKER_BROKER, authkey=WORKER_AUTHKEY):
+    """
+    Proxy of the task broker, one per process
+    Raises:
+        ConnectionError: if the broker cannot be reached
+    """
+    if not authkey:
+        raise RuntimeError("KDSAXS_WORKER_AUTHKEY must be set to use the worker pool.")
+    key = (os.getpid(), address)
+    if key not in _proxies:
+        manager = BrokerManager(address=parse_address(address), authkey=authkey.encode())
+        manager.connect()
+        _proxies[key] = manager.broker()
+    return _proxies[key]
+
+
+def pool_enabled():
+    """Whether ATSAS tasks go to the worker pool instead of running on the server"""
+    return bool(WORKER_BROKER)
+
+
+_arenas = {}  # session -> {content key: SharedArena}
+_arenas_lock = threading.Lock()
+
+
+def pool_arena(session_id, arrays):
+    """
+    Shared arena of an analysis holding arrays its pool tasks read, created
+    on first use and kept until analysis_arenas exits
+    Args:
+        session_id: session of the analysis
+        arrays: dict of name to numpy array
+    Returns:
+        Descriptor of the arena, to pass in tasks
+    """
+    key = fingerprint(**{name: content_hash(np.ascontiguousarray(array).tobytes()) for name, array in arrays.items()})
+    with _arenas_lock:
+        arena = _arenas.setdefault(session_id, {}).get(key)
+        if arena is None:
+            arena = SharedArena(arrays)
+            # Workers on other hosts fetch the arrays from the broker once per arena
+            connect().put_arena(arena.name, arrays)
+            _arenas[session_id][key] = arena
+        return arena.descriptor()
+
+
+@contextmanager
+def analysis_arenas(session_id):
+    """Free the shared arenas of a session's analysis once it finishes"""
+    try:
+        yield
+    finally:
+        with _arenas_lock:
+            arenas = _arenas.pop(session_id, {})
+        for arena in arenas.values():
+            try:
+                connect().drop_arena(arena.name)
+            except (ConnectionError, EOFError):
+                logger.warning(f"Could not drop arena {arena.name} from the broker")
+            arena.close()
+
+
+def run_tasks(session_id, tasks, budgeted=True):
+    """
+    Run tasks of a session on the worker pool and wait for their results
+    Args:
+        session_id: session the tasks belong to
+        tasks: list of task dicts, see kdsaxs_worker.py
+        budgeted: skip the tasks still waiting when the session's time budget expires
+    Returns:
+        List of results in the order of the tasks; None for skipped tasks
+    Raises:
+        AnalysisCancelled: if the session's analysis was cancelled meanwhile
+    """
+    broker = connect()
+    # Workers on this host run the tasks in the session's ATSAS slots
+    task_ids = broker.submit(session_id, [dict(task, session=session_id, host=HOST) for task in tasks])
+    results = {}
+    skipped = False
+    try:
+        while len(results) < len(task_ids):
+            if is_cancelled(session_id):
+                raise AnalysisCancelled("Analysis cancelled.")
+            if budgeted and not skipped and budget_expired(session_id):
+                # Fits already running are kept, like the last fits of a local run
+                broker.cancel([task_id for task_id in task_ids if task_id not in results], running=False)
+                skipped = True
+            results.update(broker.fetch([task_id for task_id in task_ids if task_id not in results], WORKER_POLL))
+    except BaseException:
+        broker.cancel([task_id for task_id in task_ids if task_id not in results])
+        raise
+    return [results[task_id] for task_id in task_ids]
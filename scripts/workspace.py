@@ -0,0 +1,134 @@
+import errno
+import fcntl
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from config import SCRATCH_ROOT
+
+
+class SessionBusyError(RuntimeError):
+    """Raised when another analysis already holds the session lock"""
+
+
+@contextmanager
+def atomic_write(path, mode="w"):
+    """
+    Open a temporary file next to path and move it into place on success
+    Args:
+        path: final file path
+        mode: file mode, 'w' for text or 'wb' for binary
+    Yields:
+        Open file object; readers only ever see the old or the complete new file
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.")
+    try:
+        with os.fdopen(fd, mode) as fp:
+            yield fp
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class SessionWorkspace:
+    """
+    Filesystem access for the jobs of one session.
+
+    Each job gets a private scratch directory for its intermediate files, and
+    finished outputs are moved into the shared session tree atomically, so
+    jobs for different concentrations can run side by side.
+    """
+
+    def __init__(self, session_dir):
+        self.session_dir = session_dir
+        self.lock_path = os.path.join(session_dir, ".lock")
+
+    @property
+    def scratch_root(self):
+        """Scratch area of the session: on tmpfs when configured, else in the session tree"""
+        if SCRATCH_ROOT:
+            return os.path.join(SCRATCH_ROOT, os.path.basename(self.session_dir))
+        return os.path.join(self.session_dir, "scratch")
+
+    @contextmanager
+    def scratch(self, job_name):
+        """
+        Private working directory of a job, removed when the job finishes
+        Args:
+            job_name: prefix of the directory name, for debugging
+        """
+        scratch_root = self.scratch_root
+        os.makedirs(scratch_root, exist_ok=True)
+        path = tempfile.mkdtemp(prefix=f"{job_name}_", dir=scratch_root)
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+            try:
+                os.rmdir(scratch_root)
+            except OSError:
+                # Other jobs of the session still use it
+                pass
+
+    @staticmethod
+    def publish(source, destination):
+        """
+        Atomically move a finished file from a scratch directory into the session tree
+        Args:
+            source: file in a scratch directory
+            destination: final path in the session directory
+        Returns:
+            destination
+        """
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        try:
+            os.replace(source, destination)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # Scratch on another filesystem (tmpfs): copy, then rename in place
+            with open(source, "rb") as src, atomic_write(destination, "wb") as fp:
+                shutil.copyfileobj(src, fp)
+            os.remove(source)
+        return destination
+
+    def _still_here(self, lock_file):
+        """Whether an open lock file is still the session's; the collector moves a session away before deleting it"""
+        try:
+            return os.path.samestat(os.fstat(lock_file.fileno()), os.stat(self.lock_path))
+        except FileNotFoundError:
+            return False
+
+    @contextmanager
+    def lock(self, blocking=False):
+        """
+        Exclusive lock on the session, held for the duration of an analysis
+        Args:
+            blocking: wait for the lock instead of failing immediately
+        Raises:
+            SessionBusyError: if the session is locked and blocking is False
+            FileNotFoundError: if the session was deleted meanwhile
+        """
+        os.makedirs(self.session_dir, exist_ok=True)
+        with open(self.lock_path, "a") as lock_file:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                # flock locks belong to the open file, so this also excludes
+                # other threads of the same worker
+                fcntl.flock(lock_file, flags)
+            except BlockingIOError:
+                raise SessionBusyError(
+                    "Another analysis is already running in this session."
+                )
+            if not self._still_here(lock_file):
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                raise FileNotFoundError("The session expired. Please reload the page and upload the files again.")
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,126 @@
+import io
+import json
+import os
+import zipfile
+
+import numpy as np
+
+from models.calculations import (
+    CooperativeBindingCalculation,
+    MonomerOligomerCalculation,
+    ProteinBindingCalculation,
+    SequentialOligomerCalculation,
+    parse_kd_label,
+)
+from scripts.utils import format_concentration
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable buffer that hands out what was written so far"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(members):
+    """
+    Build a ZIP archive on the fly
+    Args:
+        members: iterable of (name, content) pairs, content as bytes
+    Yields:
+        Chunks of the archive as soon as each member is compressed
+    """
+    sink = _ChunkSink()
+    # ZipFile falls back to data descriptors on unseekable output, so the
+    # archive never has to be held in memory or on disk
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in members:
+            archive.writestr(name, content)
+            yield sink.take()
+    yield sink.take()
+
+
+def _csv(df):
+    return df.to_csv(index=False).encode("utf8")
+
+
+def fraction_tables(metadata, kd):
+    """Molecular fractions at Kd over the simulated range and at the experimental concentrations"""
+    n_value = metadata["n"]
+    conc_min, conc_max, conc_points = metadata["concentration_range"]
+    concentration_range = np.logspace(np.log10(conc_min), np.log10(conc_max), conc_points)
+    experimental = [float(conc) for conc in metadata["experimental_concentrations"]]
+
+    if metadata["model"] == "kds_saxs_mon_oligomer":
+        def fractions(concentrations):
+            return MonomerOligomerCalculation.calculate_fractions(kd, concentrations, n_value)
+    elif metadata["model"] == "kds_saxs_sequential_oligomer":
+        def fractions(concentrations):
+            return SequentialOligomerCalculation.calculate_fractions(
+                parse_kd_label(kd), concentrations, n_value
+            )
+    elif metadata["model"] == "kds_saxs_cooperative_binding":
+        def fractions(concentrations):
+            return CooperativeBindingCalculation.calculate_fractions(
+                parse_kd_label(kd), concentrations, n_value, metadata["receptor_concentration"]
+            )
+    else:
+        def fractions(concentrations):
+            return ProteinBindingCalculation.calculate_fractions(
+                kd, concentrations, n_value, metadata["receptor_concentration"]
+            )
+
+    return fractions(concentration_range), fractions(experimental)
+
+
+def analysis_members(store, metadata, kd):
+    """
+    Files of a complete analysis export, produced lazily one at a time
+    Args:
+        store: ResultStore of the session
+        metadata: parameters stored with the results
+        kd: Kd of the fits and fractions to export
+    """
+    yield "parameters.json", json.dumps(dict(metadata, exported_kd=kd), indent=2)
+
+    chi2_table = store.chi2_table()
+    if chi2_table is not None:
+        yield "chi2_vs_kd.csv", _csv(chi2_table)
+
+    l_curve = store.load_lcurve()
+    if l_curve is not None:
+        yield "lcurve.json", json.dumps(l_curve, indent=2)
+
+    simulated, experimental = fraction_tables(metadata, kd)
+    yield f"fractions/fractions_kd_{kd}.csv", _csv(simulated)
+    yield f"fractions/fractions_kd_{kd}_experimental.csv", _csv(experimental)
+
+    if metadata.get("stack"):
+        # Fits of a series are rebuilt one frame at a time
+        for frame, filename in enumerate(metadata["frames"]):
+            fit_data = store.load_stack_fit(frame, kd)
+            if fit_data is None:
+                continue
+            fit_data["residuals"] = (fit_data["Iexp"] - fit_data["Ifit"]) / fit_data["sigma"]
+            yield f"fits/saxs_fit_{frame + 1}_{os.path.splitext(filename)[0]}_kd_{kd}.csv", _csv(fit_data)
+        return
+
+    n = metadata["n"] if metadata.get("n_scan") else None
+    for i, concentration in enumerate(metadata["experimental_concentrations"]):
+        fit_data = store.load_fit(concentration, kd, n)
+        if fit_data is None:
+            continue
+        fit_data["residuals"] = (fit_data["Iexp"] - fit_data["Ifit"]) / fit_data["sigma"]
+        yield f"fits/saxs_fit_{i + 1}_{format_concentration(concentration)}_kd_{kd}.csv", _csv(fit_data)
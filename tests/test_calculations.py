@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from scipy.optimize import fsolve
+
+from models.calculations import (
+    CooperativeBindingCalculation,
+    MonomerOligomerCalculation,
+    ProteinBindingCalculation,
+    SequentialOligomerCalculation,
+    solve_monotone,
+)
+from models.search import CoarseToFineSearch
+
+
+@pytest.mark.parametrize("concentration, kd", [(1.0, 0.1), (50.0, 10.0), (300.0, 1000.0)])
+def test_bisection_matches_fsolve_for_a_dimer(concentration, kd):
+    M, O = MonomerOligomerCalculation.solve_system(concentration, kd, 2)
+    species = SequentialOligomerCalculation.solve_system(concentration, [[kd]])[0]
+    assert species == pytest.approx([M, O], rel=1e-6)
+
+
+def test_bisection_matches_fsolve_for_stepwise_kds():
+    concentration, kds = 100.0, np.array([5.0, 20.0, 50.0])
+    orders = np.arange(1, 5)
+    products = np.concatenate([[1], np.cumprod(kds)])
+
+    def balance(M):
+        return np.sum(orders * M ** orders / products) - concentration
+
+    (M,) = fsolve(balance, [concentration / 10], xtol=1e-12)
+    species = SequentialOligomerCalculation.solve_system(concentration, kds[None, :])[0]
+    assert species == pytest.approx(M ** orders / products, rel=1e-6)
+    assert np.sum(orders * species) == pytest.approx(concentration)
+
+
+def test_solve_monotone_finds_the_root_of_each_row():
+    upper = np.array([1.0, 10.0, 100.0])
+    roots = solve_monotone(lambda x: x ** 2 - upper, upper)
+    assert roots == pytest.approx(np.sqrt(upper))
+
+
+@pytest.mark.parametrize("n", [1, 2, 3])
+def test_cooperative_binding_with_equal_kds_is_the_statistical_model(n):
+    receptor, ligand, kd = 10.0, 25.0, 5.0
+    expected_receptor, expected_ligand = ProteinBindingCalculation.solve_system(receptor, ligand, kd, n)
+    receptor_vals, ligand_free = CooperativeBindingCalculation.solve_system(receptor, ligand, [[kd] * n])
+    assert receptor_vals[0] == pytest.approx(expected_receptor, rel=1e-5, abs=1e-9)
+    assert ligand_free[0] == pytest.approx(expected_ligand, rel=1e-5)
+
+
+def test_search_never_evaluates_a_point_twice():
+    calls = []
+
+    def evaluate(points):
+        calls.extend(map(tuple, points))
+        return np.sum((np.log10(points) - [1.2, 2.3]) ** 2, axis=1)
+
+    search = CoarseToFineSearch([0.1, 1000], 2, 7, coarse_budget=25, refine_points=5, levels=3)
+    best, evaluated = search.run(evaluate)
+
+    assert len(calls) == len(set(calls)) == len(evaluated)
+    assert np.log10(best) == pytest.approx([1.2, 2.3], abs=0.2)
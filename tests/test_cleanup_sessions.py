@@ -0,0 +1,44 @@
+import os
+import threading
+import time
+
+import pytest
+
+from cleanup_sessions import SessionCollector
+from scripts.workspace import SessionWorkspace
+
+
+@pytest.fixture
+def session(tmp_path):
+    path = tmp_path / "session_a"
+    path.mkdir()
+    (path / "uploads").mkdir()
+    return str(path)
+
+
+def test_deleted_session_leaves_no_tombstone(tmp_path, session):
+    collector = SessionCollector(root=str(tmp_path))
+    assert collector._delete(session, "idle")
+    assert os.listdir(tmp_path) == []
+
+
+def test_job_waiting_for_the_lock_finds_the_session_gone(tmp_path, session):
+    workspace = SessionWorkspace(session)
+    errors = []
+
+    def wait_for_lock():
+        try:
+            with workspace.lock(blocking=True):
+                pass
+        except FileNotFoundError as e:
+            errors.append(e)
+
+    with workspace.lock():
+        waiter = threading.Thread(target=wait_for_lock)
+        waiter.start()
+        time.sleep(0.2)
+        os.rename(session, SessionCollector(root=str(tmp_path))._tombstone(session))
+    waiter.join()
+
+    assert len(errors) == 1
+    assert not os.path.exists(session)
@@ -0,0 +1,39 @@
+import pytest
+
+from config import ALLOWED_MODELS
+from scripts.callbacks_analysis import analysis_fingerprint
+
+THEORETICAL = [{"props": {"contents": "data:;base64,MA=="}}]
+
+
+def key(model, receptor_concentration=10.0, n=2, kd_range=(1, 100)):
+    return analysis_fingerprint(model, n, [], THEORETICAL, kd_range, receptor_concentration, 50, "2")
+
+
+@pytest.mark.parametrize("model", ["kds_saxs_oligomer_fitting", "kds_saxs_cooperative_binding"])
+def test_receptor_concentration_is_part_of_the_key(model):
+    assert key(model, 10.0) != key(model, 20.0)
+
+
+@pytest.mark.parametrize("model", ["kds_saxs_mon_oligomer", "kds_saxs_sequential_oligomer"])
+def test_receptor_concentration_is_ignored_by_models_without_receptor(model):
+    assert key(model, 10.0) == key(model, 20.0)
+
+
+@pytest.mark.parametrize("model", ALLOWED_MODELS)
+def test_key_depends_on_model_inputs(model):
+    assert key(model) == key(model)
+    assert key(model) != key(model, n=3)
+    assert key(model) != key(model, kd_range=(1, 1000))
+
+
+def test_models_do_not_share_keys():
+    assert len({key(model) for model in ALLOWED_MODELS}) == len(ALLOWED_MODELS)
+
+
+def test_backend_is_part_of_the_key(monkeypatch):
+    import scripts.callbacks_analysis as callbacks_analysis
+
+    atsas = key("kds_saxs_mon_oligomer")
+    monkeypatch.setattr(callbacks_analysis, "FIT_BACKEND", "native")
+    assert key("kds_saxs_mon_oligomer") != atsas
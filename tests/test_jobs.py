@@ -0,0 +1,40 @@
+import sqlite3
+import time
+
+from scripts.jobs import JobRunner
+
+
+def insert(path, job_id, status, heartbeat, finished=None):
+    with sqlite3.connect(path) as db:
+        db.execute(
+            "INSERT INTO jobs (id, session_dir, status, host, pid, heartbeat, created, finished) "
+            "VALUES (?, '/tmp/session', ?, 'host', 1, ?, ?, ?)",
+            (job_id, status, heartbeat, heartbeat, finished),
+        )
+
+
+def job_ids(path):
+    with sqlite3.connect(path) as db:
+        return {row[0] for row in db.execute("SELECT id FROM jobs")}
+
+
+def test_table_has_cancellation_and_poll_columns(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    JobRunner(path=path)
+    with sqlite3.connect(path) as db:
+        columns = {row[1] for row in db.execute("PRAGMA table_info(jobs)")}
+    assert {"cancelled", "seen"} <= columns
+
+
+def test_prune_keeps_running_and_recent_jobs(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    runner = JobRunner(path=path, retention=60)
+    now = time.time()
+    insert(path, "old-done", "done", now - 120, finished=now - 120)
+    insert(path, "old-failed", "cancelled", now - 120, finished=now - 90)
+    insert(path, "recent-done", "done", now - 120, finished=now - 10)
+    insert(path, "running", "running", now)
+    insert(path, "interrupted-long-ago", "running", now - 120)
+
+    assert runner.prune() == 3
+    assert job_ids(path) == {"recent-done", "running"}
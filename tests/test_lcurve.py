@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from models.curve_analysis import LCurveAnalysis
+from plotting import create_chi_squared_plot
+from scripts.callbacks_analysis import completed_points
+
+
+def chi2_table(kds, concentrations=("10", "20", "40")):
+    """χ² curves with an L-shaped drop at Kd 10"""
+    return [
+        pd.DataFrame({
+            "kd": kds,
+            "concentration": concentration,
+            "chi2": 1 + 50 / (1 + (np.asarray(kds) / 10) ** 4) * (1 + 0.1 * i),
+        })
+        for i, concentration in enumerate(concentrations)
+    ]
+
+
+@pytest.mark.parametrize("points", [1, 2, 3])
+def test_too_few_kd_values_give_no_lcurve(points):
+    results = chi2_table(np.logspace(0, 2, points))
+    assert LCurveAnalysis.analyze_results(pd.concat(results), 10) is None
+
+
+def test_lcurve_of_a_full_grid():
+    summary = LCurveAnalysis.analyze_results(pd.concat(chi2_table(np.logspace(-1, 3, 40))), 10)
+    assert summary is not None
+    assert 1 < summary.average.optimal_kd < 100
+    assert set(summary.per_concentration) == {"10", "20", "40"}
+    assert len(summary.bootstrap_kds) == 10
+
+
+def test_partial_result_after_the_first_coarse_pass():
+    kds = np.logspace(0, 2, 9)
+    results = chi2_table(kds)
+    # Only every fourth Kd was fitted when the time budget expired
+    for result in results:
+        result.loc[result.index % 4 != 0, "chi2"] = np.nan
+    results, fitted_points, grid_points = completed_points(results)
+    assert (fitted_points, grid_points) == (3, 9)
+    chi_squared_values = pd.concat(results)
+    assert LCurveAnalysis.analyze_results(chi_squared_values, 10) is None
+
+    average = chi_squared_values.groupby("kd")["chi2"].mean()
+    assert average.idxmin() == pytest.approx(100)
+
+    colors = {"10": "red", "20": "green", "40": "blue"}
+    figure = create_chi_squared_plot(results, colors)
+    assert "at least 4 Kd values" in figure.layout.annotations[0].text
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from models.profile_fit import Q_UNIT_SCALE, ProfileFitter, StackFitter, operator_cache, project_basis, scale_offset_fit
+from scripts.preflight import check_stack
+from scripts.profile_stack import ProfileStack
+from scripts.saxs_parser import profile_cache
+
+
+@pytest.fixture
+def basis():
+    q = np.linspace(0, 0.5, 101)
+    return np.stack([np.column_stack([q, 100 * np.exp(-(q * r) ** 2 / 3)]) for r in (15, 25)])
+
+
+@pytest.mark.parametrize("q_units", ["1", "2"])
+def test_project_basis_interpolates_linearly(basis, q_units):
+    exp_q = np.linspace(0.0123, 6.0, 700) / Q_UNIT_SCALE[q_units] * 0.1
+    projected = project_basis(exp_q, basis, q_units)
+    q = exp_q * Q_UNIT_SCALE[q_units]
+    inside = q[(q >= 0) & (q <= 0.5)]
+
+    assert projected.shape[0] == 2
+    assert np.all(np.diff(projected[0, :, 0]) > 0)
+    # Framed by the theoretical points just outside the experimental range
+    assert projected[0, 0, 0] < inside[0] and projected[0, -1, 0] >= inside[-1]
+    for species in range(2):
+        expected = np.interp(projected[species, :, 0], basis[species, :, 0], basis[species, :, 1])
+        assert np.allclose(projected[species, :, 1], expected)
+
+
+def test_operator_is_cached_per_grid_pair(basis):
+    exp_q = np.linspace(0.01, 0.4, 300)
+    first = operator_cache.get(basis[0, :, 0], exp_q, "1")
+    assert operator_cache.get(basis[0, :, 0], exp_q.copy(), "1") is first
+    assert operator_cache.get(basis[0, :, 0], exp_q, "2") is not first
+
+
+def test_scale_offset_fit_recovers_a_mixture():
+    model = np.linspace(10, 1, 50)
+    sigma = np.full(50, 0.1)
+    chi_squared, scale, offset = scale_offset_fit(model[None, :], 3 * model + 2, sigma)
+    assert scale == pytest.approx([3])
+    assert offset == pytest.approx([2])
+    assert chi_squared == pytest.approx([0], abs=1e-12)
+
+
+def test_scale_offset_fit_keeps_the_scale_non_negative():
+    model = np.linspace(10, 1, 50)
+    intensity = 20 - model
+    _, scale, offset = scale_offset_fit(model[None, :], intensity, np.ones(50))
+    assert scale == [0]
+    assert offset == pytest.approx([intensity.mean()])
+
+
+def frame_text(q):
+    return "\n".join(f"{value:.6e} {100 * np.exp(-value):.6e} 0.1" for value in q)
+
+
+def test_series_frames_outside_the_basis_are_rejected(tmp_path):
+    grid = np.linspace(0.01, 1.0, 100)
+    stack = ProfileStack(str(tmp_path))
+    stack.build([
+        ("inside.dat", 1.0, frame_text(grid[:50])),
+        ("outside.dat", 2.0, frame_text(grid[60:])),
+    ])
+
+    assert list(stack.points_within(0, 0.5)) == [50, 0]
+    errors = check_stack(stack, "1", (0, 0.5))
+    assert len(errors) == 1 and "outside.dat (0)" in errors[0]
+    assert check_stack(stack, "1", (0, 1.0)) == []
+
+
+def test_scale_offset_fit_without_points_has_no_chi_squared():
+    with np.errstate(invalid="ignore", divide="ignore"):
+        chi_squared, _, _ = scale_offset_fit(np.ones((1, 5)), np.zeros(5), np.full(5, np.inf))
+    assert np.isnan(chi_squared[0])
+
+
+def test_stack_fits_match_single_profile_fits(basis, tmp_path, monkeypatch):
+    monkeypatch.setattr(profile_cache, "root", str(tmp_path / "cache"))
+    rng = np.random.default_rng(0)
+    grid = np.linspace(0.01, 0.6, 120)
+    fractions = np.array([[0.7, 0.3], [0.2, 0.8]])
+    frames = []
+    # The second frame covers only part of the grid, and of the basis range
+    for q, mixture in zip([grid, grid[30:90]], fractions):
+        model = np.interp(q, basis[0, :, 0], mixture @ basis[:, :, 1])
+        sigma = 0.05 + 0.01 * model
+        intensity = 2.5 * model + 0.4 + rng.normal(0, sigma)
+        frames.append(np.column_stack([q, intensity, sigma]))
+    stack = ProfileStack(str(tmp_path))
+    stack.build([
+        (f"frame_{i}.dat", i + 1.0, "\n".join(" ".join(f"{v:.8e}" for v in row) for row in frame))
+        for i, frame in enumerate(frames)
+    ])
+
+    # Every mixture fitted to both frames, as fit_stack does per Kd
+    per_frame = np.repeat(fractions[:, None, :], 2, axis=1)
+    stack_chi2, stack_scale, stack_offset = StackFitter(stack, basis, "1").fit(per_frame, slice(0, 2))
+    for i, frame in enumerate(frames):
+        path = tmp_path / f"frame_{i}.dat"
+        np.savetxt(path, frame)
+        fitter = ProfileFitter(str(path), basis, "1")
+        chi_squared, fitted = fitter.fit(fractions)
+        model = (fitter.projected @ fractions.T).T
+        for k in range(len(fractions)):
+            scale, offset = np.polyfit(model[k], fitted[k], 1)
+            assert stack_chi2[i, k] == pytest.approx(chi_squared[k], rel=1e-6)
+            assert stack_scale[i, k] == pytest.approx(scale, rel=1e-6)
+            assert stack_offset[i, k] == pytest.approx(offset, rel=1e-6, abs=1e-9)
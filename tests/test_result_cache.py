@@ -0,0 +1,42 @@
+import os
+import time
+
+from config import CACHE_STAGING_MAX_AGE
+from scripts.result_cache import ResultCache
+
+
+def entry(root, name, size, mtime):
+    path = root / name
+    path.mkdir()
+    (path / "chi2.pkl").write_bytes(b"x" * size)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_cache_directory_is_created_lazily(tmp_path):
+    cache = ResultCache(root=str(tmp_path / "results"))
+    assert cache.get("missing") is None
+    cache.evict()
+    assert not (tmp_path / "results").exists()
+
+
+def test_evict_removes_abandoned_staging_directories(tmp_path):
+    now = time.time()
+    abandoned = entry(tmp_path, ".staging_dead", 10, now - CACHE_STAGING_MAX_AGE - 1)
+    packing = entry(tmp_path, ".staging_live", 10, now)
+    kept = entry(tmp_path, "a" * 64, 10, now)
+
+    ResultCache(root=str(tmp_path)).evict()
+    assert not abandoned.exists()
+    assert packing.exists() and kept.exists()
+
+
+def test_evict_drops_expired_then_least_recently_used(tmp_path):
+    now = time.time()
+    expired = entry(tmp_path, "expired", 10, now - 100)
+    old = entry(tmp_path, "old", 100, now - 20)
+    new = entry(tmp_path, "new", 100, now - 10)
+
+    ResultCache(root=str(tmp_path), ttl=50, max_bytes=150).evict()
+    assert not expired.exists() and not old.exists()
+    assert new.exists()
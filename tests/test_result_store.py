@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pytest
+
+import scripts.workspace
+from scripts.result_store import ResultStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(scripts.workspace, "SCRATCH_ROOT", str(tmp_path / "shm"))
+    session_dir = tmp_path / "session"
+    session_dir.mkdir()
+    return ResultStore(str(session_dir))
+
+
+def fit(value):
+    return np.full((5, 4), float(value))
+
+
+def stored_fits(store):
+    directory = os.path.join(store.root, "fits")
+    return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+
+def test_fits_are_spooled_outside_the_results(store, tmp_path):
+    store.spool_fits(1.0, "key", {10.0: fit(1), 100.0: fit(2)})
+
+    assert store.spool.startswith(str(tmp_path / "shm"))
+    assert len(os.listdir(store.spool)) == 1
+    assert stored_fits(store) == []
+    assert store.has_fit(1.0, 10.0)
+
+
+def test_only_viewed_fits_are_stored(store):
+    store.spool_fits(1.0, "key", {10.0: fit(1), 100.0: fit(2)})
+
+    assert store.load_fit(1.0, 100.0, persist=False)["Ifit"].iloc[0] == 2
+    assert stored_fits(store) == []
+    assert store.load_fit(1.0, 10.0)["Ifit"].iloc[0] == 1
+    assert stored_fits(store) == ["fit_1_10.0.npy"]
+
+
+def test_newest_batch_wins_and_clear_drops_viewed_fits(store):
+    store.spool_fits(1.0, "key", {10.0: fit(1)})
+    os.utime(os.path.join(store.spool, os.listdir(store.spool)[0]), (0, 0))
+    store.spool_fits(1.0, "key", {10.0: fit(3)})
+    assert store.load_fit(1.0, 10.0)["Ifit"].iloc[0] == 3
+
+    store.clear()
+    assert stored_fits(store) == []
+    assert store.has_fit(1.0, 10.0)
+
+
+def test_fits_of_other_inputs_are_dropped(store):
+    store.spool_fits(1.0, "old", {10.0: fit(1)})
+    store.load_checkpoint(1.0, "new")
+    assert store.load_fit(1.0, 10.0) is None
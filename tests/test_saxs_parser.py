@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+import pytest
+
+from scripts.saxs_parser import ProfileCache, header_q_units, parse_profile
+
+
+def profile(header, q_max=0.3):
+    rows = "\n".join(f"{q:.5f} {100 / (1 + q):.5f} 0.1" for q in np.linspace(0.01, q_max, 50))
+    return "\n".join(header) + "\n" + rows + "\n"
+
+
+@pytest.mark.parametrize(
+    "header, units",
+    [
+        (["# q(nm^-1)  I(q)  err"], "2"),
+        (["s [1/nm]  I  sigma"], "2"),
+        (["q, I, err  (1/A)"], "1"),
+        (["# q [1/A] I(q) error"], "1"),
+        (["Angular units: 1/nm"], "2"),
+        (["Units: Å^-1"], "1"),
+        (["Sample description:", "range-from: 28"], None),
+        # Å of other quantities does not say anything about q
+        (["Wavelength 1.0 Angstrom", "Sample: lysozyme"], None),
+        (["Wavelength 1.0 Angstrom", "# q(nm-1) I(q) err"], "2"),
+        (["Detector distance 3000 mm, wavelength 1.54 Å", "s I err"], None),
+    ],
+)
+def test_header_q_units(header, units):
+    assert header_q_units(header) == units
+
+
+def test_nm_profile_with_wavelength_in_angstrom():
+    parsed = parse_profile(profile(["Wavelength 1.0 Angstrom", "q I err"], q_max=3.0))
+    assert parsed.q_units == "2"
+
+
+def test_q_range_decides_without_header():
+    assert parse_profile(profile([], q_max=0.5)).q_units == "1"
+    assert parse_profile(profile([], q_max=5.0)).q_units == "2"
+
+
+def test_profile_cache_creates_its_directory_lazily(tmp_path):
+    root = tmp_path / "profiles"
+    cache = ProfileCache(root=str(root))
+    assert not root.exists()
+    parsed = cache.load_content(profile(["# q(nm^-1) I(q) err"]).encode())
+    assert parsed.q_units == "2"
+    assert len(os.listdir(root)) == 1
+
+
+def test_profile_cache_evicts_least_recently_used(tmp_path):
+    cache = ProfileCache(root=str(tmp_path), max_bytes=0)
+    contents = [profile([f"# frame {i}"]).encode() for i in range(3)]
+    files = []
+    for i, content in enumerate(contents):
+        cache.load_content(content)
+        files.append(next(path for path in tmp_path.iterdir() if path not in files))
+        os.utime(files[-1], (i, i))
+    sizes = [path.stat().st_size for path in files]
+    cache.max_bytes = sum(sizes[1:])
+    stale = tmp_path / ".abandoned.npz.tmp"
+    stale.write_bytes(b"x")
+    os.utime(stale, (0, 0))
+
+    cache.evict()
+    assert sorted(tmp_path.iterdir()) == sorted(files[1:])
+    # Profiles still in memory are served without the disk copy
+    assert cache.load_content(contents[0]).data.shape == (50, 3)
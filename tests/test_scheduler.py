@@ -0,0 +1,49 @@
+import subprocess
+import sys
+import threading
+import time
+
+from scripts.scheduler import HOST, JobScheduler
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_waiting_job_takes_no_write_lock_until_its_turn(tmp_path):
+    scheduler = JobScheduler(path=str(tmp_path / "scheduler.db"), slots=1, poll=0.01, reap_interval=60)
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with scheduler.slot("a"):
+            held.set()
+            release.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    held.wait()
+
+    transactions = []
+    open_transaction = scheduler._transaction
+    scheduler._transaction = lambda: transactions.append(None) or open_transaction()
+    threading.Timer(0.5, release.set).start()
+    with scheduler.slot("b"):
+        pass
+    holder.join()
+
+    # Queue, claim and release, instead of one per 10 ms poll
+    assert len(transactions) <= 4
+
+
+def test_slot_of_a_dead_process_is_reaped_on_the_timer(tmp_path):
+    scheduler = JobScheduler(path=str(tmp_path / "scheduler.db"), slots=1, poll=0.01, reap_interval=0.2)
+    with scheduler._transaction() as db:
+        db.execute("INSERT INTO running VALUES (1, 'dead', ?, ?)", (HOST, dead_pid()))
+
+    started = time.monotonic()
+    with scheduler.slot("a"):
+        assert scheduler.status("a")["running"] == 1
+    assert time.monotonic() - started < 2
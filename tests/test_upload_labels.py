@@ -0,0 +1,40 @@
+import base64
+
+import pytest
+
+from scripts.callbacks_upload import inline_upload_size
+from scripts.preflight import check_theoretical
+from scripts.utils import theoretical_upload_labels
+
+
+@pytest.mark.parametrize(
+    "model, n, labels",
+    [
+        ("kds_saxs_mon_oligomer", 2, ["Monomeric", "Oligomeric"]),
+        ("kds_saxs_mon_oligomer", None, ["Monomeric", "Oligomeric"]),
+        ("kds_saxs_oligomer_fitting", 2, ["Free Receptor", "Receptor-Ligand_1", "Receptor-Ligand_2", "Free Ligand"]),
+        ("kds_saxs_cooperative_binding", 1, ["Free Receptor", "Receptor-Ligand_1", "Free Ligand"]),
+        ("kds_saxs_sequential_oligomer", 3, ["Monomer", "2-mer", "3-mer"]),
+        ("kds_saxs_oligomer_fitting", None, []),
+        ("unknown", 2, []),
+    ],
+)
+def test_theoretical_upload_labels(model, n, labels):
+    assert theoretical_upload_labels(model, n) == labels
+
+
+@pytest.mark.parametrize(
+    "model", ["kds_saxs_oligomer_fitting", "kds_saxs_cooperative_binding", "kds_saxs_sequential_oligomer"]
+)
+def test_preflight_reports_every_missing_species(model):
+    errors, q_range = check_theoretical(model, 2, [])
+    assert q_range is None
+    for label in theoretical_upload_labels(model, 2):
+        assert label in errors[0]
+
+
+def test_inline_upload_size():
+    contents = "data:application/octet-stream;base64," + base64.b64encode(b"ATOM" * 10).decode()
+    assert inline_upload_size(contents) == 40
+    assert inline_upload_size("stored:" + "0" * 64) == 0
+    assert inline_upload_size(None) == 0
@@ -0,0 +1,109 @@
+import gzip
+import hashlib
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+from flask import Flask
+
+import scripts.upload_store as upload_store
+from config import MAX_PDB_SIZE
+from scripts.routes import register_routes
+from scripts.upload_store import UploadStore, expire_partial_uploads
+from scripts.utils import STORED_UPLOAD, gunzip
+
+
+def test_gunzip_reads_every_member():
+    data = gzip.compress(b"ATOM 1\n") + gzip.compress(b"ATOM 2\n")
+    assert gunzip(data) == b"ATOM 1\nATOM 2\n"
+
+
+def test_gunzip_stops_at_the_limit():
+    with pytest.raises(ValueError, match="once decompressed"):
+        gunzip(gzip.compress(b"\0" * 10_000), limit=1000)
+
+
+def test_gunzip_rejects_truncated_files():
+    with pytest.raises(ValueError):
+        gunzip(gzip.compress(b"ATOM 1\n" * 100)[:-12])
+
+
+def test_abandoned_uploads_expire(tmp_path):
+    store = UploadStore(str(tmp_path))
+    abandoned = store.begin("a.pdb", 10, 100)
+    store.append(abandoned, 0, io.BytesIO(b"ATOM"))
+    active = store.begin("b.pdb", 10, 100)
+    for path in (store._partial(abandoned), store._partial(abandoned) + ".json"):
+        os.utime(path, (0, 0))
+
+    assert expire_partial_uploads(str(tmp_path), max_age=60) == 1
+    assert sorted(os.listdir(store.partial_root)) == sorted([active, active + ".json"])
+
+
+def test_hashes_of_unfinished_uploads_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_store, "UPLOAD_HASHES_SIZE", 2)
+    monkeypatch.setattr(upload_store, "_hashes", upload_store.OrderedDict())
+    store = UploadStore(str(tmp_path))
+    for _ in range(5):
+        store.append(store.begin("a.pdb", 10, 100), 0, io.BytesIO(b"ATOM"))
+    assert len(upload_store._hashes) == 2
+
+
+@pytest.fixture
+def client(tmp_path):
+    server = Flask(__name__)
+    server.secret_key = "test"
+    register_routes(server)
+    client = server.test_client()
+    with client.session_transaction() as session:
+        session["session_dir"] = str(tmp_path)
+    return client
+
+
+def begin(client, size):
+    response = client.post("/uploads/chunked", json={"filename": "model.pdb", "size": size})
+    assert response.status_code == 200
+    return response.get_json()["id"]
+
+
+def patch(client, upload_id, offset, data):
+    return client.patch(f"/uploads/chunked/{upload_id}", data=data, headers={"Upload-Offset": str(offset)})
+
+
+def test_part_at_the_wrong_offset_is_refused_with_the_current_one(client):
+    upload_id = begin(client, 8)
+    assert patch(client, upload_id, 0, b"ATOM").get_json() == {"offset": 4}
+
+    response = patch(client, upload_id, 2, b"TOM ")
+    assert response.status_code == 409
+    assert response.get_json() == {"offset": 4}
+    assert client.get(f"/uploads/chunked/{upload_id}").get_json()["offset"] == 4
+
+
+def test_upload_resumed_from_another_process_is_hashed_from_the_disk(client, tmp_path):
+    content = b"ATOM 1\nATOM 2\n"
+    upload_id = begin(client, len(content))
+    # The first part reaches another worker, whose running hash this one never sees
+    subprocess.run(
+        [sys.executable, "-c",
+         "import io, sys; from scripts.upload_store import UploadStore; "
+         "UploadStore(sys.argv[1]).append(sys.argv[2], 0, io.BytesIO(sys.argv[3].encode()))",
+         str(tmp_path), upload_id, content[:7].decode()],
+        check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    assert upload_id not in upload_store._hashes
+
+    response = patch(client, upload_id, 7, content[7:])
+    assert response.get_json()["contents"] == STORED_UPLOAD + hashlib.sha256(content).hexdigest()
+
+
+def test_oversize_uploads_and_parts_are_rejected(client):
+    response = client.post("/uploads/chunked", json={"filename": "model.pdb", "size": MAX_PDB_SIZE + 1})
+    assert response.status_code == 400
+
+    upload_id = begin(client, 4)
+    response = patch(client, upload_id, 0, b"ATOM 1")
+    assert response.status_code == 400
+    assert "larger than announced" in response.get_json()["error"]
@@ -0,0 +1,14 @@
+from scripts.worker_pool import TaskBroker
+
+
+def test_status_reports_queue_position_between_sessions():
+    broker = TaskBroker()
+    broker.submit("a", [{}, {}])
+    broker.submit("b", [{}])
+    task_id, _ = broker.next_task("worker", 0)
+
+    assert broker.status("a") == {"running": 1, "position": 2, "waiting": 2, "slots": 1}
+    assert broker.status("b")["position"] == 1
+    broker.complete(task_id, {})
+    assert broker.status("a")["running"] == 0
+    assert broker.status("c")["position"] is None
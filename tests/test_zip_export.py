@@ -0,0 +1,53 @@
+import io
+import zipfile
+
+import pandas as pd
+
+import scripts.zip_export as zip_export
+from scripts.zip_export import analysis_members, stream_zip
+
+
+class Store:
+    """Results of a two-concentration Monomer-Oligomer analysis"""
+
+    def chi2_table(self):
+        return pd.DataFrame({"kd": [1.0, 10.0], "chi2": [2.0, 1.0]})
+
+    def load_lcurve(self):
+        return {"kd": [1.0, 10.0]}
+
+    def load_fit(self, concentration, kd, n=None):
+        return pd.DataFrame({"s": [0.1, 0.2], "Iexp": [3.0, 2.0], "sigma": [0.1, 0.1], "Ifit": [2.9, 2.1]})
+
+
+METADATA = {
+    "model": "kds_saxs_mon_oligomer",
+    "n": 2,
+    "concentration_range": [1, 100, 5],
+    "experimental_concentrations": ["1", "10"],
+}
+
+
+def test_archive_streams_every_member_without_buffering(monkeypatch):
+    sinks = []
+
+    class Sink(zip_export._ChunkSink):
+        def __init__(self):
+            super().__init__()
+            sinks.append(self)
+
+    monkeypatch.setattr(zip_export, "_ChunkSink", Sink)
+    members = list(analysis_members(Store(), METADATA, 10.0))
+    chunks = []
+    for chunk in stream_zip(iter(members)):
+        # Every chunk leaves the sink as soon as it is handed out
+        assert sinks[0]._chunks == []
+        chunks.append(chunk)
+
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == [name for name, _ in members]
+        for name, content in members:
+            expected = content.encode("utf8") if isinstance(content, str) else content
+            assert archive.read(name) == expected
+    assert "fits/saxs_fit_2_10_kd_10.0.csv" in archive.namelist()
@@ -1,9 +1,8 @@
-from app import app
+from app import create_app
 
+# Services start in each worker after the fork, from gunicorn.conf.py
+app = create_app(start=False)
 server = app.server
 
-# Add Gunicorn configurations
-timeout = 300  # 5 minutes
-
 if __name__ == "__main__":
     app.run_server(debug=False)